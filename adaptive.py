@@ -0,0 +1,96 @@
+import os
+import psutil
+
+
+class BurstScheduler:
+    """
+    Decide when the daemon runs a full collection, from cheap probes.
+
+    Every `probe_interval` seconds the aggregate CPU usage (from the
+    cumulative CPU times, so psutil.cpu_percent's baseline is left alone) and
+    the 1 min load average are read. A full collection runs every
+    `base_interval` seconds, or immediately when either has moved by more than
+    `cpu_delta` points / `load_delta` since the last full collection. After a
+    trigger, full collections run every `burst_interval` seconds, and the
+    interval is multiplied by `decay` after each collection that saw no
+    further change, until it is back at `base_interval`.
+    """
+
+    def __init__(self, base_interval: float, burst_interval: float = 10, probe_interval: float = 5,
+                 cpu_delta: float = 20.0, load_delta: float = None, decay: float = 2.0):
+        if not burst_interval <= base_interval:
+            raise ValueError("The burst interval must not be longer than the base interval.")
+        if decay <= 1:
+            raise ValueError("The decay factor must be greater than 1.")
+        self.BASE_INTERVAL = base_interval
+        self.BURST_INTERVAL = burst_interval
+        self.PROBE_INTERVAL = min(probe_interval, base_interval)
+        self.CPU_DELTA = cpu_delta
+        # By default, a quarter of the cores becoming busy or idle
+        self.LOAD_DELTA = load_delta if load_delta is not None else max(1.0, (os.cpu_count() or 1) / 4)
+        self.DECAY = decay
+        self.interval = base_interval
+        self.next_collection = None
+        self.last_collection = None
+        self._previous_times = None
+        self._probe = None
+        self._reference = None
+        self._triggered = False
+
+    def probe(self):
+        """(CPU usage % since the previous probe, 1 min load average)."""
+        times = psutil.cpu_times()
+        total = sum(times)
+        idle = times.idle + getattr(times, "iowait", 0.0)
+        cpu_usage = None
+        if self._previous_times is not None:
+            total_delta = total - self._previous_times[0]
+            if total_delta > 0:
+                cpu_usage = 100.0 * (1 - (idle - self._previous_times[1]) / total_delta)
+        self._previous_times = (total, idle)
+        return cpu_usage, os.getloadavg()[0]
+
+    def _changed(self, values) -> bool:
+        if self._reference is None:
+            return False
+        changed = False
+        for i, (value, delta) in enumerate(zip(values, (self.CPU_DELTA, self.LOAD_DELTA))):
+            if value is None:
+                continue
+            if self._reference[i] is None:
+                # The first CPU probe has no usage yet, so the next one becomes the reference
+                self._reference[i] = value
+            elif abs(value - self._reference[i]) > delta:
+                changed = True
+        return changed
+
+    def due(self, now: float) -> bool:
+        """Probe, and return whether a full collection should run at `now` (a monotonic time)."""
+        self._probe = self.probe()
+        if self.next_collection is None:
+            return True
+        if self._changed(self._probe):
+            self._triggered = True
+            self.interval = self.BURST_INTERVAL
+        return now >= self._next_due()
+
+    def _next_due(self) -> float:
+        # After a trigger, collect right away unless the last collection was moments ago
+        if self._triggered:
+            return min(self.next_collection, self.last_collection + self.BURST_INTERVAL)
+        return self.next_collection
+
+    def collected(self, now: float) -> float:
+        """Record a full collection at `now` and return the interval its samples stand for."""
+        effective = now - self.last_collection if self.last_collection is not None else self.interval
+        if not self._triggered:
+            self.interval = min(self.interval * self.DECAY, self.BASE_INTERVAL)
+        self._triggered = False
+        self._reference = list(self._probe)
+        self.last_collection = now
+        self.next_collection = now + self.interval
+        return effective
+
+    def next_wakeup(self, now: float) -> float:
+        """Seconds until the next probe or collection."""
+        return max(0.0, min(self.PROBE_INTERVAL, self._next_due() - now))
@@ -0,0 +1,72 @@
+import numpy as np
+
+QUANTILES = (5, 25, 50, 75, 95)
+
+
+def group_quantiles(group: np.ndarray, values: np.ndarray, n_groups: int, quantiles: tuple = QUANTILES,
+                    weights: np.ndarray = None):
+    """
+    Percentiles (linear interpolation, like np.percentile) and counts of `values`
+    for each integer group id in [0, n_groups), computed with one sort.
+    With `weights`, each value counts in proportion to its weight and the
+    percentiles are the smallest values whose cumulative weight reaches q%
+    (like np.percentile's weighted "inverted_cdf" method).
+
+    Returns (array of shape (len(quantiles), n_groups), counts). Empty groups are NaN.
+    """
+    group = np.asarray(group, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=np.float64)
+        valid &= weights > 0
+        weights = weights[valid]
+    group, values = group[valid], values[valid]
+
+    order = np.lexsort((values, group))
+    values = values[order]
+    counts = np.bincount(group, minlength=n_groups)
+    starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+
+    result = np.full((len(quantiles), n_groups), np.nan)
+    nonempty = counts > 0
+    if len(values) == 0:
+        return result, counts
+    if weights is not None:
+        cumulative = np.cumsum(weights[order])
+        ends = starts[nonempty] + counts[nonempty] - 1
+        before = np.where(starts[nonempty] > 0, cumulative[starts[nonempty] - 1], 0.0)
+        for i, q in enumerate(quantiles):
+            target = before + (cumulative[ends] - before) * q / 100
+            index = np.clip(np.searchsorted(cumulative, target, side="left"), starts[nonempty], ends)
+            result[i, nonempty] = values[index]
+        return result, counts
+    for i, q in enumerate(quantiles):
+        position = starts[nonempty] + (counts[nonempty] - 1) * q / 100
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        result[i, nonempty] = values[low] + (values[high] - values[low]) * (position - low)
+    return result, counts
+
+
+def minmax_decimate(x: np.ndarray, y: np.ndarray, n_bins: int) -> np.ndarray:
+    """
+    Indices of the points to draw for a line over `n_bins` pixel columns: the
+    minimum and maximum of each column, in x order. Peaks survive and the cost
+    of drawing depends on n_bins, not on the number of points. `x` must be sorted.
+    """
+    x = np.asarray(x, dtype=np.int64)
+    y = np.asarray(y, dtype=np.float64)
+    finite = np.flatnonzero(~np.isnan(y))
+    if len(finite) <= 2 * n_bins:
+        return finite
+    x, y = x[finite], y[finite]
+
+    # In float64: (x - x[0]) * n_bins overflows int64 nanoseconds for windows of a few months
+    bins = np.minimum(((x - x[0]) / (x[-1] - x[0] + 1) * n_bins).astype(np.int64), n_bins - 1)
+    order = np.lexsort((y, bins))
+    sorted_bins = bins[order]
+    boundary = sorted_bins[1:] != sorted_bins[:-1]
+    first = np.concatenate([[True], boundary])
+    last = np.concatenate([boundary, [True]])
+    return finite[np.unique(np.concatenate([order[first], order[last]]))]
@@ -0,0 +1,278 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import json
+import operator
+import os
+import time
+import traceback
+
+from storage import TIMESTAMP_FORMAT, TIMEZONE, FileLock
+
+OPERATORS = {
+    ">": operator.gt, ">=": operator.ge, "<": operator.lt,
+    "<=": operator.le, "==": operator.eq, "!=": operator.ne,
+}
+# Hosts listed by name in one grouped message
+MAX_LISTED_KEYS = 10
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+@dataclass
+class AlertRule:
+    """
+    `column op threshold` held for `duration` seconds (and every `where`
+    [column, op, value] condition held too), tracked separately per `key_columns`.
+
+    threshold may be "cpu_count", the number of CPUs of the row's host: taken
+    from `cpu_counts` (hostname -> CPUs), or os.cpu_count() for rows of the
+    evaluating host. Rows of other hosts (e.g. on a collector) are skipped
+    unless their host is listed in `cpu_counts`.
+    With clear_threshold the alert resolves only once the condition is false at
+    that threshold (hysteresis), e.g. fire above 90% and resolve below 80%.
+    """
+    name: str
+    column: str
+    op: str
+    threshold: object
+    duration: float = 0.0
+    clear_threshold: float = None
+    where: list = field(default_factory=list)
+    key_columns: list = field(default_factory=lambda: ["Hostname"])
+    cpu_counts: dict = field(default_factory=dict)
+
+    def columns(self) -> list:
+        return [self.column] + [column for column, _, _ in self.where]
+
+    def get_threshold(self, clear: bool = False, hostname: str = None) -> float:
+        """The threshold for rows of `hostname` (default: this host), or None if it is unknown."""
+        if clear and self.clear_threshold is not None:
+            return self.clear_threshold
+        if self.threshold == "cpu_count":
+            if hostname in self.cpu_counts:
+                return float(self.cpu_counts[hostname])
+            if hostname is None or hostname == os.uname()[1]:
+                return float(os.cpu_count())
+            return None
+        return float(self.threshold)
+
+    def check(self, row: dict, clear: bool = False):
+        """Whether the condition holds for a row, or None if a value or the threshold is missing."""
+        value = _to_float(row.get(self.column))
+        threshold = self.get_threshold(clear, row.get("Hostname"))
+        if value is None or threshold is None:
+            return None
+        holds = OPERATORS[self.op](value, threshold)
+        for column, op, threshold in self.where:
+            where_value = _to_float(row.get(column))
+            if where_value is None:
+                return None
+            holds = holds and OPERATORS[op](where_value, float(threshold))
+        return holds
+
+    def describe(self) -> str:
+        description = f"{self.column} {self.op} {self.threshold}"
+        if self.duration:
+            description += f" for {self.duration / 60:g} min"
+        for column, op, threshold in self.where:
+            description += f" while {column} {op} {threshold}"
+        return description
+
+
+DEFAULT_RULES = [
+    AlertRule("CPU high", "CPU Usage(%)", ">", 90, duration=600, clear_threshold=80),
+    AlertRule("Load above core count", "Load Average(5m)", ">", "cpu_count", duration=600),
+    AlertRule(
+        "GPU idle with memory allocated", "GPU Util(%)", "==", 0, duration=7200,
+        where=[["Mem Usage(MB)", ">", 0]], key_columns=["Hostname", "GPU Index"]
+    ),
+]
+
+
+def load_rules(path: str) -> list:
+    """Read rules from a JSON list of AlertRule fields (durations in seconds)."""
+    with open(path, mode="r") as file:
+        return [AlertRule(**rule) for rule in json.load(file)]
+
+
+class AlertEngine:
+    """
+    Evaluate alert rules on each sample as the monitors produce it.
+
+    Per (rule, key) only the start of the current violation, the firing flag and
+    the last sample time are kept, so a sample costs O(rules) regardless of the
+    window length. The state is saved to `state_path` after every batch, so
+    windows survive restarts and one-shot (cron) runs. Each batch reloads,
+    updates and saves it under a FileLock, so concurrent runs (e.g. the cpu and
+    gpu cron jobs) don't overwrite each other's windows. A gap longer than
+    `max_gap` seconds between samples restarts the window.
+
+    Alerts fired or resolved within `group_wait` seconds of each other are sent
+    as one message per rule listing the affected hosts; close() sends the ones
+    still waiting.
+    """
+
+    def __init__(self, rules: list = None, state_path: str = "alert_state.json", notify=None,
+                 group_wait: float = 0.0, max_gap: float = 3600.0):
+        self.RULES = DEFAULT_RULES if rules is None else rules
+        self.STATE_PATH = state_path
+        self.GROUP_WAIT = group_wait
+        self.MAX_GAP = max_gap
+        self._notify = notify
+        self._notificator = None
+        self.TZ = ZoneInfo(TIMEZONE)
+        self._state_lock = FileLock(state_path) if state_path else None
+        # Identity of the state file as last loaded or saved here, to skip reloading it unchanged
+        self._state_stat = None
+        self.STATE = self.load_state()
+
+    def load_state(self) -> dict:
+        if self.STATE_PATH and os.path.exists(self.STATE_PATH):
+            try:
+                with open(self.STATE_PATH, mode="r") as file:
+                    state = json.load(file)
+                    self._state_stat = self._stat(file.fileno())
+                    return state
+            except ValueError:
+                traceback.print_exc()
+        return {"rules": {}, "pending": []}
+
+    def save_state(self):
+        if not self.STATE_PATH:
+            return
+        tmp_path = f"{self.STATE_PATH}.tmp.{os.getpid()}"
+        with open(tmp_path, mode="w") as file:
+            json.dump(self.STATE, file)
+            file.flush()
+            self._state_stat = self._stat(file.fileno())
+        os.replace(tmp_path, self.STATE_PATH)
+
+    @staticmethod
+    def _stat(file) -> tuple:
+        # Every save replaces the file, so the inode changes even within the mtime granularity
+        stat = os.stat(file)
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    @contextmanager
+    def _locked_state(self):
+        """Hold the state file's lock, with the state as another process may have saved it."""
+        if self._state_lock is None:
+            yield
+            return
+        with self._state_lock:
+            try:
+                changed = self._stat(self.STATE_PATH) != self._state_stat
+            except FileNotFoundError:
+                changed = self._state_stat is not None
+            if changed:
+                self.STATE = self.load_state()
+            yield
+
+    def notify(self, message: str):
+        if self._notify is None:
+            from slack import SlackNotificator
+            self._notificator = SlackNotificator()
+            self._notify = self._notificator.post_message
+        self._notify(message)
+
+    def close(self):
+        """Send the events still waiting for group_wait, and wait for queued Slack messages to be delivered."""
+        try:
+            with self._locked_state():
+                if self.STATE["pending"]:
+                    self.dispatch(force=True)
+                    self.save_state()
+        except Exception:
+            traceback.print_exc()
+        if self._notificator is not None:
+            self._notificator.close()
+        if self._state_lock is not None:
+            self._state_lock.close()
+
+    def evaluate(self, columns: list, rows: list) -> list:
+        """Update rule states with a batch of rows and return the new events."""
+        rules = [rule for rule in self.RULES if all(column in columns for column in rule.columns())]
+        if not rules:
+            return []
+        with self._locked_state():
+            return self._evaluate(rules, columns, rows)
+
+    def _evaluate(self, rules: list, columns: list, rows: list) -> list:
+        events = []
+        for values in rows:
+            row = dict(zip(columns, values))
+            try:
+                # In the storage timezone, whatever the evaluating machine's local one
+                sample_time = datetime.strptime(str(row["Timestamp"]), TIMESTAMP_FORMAT).replace(tzinfo=self.TZ).timestamp()
+            except ValueError:
+                continue
+            for rule in rules:
+                key = " ".join(str(row.get(column)) for column in rule.key_columns)
+                event = self._update(rule, key, row, sample_time)
+                if event is not None:
+                    events.append(event)
+
+        self.STATE["pending"].extend(events)
+        self.dispatch()
+        self.save_state()
+        return events
+
+    def _update(self, rule: AlertRule, key: str, row: dict, sample_time: float):
+        states = self.STATE["rules"].setdefault(rule.name, {})
+        state = states.setdefault(key, {"since": None, "firing": False, "last": None})
+        holds = rule.check(row, clear=state["firing"])
+        if holds is None:
+            return None
+        if state["last"] is not None and sample_time - state["last"] > self.MAX_GAP:
+            state["since"] = None
+        state["last"] = sample_time
+
+        if not holds:
+            state["since"] = None
+            if state["firing"]:
+                state["firing"] = False
+                return {"rule": rule.name, "key": key, "status": "resolved", "time": time.time()}
+            return None
+        if state["since"] is None:
+            state["since"] = sample_time
+        if not state["firing"] and sample_time - state["since"] >= rule.duration:
+            state["firing"] = True
+            return {
+                "rule": rule.name, "key": key, "status": "firing", "time": time.time(),
+                "value": _to_float(row.get(rule.column)),
+            }
+        return None
+
+    def format_message(self, rule_name: str, status: str, events: list) -> str:
+        rule = next((rule for rule in self.RULES if rule.name == rule_name), None)
+        keys = [event["key"] for event in events]
+        listed = ", ".join(keys[:MAX_LISTED_KEYS])
+        if len(keys) > MAX_LISTED_KEYS:
+            listed += f" (+{len(keys) - MAX_LISTED_KEYS} more)"
+        prefix = ":rotating_light: [ALERT]" if status == "firing" else ":white_check_mark: [RESOLVED]"
+        description = f" ({rule.describe()})" if rule is not None else ""
+        return f"{prefix} {rule_name}{description} on {len(keys)} host(s): {listed}"
+
+    def dispatch(self, force: bool = False):
+        """Send pending events grouped by rule once the oldest is `group_wait` seconds old."""
+        pending = self.STATE["pending"]
+        if not pending or (not force and time.time() - pending[0]["time"] < self.GROUP_WAIT):
+            return
+        groups = {}
+        for event in pending:
+            groups.setdefault((event["rule"], event["status"]), []).append(event)
+        for (rule_name, status), events in groups.items():
+            try:
+                self.notify(self.format_message(rule_name, status, events))
+            except Exception:
+                # Kept pending and retried on the next dispatch
+                traceback.print_exc()
+                return
+            pending[:] = [event for event in pending if event not in events]
@@ -0,0 +1,134 @@
+import argparse
+import os
+from datetime import datetime
+import numpy as np
+import pandas as pd
+import pytz
+
+from monitor import CPUMonitor, GPUMonitor
+from storage import TIMESTAMP_FORMAT
+
+USERS = ["alice", "bob", "carol", "dave", "eve", "frank", "grace", "heidi", "ivan", "judy"]
+GPU_NAME = "NVIDIA A100-SXM4-80GB"
+GPU_MEMORY_MB = 81920
+GPU_POWER_CAP_W = 400.0
+HOST_CORES = 64
+HOST_MEMORY_MB = 257580
+
+
+def load_profile(timestamps: pd.DatetimeIndex) -> np.ndarray:
+    """Expected load in [0, 1]: peaks mid-afternoon, lowest before dawn, lighter on weekends."""
+    hours = timestamps.hour.to_numpy() + timestamps.minute.to_numpy() / 60
+    diurnal = 0.5 - 0.5 * np.cos(2 * np.pi * (hours - 4) / 24)
+    weekly = np.where(timestamps.dayofweek.to_numpy() >= 5, 0.4, 1.0)
+    return diurnal * weekly
+
+
+def _sample_times(days: float, interval: float, end: datetime = None) -> pd.DatetimeIndex:
+    if end is None:
+        end = datetime.now(pytz.timezone("Asia/Tokyo")).replace(tzinfo=None)
+    return pd.date_range(end=end, periods=int(days * 86400 // interval), freq=pd.Timedelta(seconds=interval)).floor("s")
+
+
+def cpu_usage_frame(timestamps: pd.DatetimeIndex, n_hosts: int, rng: np.random.Generator) -> pd.DataFrame:
+    n_times = len(timestamps)
+    load = np.tile(load_profile(timestamps), n_hosts)
+    # Hosts differ in how busy they are
+    host_scale = np.repeat(rng.uniform(0.3, 1.0, n_hosts), n_times)
+    cpu_usage = np.clip(100 * load * host_scale + rng.normal(0, 8, n_times * n_hosts), 0, 100)
+    load1m = cpu_usage / 100 * HOST_CORES * rng.uniform(0.8, 1.2, len(cpu_usage))
+    used_memory = HOST_MEMORY_MB * np.clip(0.1 + 0.6 * cpu_usage / 100 + rng.normal(0, 0.05, len(cpu_usage)), 0, 1)
+    users = rng.choice(USERS, size=(len(cpu_usage), 3))
+    shares = np.sort(rng.dirichlet([1, 1, 1, 1], len(cpu_usage))[:, :3], axis=1)[:, ::-1] * cpu_usage[:, None] * HOST_CORES
+    return pd.DataFrame({
+        "Timestamp": np.tile(timestamps.strftime(TIMESTAMP_FORMAT), n_hosts),
+        "Hostname": np.repeat([f"host{i:03d}" for i in range(n_hosts)], n_times),
+        "CPU Usage(%)": cpu_usage.round(1),
+        "Load Average(1m)": load1m.round(2),
+        "Load Average(5m)": (load1m * 0.95).round(2),
+        "Load Average(15m)": (load1m * 0.9).round(2),
+        "Total Memory(MB)": HOST_MEMORY_MB,
+        "Used Memory(MB)": used_memory.round(1),
+        "Free Memory(MB)": (HOST_MEMORY_MB - used_memory).round(1),
+        "Top User": users[:, 0], "Top CPU Usage(%)": shares[:, 0].round(1),
+        "Second User": users[:, 1], "Second CPU Usage(%)": shares[:, 1].round(1),
+        "Third User": users[:, 2], "Third CPU Usage(%)": shares[:, 2].round(1),
+    }, columns=CPUMonitor().COLUMNS)
+
+
+def gpu_usage_frame(timestamps: pd.DatetimeIndex, n_hosts: int, gpus_per_host: int,
+                    rng: np.random.Generator, job_hours: float = 6) -> pd.DataFrame:
+    n_times, n_gpus = len(timestamps), n_hosts * gpus_per_host
+    load = np.tile(load_profile(timestamps), n_gpus)
+    # A GPU is allocated to a job for blocks of job_hours, more likely when the fleet is busy
+    block = ((timestamps - timestamps[0]) // pd.Timedelta(hours=job_hours)).to_numpy()
+    allocated = rng.random((n_gpus, block.max() + 1))[:, block].ravel() < 0.2 + 0.7 * load
+    utilization = np.where(allocated, np.clip(rng.normal(85, 15, n_times * n_gpus), 0, 100), 0.0)
+    memory_used = np.where(allocated, GPU_MEMORY_MB * rng.uniform(0.3, 0.95, n_times * n_gpus), 4.0)
+    power = 60 + (GPU_POWER_CAP_W - 60) * utilization / 100
+    return pd.DataFrame({
+        "Timestamp": np.tile(timestamps.strftime(TIMESTAMP_FORMAT), n_gpus),
+        "Hostname": np.repeat([f"host{i:03d}" for i in range(n_hosts)], n_times * gpus_per_host),
+        "GPU Index": np.tile(np.repeat(np.arange(gpus_per_host), n_times), n_hosts),
+        "Name": GPU_NAME,
+        "Temp(C)": (30 + 0.5 * utilization + rng.normal(0, 2, len(utilization))).round(0),
+        "Power Usage(W)": power.round(2),
+        "Power Cap(W)": GPU_POWER_CAP_W,
+        "Mem Usage(MB)": memory_used.round(0),
+        "Mem Total(MB)": GPU_MEMORY_MB,
+        "GPU Util(%)": utilization.round(0),
+    }, columns=GPUMonitor().COLUMNS)
+
+
+def write_with_malformed_rows(df: pd.DataFrame, path: str, malformed_rate: float, rng: np.random.Generator) -> int:
+    """
+    Write df sorted by time the way the monitors append it, with a
+    malformed_rate fraction of the lines cut short (torn writes) or with a
+    missing value. Returns the number of malformed lines.
+    """
+    df = df.sort_values("Timestamp", kind="stable")
+    lines = df.to_csv(index=False, lineterminator="\n").split("\n")
+    malformed = np.flatnonzero(rng.random(len(df)) < malformed_rate) + 1
+    for i in malformed:
+        line = lines[i]
+        if rng.random() < 0.5:
+            lines[i] = line[:rng.integers(1, len(line))]
+        else:
+            fields = line.split(",")
+            fields[rng.integers(2, len(fields))] = ""
+            lines[i] = ",".join(fields)
+    with open(path, mode="w", newline="") as file:
+        file.write("\n".join(lines))
+    return len(malformed)
+
+
+def generate_fleet(out_dir: str, n_hosts: int = 10, gpus_per_host: int = 4, interval: float = 1800,
+                   days: float = 90, malformed_rate: float = 0.001, seed: int = 0, end: datetime = None) -> dict:
+    """
+    Write cpu_usage.csv and gpu_usage.csv for a synthetic fleet into out_dir,
+    with samples every `interval` seconds for `days` days up to `end` (now, JST).
+    Returns the number of rows written per file.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    timestamps = _sample_times(days, interval, end)
+    cpu_df = cpu_usage_frame(timestamps, n_hosts, rng)
+    gpu_df = gpu_usage_frame(timestamps, n_hosts, gpus_per_host, rng)
+    cpu_df["Interval(s)"] = gpu_df["Interval(s)"] = float(interval)
+    write_with_malformed_rows(cpu_df, os.path.join(out_dir, "cpu_usage.csv"), malformed_rate, rng)
+    write_with_malformed_rows(gpu_df, os.path.join(out_dir, "gpu_usage.csv"), malformed_rate, rng)
+    return {"cpu_usage.csv": len(cpu_df), "gpu_usage.csv": len(gpu_df)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic cpu_usage.csv/gpu_usage.csv for a fleet.")
+    parser.add_argument("out_dir", type=str)
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--gpus_per_host", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=1800, help="Sampling interval in seconds.")
+    parser.add_argument("--days", type=float, default=90, help="Days of history.")
+    parser.add_argument("--malformed_rate", type=float, default=0.001)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate_fleet(args.out_dir, args.hosts, args.gpus_per_host, args.interval, args.days,
+                         args.malformed_rate, args.seed))
@@ -0,0 +1,194 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+import psutil
+import pytz
+
+from benchmarks.fleet import generate_fleet
+from clean_usage import clean_csv
+from monitor import CPUMonitor
+from report import ResourceReport
+
+
+class StageRecorder:
+    """
+    Record wall time, peak RSS and rows/s of benchmark stages.
+
+    RSS is sampled on a background thread every `sample_interval` seconds
+    while a stage runs, so the peak includes short-lived allocations.
+    """
+
+    def __init__(self, sample_interval: float = 0.005):
+        self.SAMPLE_INTERVAL = sample_interval
+        self.STAGES = []
+        self._process = psutil.Process()
+
+    def run(self, name: str, func, *args, rows: int = None, **kwargs):
+        """Run func(*args, **kwargs) as a stage. rows may also be a function of the result."""
+        start_rss = self._process.memory_info().rss
+        peak_rss = [start_rss]
+        done = threading.Event()
+
+        def sample():
+            while not done.wait(self.SAMPLE_INTERVAL):
+                peak_rss[0] = max(peak_rss[0], self._process.memory_info().rss)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        sampler.start()
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            done.set()
+            sampler.join()
+        peak_rss[0] = max(peak_rss[0], self._process.memory_info().rss)
+
+        n_rows = rows(result) if callable(rows) else rows
+        self.STAGES.append({
+            "name": name,
+            "seconds": seconds,
+            "peak_rss_mb": peak_rss[0] / 1024 ** 2,
+            "rss_growth_mb": (peak_rss[0] - start_rss) / 1024 ** 2,
+            "rows": n_rows,
+            "rows_per_s": n_rows / seconds if n_rows and seconds > 0 else None,
+        })
+        print(f"{name:<32} {seconds:9.3f} s {peak_rss[0] / 1024 ** 2:9.1f} MB"
+              + (f" {n_rows / seconds:12.0f} rows/s" if n_rows and seconds > 0 else ""))
+        return result
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _save_rows(csv_path: str, rows: list, flush_rows: int):
+    monitor = CPUMonitor(csv_path)
+    monitor.FLUSH_ROWS = flush_rows
+    for row in rows:
+        monitor.save(row)
+    monitor.close()
+
+
+def run_benchmarks(work_dir: str, n_hosts: int = 10, gpus_per_host: int = 4, interval: float = 1800,
+                   days: float = 90, save_rows: int = 2000, fast: bool = False, seed: int = 0) -> dict:
+    """Run every stage on a generated fleet in work_dir and return the results."""
+    recorder = StageRecorder()
+    data_dir = os.path.join(work_dir, "fleet")
+    counts = recorder.run(
+        "generate", generate_fleet, data_dir, n_hosts, gpus_per_host, interval, days, seed=seed,
+        rows=lambda counts: sum(counts.values())
+    )
+    cpu_path = os.path.join(data_dir, "cpu_usage.csv")
+    gpu_path = os.path.join(data_dir, "gpu_usage.csv")
+
+    with open(cpu_path, mode="r") as file:
+        file.readline()
+        rows = [line.rstrip("\n").split(",") for _, line in zip(range(save_rows), file)]
+    for flush_rows in (1, 100):
+        save_path = os.path.join(work_dir, f"save_{flush_rows}.csv")
+        recorder.run(f"save (flush_rows={flush_rows})", _save_rows, save_path, rows, flush_rows, rows=len(rows))
+
+    # Keep all but the first day, so the files are always rewritten
+    cutoff = datetime.now(pytz.timezone("Asia/Tokyo")) - timedelta(days=days - 1)
+    recorder.run("clean_usage cpu", clean_csv, cpu_path, "Third CPU Usage(%)", cutoff, timedelta(0),
+                 rows=counts["cpu_usage.csv"])
+    recorder.run("clean_usage gpu", clean_csv, gpu_path, "GPU Util(%)", cutoff, timedelta(0),
+                 rows=counts["gpu_usage.csv"])
+
+    report = ResourceReport(cpu_path, gpu_path, fast=fast)
+    cpu_df = recorder.run("_read_usage_data cpu", report._read_usage_data, cpu_path, rows=len)
+    gpu_df = recorder.run("_read_usage_data gpu", report._read_usage_data, gpu_path, rows=len)
+    for past_days in (8, 28):
+        recorder.run(f"get_past_days_usage {past_days}d", report.get_past_days_usage, gpu_df, past_days, rows=len(gpu_df))
+
+    chart_dir = os.path.join(work_dir, "charts")
+    os.makedirs(chart_dir, exist_ok=True)
+    for kind, df, y_col in [("cpu", cpu_df, "CPU Usage(%)"), ("gpu", gpu_df, "GPU Util(%)")]:
+        for method in ("plot_timeseries_trend", "plot_dayofweek_boxplot", "plot_hour_boxplot"):
+            recorder.run(
+                f"{method} {kind}", report.render_chart, method, df, y_col=y_col,
+                save_path=os.path.join(chart_dir, f"{method}_{kind}.jpg"), rows=len(df)
+            )
+
+    return {
+        "commit": _git_commit(),
+        "time": datetime.now(pytz.timezone("Asia/Tokyo")).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "params": {
+            "hosts": n_hosts, "gpus_per_host": gpus_per_host, "interval": interval,
+            "days": days, "save_rows": save_rows, "fast": fast, "seed": seed,
+        },
+        "stages": recorder.STAGES,
+    }
+
+
+def compare(baseline: dict, results: dict) -> list:
+    """(stage, seconds ratio, peak RSS ratio) of results against a baseline run."""
+    baseline_stages = {stage["name"]: stage for stage in baseline["stages"]}
+    ratios = []
+    for stage in results["stages"]:
+        base = baseline_stages.get(stage["name"])
+        if base is None:
+            continue
+        ratios.append((
+            stage["name"],
+            stage["seconds"] / base["seconds"] if base["seconds"] > 0 else None,
+            stage["peak_rss_mb"] / base["peak_rss_mb"] if base["peak_rss_mb"] > 0 else None,
+        ))
+    return ratios
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark storage, cleanup and report stages on a synthetic fleet.")
+    parser.add_argument("--hosts", type=int, default=10)
+    parser.add_argument("--gpus_per_host", type=int, default=4)
+    parser.add_argument("--interval", type=float, default=1800, help="Sampling interval in seconds.")
+    parser.add_argument("--days", type=float, default=90, help="Days of history.")
+    parser.add_argument("--save_rows", type=int, default=2000, help="Rows written by the save stages.")
+    parser.add_argument("--fast", action="store_true", help="Benchmark the report's fast plotting path.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--output", type=str,
+        help="Results JSON path (default: benchmarks/results/<time>_<commit>.json)."
+    )
+    parser.add_argument("--baseline", type=str, help="Results JSON of an earlier run to compare against.")
+    parser.add_argument("--keep", action="store_true", help="Keep the generated data and charts.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="resource-monitor-bench-")
+    try:
+        results = run_benchmarks(work_dir, args.hosts, args.gpus_per_host, args.interval, args.days,
+                                 args.save_rows, args.fast, args.seed)
+    finally:
+        if args.keep:
+            print(f"Data and charts kept in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        "benchmarks", "results", f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{results['commit'] or 'nogit'}.json"
+    )
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, mode="w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Results saved to {output}")
+
+    if args.baseline:
+        with open(args.baseline, mode="r") as file:
+            baseline = json.load(file)
+        print(f"\nAgainst {args.baseline} (time, peak RSS; >1 is slower/larger):")
+        for name, seconds_ratio, rss_ratio in compare(baseline, results):
+            print(f"{name:<32} {seconds_ratio or float('nan'):6.2f}x {rss_ratio or float('nan'):6.2f}x")
@@ -1,39 +1,78 @@
 import pandas as pd
 from datetime import datetime, timedelta
+import csv
+import os
 import pytz
 
-def clean_usage():
-    cpu_usage_path = "cpu_usage.csv"
-    gpu_usage_path = "gpu_usage.csv"
-    cpu_usage_df = pd.read_csv(cpu_usage_path, on_bad_lines='warn')
-    gpu_usage_df = pd.read_csv(gpu_usage_path, on_bad_lines='warn')
-    cpu_usage_df = cpu_usage_df[pd.notnull(cpu_usage_df["Third CPU Usage(%)"])].reset_index(drop=True)
-    gpu_usage_df = gpu_usage_df[pd.notnull(gpu_usage_df["GPU Util(%)"])].reset_index(drop=True)
-    cpu_usage_df = cpu_usage_df[pd.notnull(cpu_usage_df["Timestamp"])].reset_index(drop=True)
-    gpu_usage_df = gpu_usage_df[pd.notnull(gpu_usage_df["Timestamp"])].reset_index(drop=True)
+from storage import FileLock, SegmentStorage, RollupStorage, ROLLUP_RETENTION_DAYS, TIMESTAMP_FORMAT
 
+def _read_oldest_timestamp(path: str):
+    """Return the timestamp of the first data row, or None if it can't be parsed."""
+    with open(path, mode="r", newline="") as file:
+        reader = csv.reader(file)
+        next(reader, None)
+        first_row = next(reader, None)
+    try:
+        return datetime.strptime(first_row[0], TIMESTAMP_FORMAT)
+    except (TypeError, IndexError, ValueError):
+        return None
 
-    # タイムスタンプをJSTとして認識（naive→aware）
-    jst = pytz.timezone("Asia/Tokyo")
-    cpu_usage_df["Timestamp"] = pd.to_datetime(cpu_usage_df["Timestamp"], errors="coerce")
-    if cpu_usage_df["Timestamp"].dt.tz is None:
-        cpu_usage_df["Timestamp"] = cpu_usage_df["Timestamp"].dt.tz_localize("Asia/Tokyo")
-    else:
-        cpu_usage_df["Timestamp"] = cpu_usage_df["Timestamp"].dt.tz_convert("Asia/Tokyo")
-    gpu_usage_df["Timestamp"] = pd.to_datetime(gpu_usage_df["Timestamp"], errors="coerce")
-    if gpu_usage_df["Timestamp"].dt.tz is None:
-        gpu_usage_df["Timestamp"] = gpu_usage_df["Timestamp"].dt.tz_localize("Asia/Tokyo")
-    else:
-        gpu_usage_df["Timestamp"] = gpu_usage_df["Timestamp"].dt.tz_convert("Asia/Tokyo")
+def clean_csv(path: str, required_column: str, cutoff: datetime, slack: timedelta = timedelta(days=1)):
+    """
+    Drop rows older than `cutoff` and rows missing `required_column` from a usage CSV.
+
+    The file is only rewritten once its oldest row is more than `slack` past the
+    cutoff, so most runs just read the first line. The rewrite holds the writers'
+    FileLock and atomically replaces the file; writers reopen it on their next
+    flush, so no appended row is lost.
+    """
+    if not os.path.exists(path):
+        return False
+    oldest = _read_oldest_timestamp(path)
+    if oldest is not None and oldest >= cutoff.replace(tzinfo=None) - slack:
+        return False
+
+    lock = FileLock(path)
+    with lock:
+        usage_df = pd.read_csv(path, on_bad_lines='warn')
+        usage_df = usage_df[pd.notnull(usage_df[required_column])].reset_index(drop=True)
+        usage_df = usage_df[pd.notnull(usage_df["Timestamp"])].reset_index(drop=True)
 
+        # タイムスタンプをJSTとして認識（naive→aware）
+        usage_df["Timestamp"] = pd.to_datetime(usage_df["Timestamp"], errors="coerce")
+        if usage_df["Timestamp"].dt.tz is None:
+            usage_df["Timestamp"] = usage_df["Timestamp"].dt.tz_localize("Asia/Tokyo")
+        else:
+            usage_df["Timestamp"] = usage_df["Timestamp"].dt.tz_convert("Asia/Tokyo")
+        usage_df = usage_df[usage_df["Timestamp"] >= cutoff]
+        usage_df["Timestamp"] = usage_df["Timestamp"].dt.strftime(TIMESTAMP_FORMAT)
+
+        tmp_path = f"{path}.tmp.{os.getpid()}"
+        usage_df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+    lock.close()
+    return True
+
+def clean_usage(cpu_usage_path: str = "cpu_usage.csv", gpu_usage_path: str = "gpu_usage.csv", months: int = 3):
     # 現在時刻（JST）から3ヶ月前のデータを残す
+    jst = pytz.timezone("Asia/Tokyo")
     now = datetime.now(jst)
-    three_months_ago = now - pd.DateOffset(months=3)
-    cpu_usage_df = cpu_usage_df[cpu_usage_df["Timestamp"] >= three_months_ago]
-    gpu_usage_df = gpu_usage_df[gpu_usage_df["Timestamp"] >= three_months_ago]
+    cutoff = now - pd.DateOffset(months=months)
 
-    cpu_usage_df.to_csv(cpu_usage_path, index=False)
-    gpu_usage_df.to_csv(gpu_usage_path, index=False)
+    for path, required_column in [(cpu_usage_path, "Third CPU Usage(%)"), (gpu_usage_path, "GPU Util(%)")]:
+        if os.path.isdir(path):
+            # Segment storage: expire whole day partitions, never rewrite live data,
+            # and compact closed partitions (older than yesterday) into one segment
+            closed = (now - timedelta(days=1)).strftime("%Y-%m-%d")
+            storage = SegmentStorage(path)
+            storage.expire(cutoff.strftime("%Y-%m-%d"))
+            storage.compact(closed)
+            for tier, retention_days in ROLLUP_RETENTION_DAYS.items():
+                rollup = RollupStorage(path, tier)
+                rollup.expire((now - timedelta(days=retention_days)).strftime("%Y-%m-%d"))
+                rollup.compact(closed)
+        else:
+            clean_csv(path, required_column, cutoff)
 
-if __name__ == "__main__": 
-    clean_usage()
\ No newline at end of file
+if __name__ == "__main__":
+    clean_usage()
@@ -0,0 +1,311 @@
+import argparse
+import asyncio
+import json
+import math
+import signal
+import traceback
+from datetime import datetime
+
+from alert import AlertEngine, load_rules
+from exporter import MetricsExporter
+from monitor import CPUMonitor, GPUMonitor
+from gpu_stream import MISSING_VALUES
+from storage import INTERVAL_COLUMN, TIMESTAMP_FORMAT
+
+
+class CollectorServer:
+    """
+    Accept sample batches from monitors on many hosts and group-commit them to storage.
+
+    Agents POST a JSON list of rows to /samples/<kind> (kind: cpu or gpu), using
+    RemoteStorage. Rows are validated before they are queued, so a bad batch is
+    rejected with 400 and never reaches storage. Batches arriving while a commit
+    is running are appended together and flushed once, and each request is
+    answered once its rows were written, so this is the single writer of the
+    shared files. Alerts and the exporter see the rows after that.
+    """
+
+    MAX_BODY_BYTES = 16 * 1024 ** 2
+
+    def __init__(self, monitors: dict, host: str = "127.0.0.1", port: int = 8428):
+        # The monitors define each kind's columns and own its storage
+        self.MONITORS = monitors
+        self.STORAGES = {kind: monitor.get_storage() for kind, monitor in monitors.items()}
+        self.HOST = host
+        self.PORT = port
+        self.N_COMMITS = 0
+        self._server = None
+        self._queue = None
+        self._commit_task = None
+        self._connections = set()
+        # Connections with a request being answered, which stop() lets finish
+        self._busy = set()
+        self._stopping = False
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        self._commit_task = asyncio.create_task(self._commit_loop())
+        self._server = await asyncio.start_server(self._handle, self.HOST, self.PORT)
+        self.PORT = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        """
+        Stop accepting samples, commit and publish the batches already queued,
+        then close the monitors: their storages and the alert engine, which
+        sends the alerts still pending.
+        """
+        self._stopping = True
+        self._server.close()
+        for writer in self._connections - self._busy:
+            writer.close()
+        await self._server.wait_closed()
+        # The commit loop stops at this marker, after the batches queued before it
+        await self._queue.put(None)
+        try:
+            await self._commit_task
+        except Exception:
+            traceback.print_exc()
+        for monitor in self.MONITORS.values():
+            monitor.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        # Idle keep-alive connections are closed on stop()
+        self._connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                self._busy.add(writer)
+                method, target, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+
+                length = int(headers.get("content-length", 0))
+                if length > self.MAX_BODY_BYTES:
+                    await self._respond(writer, 413, {"error": "body too large"}, keep_alive=False)
+                    break
+                body = await reader.readexactly(length)
+                status, payload = await self._dispatch(method, target, body)
+                keep_alive = headers.get("connection", "").lower() != "close" and not self._stopping
+                await self._respond(writer, status, payload, keep_alive)
+                self._busy.discard(writer)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            self._connections.discard(writer)
+            self._busy.discard(writer)
+            writer.close()
+
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool):
+        reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 413: "Payload Too Large",
+                   500: "Internal Server Error", 503: "Service Unavailable"}
+        body = json.dumps(payload).encode()
+        writer.write(
+            f"HTTP/1.1 {status} {reasons[status]}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+
+    async def _dispatch(self, method: str, target: str, body: bytes):
+        if method == "GET" and target == "/health":
+            return 200, {"status": "ok"}
+        prefix = "/samples/"
+        if method != "POST" or not target.startswith(prefix) or target[len(prefix):] not in self.STORAGES:
+            return 404, {"error": "not found"}
+        kind = target[len(prefix):]
+
+        columns = self.MONITORS[kind].COLUMNS
+        n_columns = len(columns)
+        # Agents older than the Interval(s) column send rows without it
+        min_columns = n_columns - 1 if columns[-1] == INTERVAL_COLUMN else n_columns
+        try:
+            rows = json.loads(body)
+        except ValueError:
+            return 400, {"error": "invalid JSON"}
+        if not isinstance(rows, list) or not all(
+            isinstance(row, list) and min_columns <= len(row) <= n_columns for row in rows
+        ):
+            return 400, {"error": f"expected a list of rows with {n_columns} values"}
+        rows = [row + [None] * (n_columns - len(row)) for row in rows]
+        error = self._validate(kind, rows)
+        if error is not None:
+            return 400, {"error": error}
+
+        if self._stopping:
+            # Would be queued behind stop()'s marker; the agent spools the batch and resends it
+            return 503, {"error": "collector is stopping"}
+        committed = asyncio.get_running_loop().create_future()
+        await self._queue.put((kind, rows, committed))
+        try:
+            await committed
+        except Exception as e:
+            return 500, {"error": str(e)}
+        return 200, {"accepted": len(rows)}
+
+    def _validate(self, kind: str, rows: list) -> str:
+        """Return why a batch can't be stored, or None if every row is valid."""
+        monitor = self.MONITORS[kind]
+        for i, row in enumerate(rows):
+            for column, value in zip(monitor.COLUMNS, row):
+                if column == "Timestamp":
+                    try:
+                        datetime.strptime(value, TIMESTAMP_FORMAT)
+                    except (TypeError, ValueError):
+                        return f"row {i}: invalid Timestamp {value!r}"
+                elif column in monitor.CATEGORY_COLUMNS:
+                    if not (value is None or isinstance(value, str)):
+                        return f"row {i}: {column} must be a string"
+                elif not self._is_number(value):
+                    return f"row {i}: {column} must be a number"
+        return None
+
+    @staticmethod
+    def _is_number(value) -> bool:
+        if value is None or (isinstance(value, (int, float)) and not isinstance(value, bool)):
+            return True
+        if not isinstance(value, str):
+            return False
+        # Older agents send nvidia-smi's placeholders as they were printed
+        if value.strip() in MISSING_VALUES:
+            return True
+        try:
+            return not math.isinf(float(value))
+        except ValueError:
+            return False
+
+    async def _commit_loop(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            batches = [await self._queue.get()]
+            while not self._queue.empty():
+                batches.append(self._queue.get_nowait())
+            stopping = None in batches
+            batches = [batch for batch in batches if batch is not None]
+            if not batches:
+                continue
+            errors = await loop.run_in_executor(None, self._commit, batches)
+            for (_, _, committed), error in zip(batches, errors):
+                if committed.done():
+                    continue
+                if error is None:
+                    committed.set_result(None)
+                else:
+                    committed.set_exception(error)
+            # The rows are acknowledged once written, whatever alerting or exporting does with them
+            written = [batch for batch, error in zip(batches, errors) if error is None]
+            if written:
+                await loop.run_in_executor(None, self._publish, written)
+
+    def _commit(self, batches: list) -> list:
+        """
+        Append every pending batch, then flush each touched storage once. If a
+        flush fails, that kind's batches are written one by one, so only a
+        failing batch is rejected. Returns the exception of each batch, or None.
+        """
+        errors = [None] * len(batches)
+        indices = {}
+        for i, (kind, _, _) in enumerate(batches):
+            indices.setdefault(kind, []).append(i)
+        for kind, kind_indices in indices.items():
+            try:
+                self._write(kind, [batches[i][1] for i in kind_indices])
+            except Exception as e:
+                traceback.print_exc()
+                if len(kind_indices) == 1:
+                    errors[kind_indices[0]] = e
+                    continue
+                for i in kind_indices:
+                    try:
+                        self._write(kind, [batches[i][1]])
+                    except Exception as batch_error:
+                        errors[i] = batch_error
+        self.N_COMMITS += 1
+        return errors
+
+    def _write(self, kind: str, batches: list):
+        storage = self.STORAGES[kind]
+        try:
+            for rows in batches:
+                storage.append(rows)
+            storage.flush()
+        except Exception:
+            # Nothing of a failed write stays buffered to be written with later batches
+            storage.discard()
+            raise
+
+    def _publish(self, batches: list):
+        # Alerts and the exporter see the whole fleet here, so a fleet-wide spike is one message per rule
+        for kind, rows, _ in batches:
+            monitor = self.MONITORS[kind]
+            if monitor.EXPORTER is not None:
+                try:
+                    monitor.EXPORTER.update(kind, monitor.COLUMNS, rows)
+                except Exception:
+                    traceback.print_exc()
+            if monitor.ALERT_ENGINE is not None:
+                try:
+                    monitor.ALERT_ENGINE.evaluate(monitor.COLUMNS, rows)
+                except Exception:
+                    traceback.print_exc()
+
+
+async def serve(server: CollectorServer):
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(signum, stop_event.set)
+    await server.start()
+    print(f"Collecting samples on {server.HOST}:{server.PORT}")
+    await stop_event.wait()
+    await server.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect CPU/GPU samples from many hosts into one storage.")
+    parser.add_argument("--host", type=str, default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8428)
+    parser.add_argument(
+        "--storage", choices=["csv", "segment"], default="csv",
+        help="Write cpu_usage.csv/gpu_usage.csv, or the cpu_usage/gpu_usage segment directories."
+    )
+    parser.add_argument(
+        "--alert_rules", type=str,
+        help="JSON file of alert rules. Without it, the default rules in alert.py are used."
+    )
+    parser.add_argument(
+        "--alert_group_wait", type=float, default=60,
+        help="Seconds to collect alerts from other hosts before sending one grouped message."
+    )
+    parser.add_argument("--no_alerts", action="store_true", help="Don't evaluate alert rules.")
+    parser.add_argument(
+        "--metrics_port", type=int,
+        help="Serve the latest samples of every host at http://<host>:<port>/metrics (OpenMetrics)."
+    )
+    args = parser.parse_args()
+
+    suffix = ".csv" if args.storage == "csv" else ""
+    monitors = {"cpu": CPUMonitor(f"cpu_usage{suffix}"), "gpu": GPUMonitor(f"gpu_usage{suffix}")}
+    alert_engine = None
+    if not args.no_alerts:
+        rules = load_rules(args.alert_rules) if args.alert_rules else None
+        alert_engine = AlertEngine(rules, group_wait=args.alert_group_wait)
+    exporter = None
+    if args.metrics_port is not None:
+        exporter = MetricsExporter()
+        exporter.start(args.host, args.metrics_port)
+    for monitor in monitors.values():
+        # The collector flushes after every group commit
+        monitor.FLUSH_ROWS = float("inf")
+        monitor.ALERT_ENGINE = alert_engine
+        monitor.EXPORTER = exporter
+    asyncio.run(serve(CollectorServer(monitors, host=args.host, port=args.port)))
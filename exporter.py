@@ -0,0 +1,170 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import math
+import threading
+import time
+
+from instrument import LATENCY_BUCKETS
+
+PREFIX = "resource_monitor"
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+MB = 1024 ** 2
+
+# column: (metric name, help, unit scale, constant labels)
+GAUGES = {
+    "CPU Usage(%)": ("cpu_usage_percent", "CPU usage of the host.", 1, {}),
+    "Load Average(1m)": ("load_average", "Load average of the host.", 1, {"period": "1m"}),
+    "Load Average(5m)": ("load_average", "Load average of the host.", 1, {"period": "5m"}),
+    "Load Average(15m)": ("load_average", "Load average of the host.", 1, {"period": "15m"}),
+    "Total Memory(MB)": ("memory_total_bytes", "Total memory of the host.", MB, {}),
+    "Used Memory(MB)": ("memory_used_bytes", "Used memory of the host.", MB, {}),
+    "Free Memory(MB)": ("memory_free_bytes", "Free memory of the host.", MB, {}),
+    "Temp(C)": ("gpu_temperature_celsius", "GPU temperature.", 1, {}),
+    "Power Usage(W)": ("gpu_power_usage_watts", "GPU power draw.", 1, {}),
+    "Power Cap(W)": ("gpu_power_cap_watts", "GPU power limit.", 1, {}),
+    "Mem Usage(MB)": ("gpu_memory_used_bytes", "Used GPU memory.", MB, {}),
+    "Mem Total(MB)": ("gpu_memory_total_bytes", "Total GPU memory.", MB, {}),
+    "GPU Util(%)": ("gpu_utilization_percent", "GPU utilization.", 1, {}),
+    "Process CPU(%)": ("process_cpu_usage_percent", "CPU usage of the monitor itself, in percent of one core.", 1, {}),
+    "Process RSS(MB)": ("process_resident_memory_bytes", "Resident memory of the monitor itself.", MB, {}),
+    "Interval(s)": ("sample_interval_seconds", "Seconds the latest sample stands for.", 1, {}),
+}
+# Per-row labels taken from columns
+LABEL_COLUMNS = {"Hostname": "host", "GPU Index": "gpu", "Name": "name"}
+TOP_USER_COLUMNS = [
+    ("Top User", "Top CPU Usage(%)", "1"),
+    ("Second User", "Second CPU Usage(%)", "2"),
+    ("Third User", "Third CPU Usage(%)", "3"),
+]
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return None if math.isnan(value) else value
+
+
+def _format(value: float) -> str:
+    return repr(float(value)) if not math.isinf(value) else ("+Inf" if value > 0 else "-Inf")
+
+
+class MetricsExporter:
+    """
+    Serve the latest samples at /metrics in OpenMetrics (or Prometheus text) format.
+
+    Monitors call update() with each batch they save. The exposition text is
+    rendered once per update and kept as bytes, so a scrape only writes the
+    cached payload: it never triggers collection or disk I/O, and concurrent
+    scrapers cost almost nothing. With a StageTimer, its latency histograms
+    are exported too.
+    """
+
+    def __init__(self, timer=None):
+        self.TIMER = timer
+        # (kind, hostname) -> (columns, rows, time of the update)
+        self.LATEST = {}
+        self._lock = threading.Lock()
+        self._payloads = (b"# EOF\n", b"")
+        self._server = None
+        self._thread = None
+
+    def update(self, kind: str, columns: list, rows: list):
+        """Replace the latest rows of each host in `rows` and re-render the exposition."""
+        by_host = {}
+        for row in rows:
+            by_host.setdefault(row[columns.index("Hostname")], []).append(row)
+        with self._lock:
+            now = time.time()
+            for hostname, host_rows in by_host.items():
+                self.LATEST[(kind, hostname)] = (columns, host_rows, now)
+            self.render()
+
+    def render(self):
+        families = {}
+
+        def add(name, help_, labels, value):
+            family = families.setdefault(name, (help_, []))
+            family[1].append(f"{PREFIX}_{name}{_labels(labels)} {_format(value)}")
+
+        for (kind, hostname), (columns, rows, updated) in sorted(self.LATEST.items(), key=lambda item: str(item[0])):
+            add("last_update_timestamp_seconds", "Time of the latest sample.", {"host": hostname, "kind": kind}, updated)
+            for values in rows:
+                row = dict(zip(columns, values))
+                labels = {label: row[column] for column, label in LABEL_COLUMNS.items() if column in row}
+                for column, (name, help_, scale, constant_labels) in GAUGES.items():
+                    value = _number(row.get(column))
+                    if value is not None:
+                        add(name, help_, {**labels, **constant_labels}, value * scale)
+                for user_column, usage_column, rank in TOP_USER_COLUMNS:
+                    value = _number(row.get(usage_column))
+                    if row.get(user_column) is not None and value is not None:
+                        add("top_user_cpu_usage_percent", "CPU usage of the top users of the host.",
+                            {**labels, "rank": rank, "user": row[user_column]}, value)
+
+        lines = []
+        for name, (help_, samples) in families.items():
+            lines += [f"# TYPE {PREFIX}_{name} gauge", f"# HELP {PREFIX}_{name} {help_}"] + samples
+        lines += self._render_timer()
+        body = "\n".join(lines) + "\n" if lines else ""
+        self._payloads = ((body + "# EOF\n").encode(), body.encode())
+
+    def _render_timer(self) -> list:
+        if self.TIMER is None:
+            return []
+        name = f"{PREFIX}_stage_duration_seconds"
+        lines = [f"# TYPE {name} histogram", f"# HELP {name} Latency of the monitor's collection stages."]
+        for stage, histogram in sorted(self.TIMER.snapshot().items()):
+            cumulative = 0
+            for bound, count in zip(list(LATENCY_BUCKETS) + [math.inf], histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels({'stage': stage, 'le': _format(bound)})} {cumulative}")
+            lines.append(f"{name}_count{_labels({'stage': stage})} {cumulative}")
+            lines.append(f"{name}_sum{_labels({'stage': stage})} {_format(histogram.total)}")
+        return lines
+
+    def payload(self, openmetrics: bool = True) -> bytes:
+        return self._payloads[0 if openmetrics else 1]
+
+    def start(self, host: str = "0.0.0.0", port: int = 9101):
+        """Serve /metrics on a background thread."""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+                body = exporter.payload(openmetrics)
+                self.send_response(200)
+                self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE if openmetrics else PROMETHEUS_CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self._server.server_address[1]
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
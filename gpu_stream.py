@@ -0,0 +1,160 @@
+from dataclasses import dataclass, astuple
+import subprocess
+import threading
+import time
+import traceback
+
+GPU_QUERY_FIELDS = [
+    "index", "name", "temperature.gpu", "power.draw", "power.limit",
+    "memory.used", "memory.total", "utilization.gpu"
+]
+# Values nvidia-smi prints instead of a number when a field is unavailable
+MISSING_VALUES = {"", "N/A", "[N/A]", "[Not Supported]", "[Unknown Error]", "[GPU is lost]", "[Insufficient Permissions]"}
+# The stream samples at this period whatever the monitors' interval, so the latest sample is always fresh
+STREAM_INTERVAL_MS = 1000
+
+
+@dataclass
+class GPURecord:
+    index: int
+    name: str
+    temperature: float
+    power_draw: float
+    power_limit: float
+    memory_used: float
+    memory_total: float
+    utilization: float
+
+    def to_row(self) -> list:
+        """Values in GPUMonitor column order, with None for missing fields."""
+        return list(astuple(self))
+
+
+def _parse_number(value: str, type_=float):
+    value = value.strip()
+    if value in MISSING_VALUES:
+        return None
+    try:
+        return type_(value)
+    except ValueError:
+        return None
+
+
+def parse_gpu_line(line: str):
+    """Parse one `--query-gpu` CSV line (noheader, nounits). Returns None for malformed lines."""
+    fields = line.strip().split(", ")
+    if len(fields) != len(GPU_QUERY_FIELDS):
+        return None
+    index = _parse_number(fields[0], int)
+    if index is None:
+        return None
+    return GPURecord(index, fields[1].strip(), *(_parse_number(field) for field in fields[2:]))
+
+
+class NvidiaSmiStream:
+    """
+    Keep one `nvidia-smi --query-gpu ... -lms <interval>` child running and
+    parse its output incrementally, instead of spawning nvidia-smi per sample.
+
+    The child is restarted with exponential backoff if it exits.
+    """
+
+    def __init__(self, interval_ms: int = STREAM_INTERVAL_MS, command: str = "nvidia-smi",
+                 restart_delay: float = 1.0, max_restart_delay: float = 60.0):
+        self.INTERVAL_MS = interval_ms
+        self.COMMAND = command
+        self.RESTART_DELAY = restart_delay
+        self.MAX_RESTART_DELAY = max_restart_delay
+        self.N_RESTARTS = 0
+        self._process = None
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._latest = None
+        self._latest_time = None
+        self._latest_lock = threading.Lock()
+        self._received = threading.Event()
+
+    def _start_process(self):
+        command = [
+            self.COMMAND,
+            f"--query-gpu=timestamp,count,{','.join(GPU_QUERY_FIELDS)}",
+            "--format=csv,noheader,nounits",
+            "-lms", str(self.INTERVAL_MS),
+        ]
+        self._process = subprocess.Popen(
+            command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, bufsize=1
+        )
+
+    def samples(self):
+        """Yield one list of GPURecord per sampling interval until stop() is called."""
+        delay = self.RESTART_DELAY
+        while not self._stop_event.is_set():
+            try:
+                self._start_process()
+            except OSError:
+                traceback.print_exc()
+            else:
+                # Lines of one sample share nvidia-smi's timestamp, and every line
+                # carries the GPU count, so a sample is complete as soon as every GPU
+                # has reported. A new timestamp ends a sample cut short.
+                sample_time, sample = None, []
+                for line in self._process.stdout:
+                    timestamp, _, rest = line.partition(", ")
+                    n_gpus, _, rest = rest.partition(", ")
+                    record = parse_gpu_line(rest)
+                    if record is None:
+                        continue
+                    delay = self.RESTART_DELAY
+                    if sample and timestamp != sample_time:
+                        yield sample
+                        sample = []
+                    sample_time = timestamp
+                    sample.append(record)
+                    if len(sample) == _parse_number(n_gpus, int):
+                        yield sample
+                        sample = []
+                if sample:
+                    yield sample
+                self._process.wait()
+
+            if self._stop_event.wait(delay):
+                break
+            delay = min(delay * 2, self.MAX_RESTART_DELAY)
+            self.N_RESTARTS += 1
+
+    def _consume(self):
+        for sample in self.samples():
+            with self._latest_lock:
+                self._latest, self._latest_time = sample, time.monotonic()
+            self._received.set()
+
+    def start(self):
+        """Consume samples on a background thread; latest() returns the newest one."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._consume, daemon=True)
+            self._thread.start()
+
+    def latest(self, max_age: float = None, timeout: float = 0.0):
+        """
+        Return the newest sample, or None if it is older than `max_age` seconds
+        (default: three sampling periods, e.g. while nvidia-smi is restarting).
+        Waits up to `timeout` seconds for the first sample after start().
+        """
+        self._received.wait(timeout)
+        max_age = max_age if max_age is not None else 3 * self.INTERVAL_MS / 1000
+        with self._latest_lock:
+            if self._latest is None or time.monotonic() - self._latest_time > max_age:
+                return None
+            return self._latest
+
+    def stop(self):
+        self._stop_event.set()
+        if self._process is not None and self._process.poll() is None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
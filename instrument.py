@@ -0,0 +1,115 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+import functools
+import threading
+import time
+
+# Upper bounds in seconds of the latency buckets: 10 µs doubling up to ~84 s, then +Inf
+LATENCY_BUCKETS = tuple(1e-5 * 2 ** i for i in range(24))
+
+
+class LatencyHistogram:
+    """
+    Counts of observed latencies per LATENCY_BUCKETS bucket, with their sum and
+    maximum, and the maximum since the window was last reset.
+    """
+
+    __slots__ = ("counts", "total", "maximum", "window_maximum")
+
+    def __init__(self, counts: list = None, total: float = 0.0, maximum: float = 0.0, window_maximum: float = 0.0):
+        self.counts = counts if counts is not None else [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = total
+        self.maximum = maximum
+        self.window_maximum = window_maximum
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def observe(self, seconds: float):
+        self.counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        if seconds > self.maximum:
+            self.maximum = seconds
+        if seconds > self.window_maximum:
+            self.window_maximum = seconds
+
+    def copy(self) -> "LatencyHistogram":
+        return LatencyHistogram(list(self.counts), self.total, self.maximum, self.window_maximum)
+
+    def since(self, earlier: "LatencyHistogram") -> "LatencyHistogram":
+        """
+        Observations made after `earlier`, a copy of this histogram. Their maximum
+        is the window maximum, so the window must have been reset when `earlier`
+        was taken (see StageTimer.snapshot).
+        """
+        if earlier is None:
+            return LatencyHistogram(list(self.counts), self.total, self.window_maximum, self.window_maximum)
+        counts = [count - earlier_count for count, earlier_count in zip(self.counts, earlier.counts)]
+        return LatencyHistogram(counts, self.total - earlier.total, self.window_maximum, self.window_maximum)
+
+    def quantile(self, q: float):
+        """Estimate the q-quantile (0-1) by interpolating within its bucket. None if empty."""
+        n = self.count
+        if n == 0:
+            return None
+        rank = q * n
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if count and cumulative + count >= rank:
+                lower = LATENCY_BUCKETS[i - 1] if i > 0 else 0.0
+                upper = LATENCY_BUCKETS[i] if i < len(LATENCY_BUCKETS) else self.maximum
+                return min(lower + (upper - lower) * (rank - cumulative) / count, self.maximum)
+            cumulative += count
+        return self.maximum
+
+
+class StageTimer:
+    """
+    Cumulative latency histograms of named stages (e.g. "CPUMonitor.get_cpu_usage").
+
+    Timing a call costs two perf_counter() reads and a bisect into the
+    bucket bounds, so every collector of a 1 s sampler can be timed.
+    """
+
+    def __init__(self):
+        self.HISTOGRAMS = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            histogram = self.HISTOGRAMS.get(stage)
+            if histogram is None:
+                histogram = self.HISTOGRAMS[stage] = LatencyHistogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def wrap(self, stage: str, func):
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self.observe(stage, time.perf_counter() - start)
+        return timed
+
+    def snapshot(self, reset_window: bool = False) -> dict:
+        """
+        Copies of the histograms, by stage. With reset_window, their window
+        maximums restart from this snapshot; only one reader (the SelfMonitor)
+        should reset them.
+        """
+        with self._lock:
+            snapshot = {stage: histogram.copy() for stage, histogram in self.HISTOGRAMS.items()}
+            if reset_window:
+                for histogram in self.HISTOGRAMS.values():
+                    histogram.window_maximum = 0.0
+            return snapshot
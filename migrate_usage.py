@@ -0,0 +1,45 @@
+import argparse
+import numpy as np
+import pandas as pd
+
+from monitor import CPUMonitor, GPUMonitor
+from storage import SegmentStorage, TIMEZONE, TIMESTAMP_FORMAT
+
+
+def migrate_usage(csv_path: str, segment_dir: str, monitor_type: str, chunksize: int = 1_000_000):
+    """One-shot migration of an existing usage CSV into segment storage."""
+    monitor = CPUMonitor(segment_dir) if monitor_type == "cpu" else GPUMonitor(segment_dir)
+    storage = SegmentStorage(segment_dir, monitor.COLUMNS, monitor.CATEGORY_COLUMNS, rollup_columns=monitor.ROLLUP_COLUMNS)
+    n_rows = 0
+    for df in pd.read_csv(csv_path, on_bad_lines="warn", chunksize=chunksize, dtype=str):
+        df = df.reindex(columns=monitor.COLUMNS)
+        timestamp = pd.to_datetime(df["Timestamp"], format=TIMESTAMP_FORMAT, errors="coerce")
+        timestamp = timestamp.dt.tz_localize(TIMEZONE, ambiguous="NaT", nonexistent="shift_forward")
+        df = df[timestamp.notna()].copy()
+        epoch = (timestamp[timestamp.notna()] - pd.Timestamp("1970-01-01", tz="UTC")) // pd.Timedelta(seconds=1)
+        df["Timestamp"] = epoch.to_numpy(dtype=np.int64)
+        storage.append_frame(df)
+        n_rows += len(df)
+    return n_rows
+
+
+def export_usage(segment_dir: str, csv_path: str):
+    """Export segment storage back to the CSV format."""
+    SegmentStorage(segment_dir).export_csv(csv_path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrate usage CSVs to segment storage, or export segments to CSV.")
+    parser.add_argument("monitor_type", choices=["cpu", "gpu"])
+    parser.add_argument("--export", action="store_true", help="Export segments to CSV instead of migrating.")
+    parser.add_argument("--csv_path", type=str, help="Defaults to cpu_usage.csv / gpu_usage.csv.")
+    parser.add_argument("--segment_dir", type=str, help="Defaults to cpu_usage / gpu_usage.")
+    args = parser.parse_args()
+
+    csv_path = args.csv_path or f"{args.monitor_type}_usage.csv"
+    segment_dir = args.segment_dir or f"{args.monitor_type}_usage"
+    if args.export:
+        export_usage(segment_dir, csv_path)
+    else:
+        n_rows = migrate_usage(csv_path, segment_dir, args.monitor_type)
+        print(f"Migrated {n_rows} rows from {csv_path} to {segment_dir}")
@@ -4,14 +4,48 @@ import psutil
 import pandas as pd
 import os
 import subprocess
-import csv
 import platform
 import argparse
+import signal
+import threading
+import time
+import traceback
+import cProfile
+import sys
+
+from procfs import ProcScanner
+from proc_history import DEFAULT_CAPACITY, DEFAULT_PATH, ProcessHistory, parse_duration, top
+from gpu_stream import GPU_QUERY_FIELDS, STREAM_INTERVAL_MS, NvidiaSmiStream, parse_gpu_line
+from storage import open_storage
+from alert import AlertEngine, load_rules
+from instrument import StageTimer
+from exporter import MetricsExporter
+from adaptive import BurstScheduler
 
 class ResourceMonitor(ABC):
     def __init__(self, csv_path):
+        # A path ending in .csv is a CSV file, anything else a segment storage directory
         self.CSV_PATH = csv_path
         self.COLUMNS = []
+        self.CATEGORY_COLUMNS = []
+        # Metrics kept as 5 min / 1 h / 1 day rollups by segment storage
+        self.ROLLUP_COLUMNS = []
+        # None makes cpu_percent non-blocking (delta since the previous call)
+        self.CPU_INTERVAL = 1
+        self.PROC_SCANNER = None
+        # Buffered rows are flushed every FLUSH_ROWS rows or FLUSH_INTERVAL seconds
+        self.FLUSH_ROWS = 1
+        self.FLUSH_INTERVAL = None
+        self.STORAGE = None
+        # An AlertEngine evaluating every saved row, if alerts are enabled
+        self.ALERT_ENGINE = None
+        # The StageTimer timing this monitor's collectors, if instrumented
+        self.TIMER = None
+        # A MetricsExporter serving the latest saved rows, if enabled
+        self.EXPORTER = None
+        self.KIND = None
+        # Seconds the next sample stands for, stored with it (None when unknown, e.g. from cron)
+        self.SAMPLE_INTERVAL = None
 
     def get_os_type(self):
         """
@@ -31,7 +65,7 @@ class ResourceMonitor(ABC):
         return hostname
     
     def get_cpu_usage(self):
-        cpu_usage = psutil.cpu_percent(interval=1, percpu=False)
+        cpu_usage = psutil.cpu_percent(interval=self.CPU_INTERVAL, percpu=False)
         return cpu_usage
     
     def get_loadavg(self):
@@ -45,8 +79,23 @@ class ResourceMonitor(ABC):
         free_memory = mem_info.free // (1024 **2)
         return total_memory, used_memory, free_memory
     
-    def get_top_cpu_users(self):
-        command = "ps -eo user,%cpu | awk 'NR>1 {a[$1]+=$2} END {for (u in a) print u\",\"a[u]}' | sort -t',' -k2 -nr | head -n 3"
+    def get_top_cpu_users(self, n: int = 3):
+        if self.get_os_type() == "Linux" and os.path.isdir("/proc"):
+            top_cpu_users = self._get_top_cpu_users_from_proc(n)
+        else:
+            top_cpu_users = self._get_top_cpu_users_from_ps(n)
+        # Always return n entries so callers can index the result safely
+        top_cpu_users += [[None, None] for _ in range(n - len(top_cpu_users))]
+        return top_cpu_users
+
+    def _get_top_cpu_users_from_proc(self, n: int):
+        # The scanner is kept alive so CPU% covers the interval since the previous sample
+        if self.PROC_SCANNER is None:
+            self.PROC_SCANNER = ProcScanner()
+        return [[user, cpu] for user, cpu, _ in self.PROC_SCANNER.get_top_users(n, by="cpu")]
+
+    def _get_top_cpu_users_from_ps(self, n: int):
+        command = f"ps -eo user,%cpu | awk 'NR>1 {{a[$1]+=$2}} END {{for (u in a) print u\",\"a[u]}}' | sort -t',' -k2 -nr | head -n {n}"
         result = subprocess.run(command, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         top_cpu_users = []
         if result.returncode == 0:
@@ -57,57 +106,78 @@ class ResourceMonitor(ABC):
                     top_cpu_users.append([user, cpu])
                 except:
                     top_cpu_users.append([user, None])
-        else:
-            for _ in range(3):
-                top_cpu_users.append([None, None])
         return top_cpu_users
 
     @abstractmethod
     def monitor(self): 
         pass
 
-    def check_existing_csv(self):
-        """Check if the CSV file exists, and add column names if missing."""
-        if os.path.exists(self.CSV_PATH):
-            with open(self.CSV_PATH, mode='r+', newline='') as file:
-                reader = csv.reader(file)
-                first_row = next(reader, None)
-                if first_row is None or first_row != self.COLUMNS:
-                    # If column names are missing or incorrect, add them
-                    writer = csv.writer(file)
-                    file.seek(0)  # Move to the beginning of the file to add column names
-                    writer.writerow(self.COLUMNS)
-                    file.truncate()  # Truncate the file content after adding the column names
-        else:
-            return False  # If the file does not exist
+    def get_storage(self):
+        if self.STORAGE is None:
+            self.STORAGE = open_storage(
+                self.CSV_PATH, self.COLUMNS, self.CATEGORY_COLUMNS,
+                max_rows=self.FLUSH_ROWS, flush_interval=self.FLUSH_INTERVAL,
+                rollup_columns=self.ROLLUP_COLUMNS
+            )
+            if self.TIMER is not None:
+                self._time_storage_flush()
+        return self.STORAGE
 
-        return True  # If the file exists and is correct
+    def _time_storage_flush(self):
+        self.STORAGE.time_flush(self.TIMER, f"{type(self).__name__}.flush")
 
+    def save(self, data: list):
+        self.save_rows([data])
 
-    def create_csv(self):
-        with open(self.CSV_PATH, mode='w', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(self.COLUMNS)
+    def save_rows(self, rows: list):
+        """Save several rows as one batch."""
+        self.get_storage().append(rows)
+        if self.EXPORTER is not None:
+            self.EXPORTER.update(self.KIND, self.COLUMNS, rows)
+        if self.ALERT_ENGINE is not None:
+            self.ALERT_ENGINE.evaluate(self.COLUMNS, rows)
 
-    def save(self, data: list):
-        if not self.check_existing_csv():
-            self.create_csv()
-        
-        with open(self.CSV_PATH, mode='a', newline='') as file:
-            writer = csv.writer(file)
-            writer.writerow(data)
+    def flush_deadline(self):
+        """Monotonic time by which this monitor's buffered rows are due to be flushed, or None."""
+        return self.STORAGE.flush_deadline() if self.STORAGE is not None else None
+
+    def flush_if_due(self):
+        if self.STORAGE is not None:
+            self.STORAGE.flush_if_due()
+
+    def instrument(self, timer: StageTimer):
+        """
+        Time every get_* collector, monitor(), save_rows() (buffering the rows) and
+        the storage flush (writing them) as "<class>.<method>" stages.
+        """
+        names = [name for name in dir(self) if name.startswith("get_") and name != "get_storage"]
+        for name in names + ["monitor", "save_rows"]:
+            setattr(self, name, timer.wrap(f"{type(self).__name__}.{name}", getattr(self, name)))
+        self.TIMER = timer
+        if self.STORAGE is not None:
+            self._time_storage_flush()
+
+    def close(self):
+        if self.STORAGE is not None:
+            self.STORAGE.close()
+        if self.ALERT_ENGINE is not None:
+            self.ALERT_ENGINE.close()
 
 class CPUMonitor(ResourceMonitor):
     def __init__(self, csv_path: str = "cpu_usage.csv"):
         super().__init__(csv_path)
+        self.KIND = "cpu"
         self.COLUMNS = [
             "Timestamp", "Hostname", "CPU Usage(%)", 
             "Load Average(1m)", "Load Average(5m)", "Load Average(15m)",
             "Total Memory(MB)", "Used Memory(MB)", "Free Memory(MB)",
             "Top User", "Top CPU Usage(%)", 
             "Second User", "Second CPU Usage(%)", 
-            "Third User", "Third CPU Usage(%)"
+            "Third User", "Third CPU Usage(%)",
+            "Interval(s)"
         ]
+        self.CATEGORY_COLUMNS = ["Hostname", "Top User", "Second User", "Third User"]
+        self.ROLLUP_COLUMNS = ["CPU Usage(%)", "Load Average(1m)", "Used Memory(MB)"]
 
     def monitor(self):
         current_time = self.get_currenttime()
@@ -122,52 +192,452 @@ class CPUMonitor(ResourceMonitor):
             total_memory, used_memory, free_memory, 
             top_cpu_users[0][0], top_cpu_users[0][1], 
             top_cpu_users[1][0], top_cpu_users[1][1], 
-            top_cpu_users[2][0], top_cpu_users[2][1]
+            top_cpu_users[2][0], top_cpu_users[2][1],
+            self.SAMPLE_INTERVAL
         ]
         self.save(data)
         return data
 
 class GPUMonitor(ResourceMonitor):
-    def __init__(self, csv_path: str = "gpu_usage.csv"):
+    # Seconds a tick waits for the stream's first sample
+    STREAM_START_TIMEOUT = 5.0
+
+    def __init__(self, csv_path: str = "gpu_usage.csv", stream_interval_ms: int = None):
         super().__init__(csv_path)
+        self.KIND = "gpu"
         self.COLUMNS = [
-            "Timestamp","Hostname","GPU Index","Name","Temp(C)","Power Usage(W)","Power Cap(W)","Mem Usage(MB)","Mem Total(MB)","GPU Util(%)"
+            "Timestamp","Hostname","GPU Index","Name","Temp(C)","Power Usage(W)","Power Cap(W)","Mem Usage(MB)","Mem Total(MB)","GPU Util(%)","Interval(s)"
         ]
+        self.CATEGORY_COLUMNS = ["Hostname", "Name"]
+        self.ROLLUP_COLUMNS = ["GPU Util(%)", "Mem Usage(MB)", "Power Usage(W)", "Temp(C)"]
+        # With stream_interval_ms, one long-lived nvidia-smi child is read instead of one run per sample.
+        # It starts now, so the first sample is in by the first tick.
+        self.GPU_STREAM = NvidiaSmiStream(stream_interval_ms) if stream_interval_ms else None
+        if self.GPU_STREAM is not None:
+            self.GPU_STREAM.start()
 
     def get_gpu_usage(self):
-        command = ["nvidia-smi", "--query-gpu=index,name,temperature.gpu,power.draw,power.limit,memory.used,memory.total,utilization.gpu", "--format=csv,noheader,nounits"]
+        command = ["nvidia-smi", f"--query-gpu={','.join(GPU_QUERY_FIELDS)}", "--format=csv,noheader,nounits"]
         gpu_usage = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
         return gpu_usage
 
+    def get_gpu_records(self):
+        if self.GPU_STREAM is not None:
+            return self.GPU_STREAM.latest(timeout=self.STREAM_START_TIMEOUT) or []
+        gpu_usage = self.get_gpu_usage()
+        records = [parse_gpu_line(line) for line in gpu_usage.stdout.strip().split('\n')]
+        return [record for record in records if record is not None]
+
     def monitor(self):
         current_time = self.get_currenttime()
         hostname = self.get_hostname()
-        gpu_usage = self.get_gpu_usage()
-        gpu_info = gpu_usage.stdout.strip().split('\n')
-        for line in gpu_info:
-            data = [current_time, hostname] + line.split(', ')
-            self.save(data)
+        rows = [[current_time, hostname] + record.to_row() + [self.SAMPLE_INTERVAL] for record in self.get_gpu_records()]
+        self.save_rows(rows)
+        return rows
+
+    def close(self):
+        if self.GPU_STREAM is not None:
+            self.GPU_STREAM.stop()
+        super().close()
+
+class SelfMonitor(ResourceMonitor):
+    """
+    Record the monitor process's own CPU/RSS and the latency of the stages
+    timed by a StageTimer, as a separate self-metrics stream.
+
+    Each call writes one "process" row with the CPU (percent of one core) and
+    RSS of this process since the previous call, and one row per stage with
+    the count and latency of the calls since the previous call.
+    """
+
+    def __init__(self, csv_path: str = "self_metrics.csv", timer: StageTimer = None, overhead_budget: float = None):
+        super().__init__(csv_path)
+        self.KIND = "self"
+        self.COLUMNS = [
+            "Timestamp", "Hostname", "Stage", "Count",
+            "Mean(ms)", "P50(ms)", "P99(ms)", "Max(ms)",
+            "Process CPU(%)", "Process RSS(MB)"
+        ]
+        self.CATEGORY_COLUMNS = ["Hostname", "Stage"]
+        self.TIMER = timer or StageTimer()
+        # Warn when the process uses more than this percent of one core
+        self.OVERHEAD_BUDGET = overhead_budget
+        self.PROCESS = psutil.Process()
+        self.PROCESS.cpu_percent(interval=None)
+        self._previous = {}
+
+    def get_process_usage(self):
+        cpu_usage = self.PROCESS.cpu_percent(interval=None)
+        rss = self.PROCESS.memory_info().rss / 1024 ** 2
+        return cpu_usage, rss
+
+    def monitor(self):
+        current_time = self.get_currenttime()
+        hostname = self.get_hostname()
+        cpu_usage, rss = self.get_process_usage()
+        rows = [[current_time, hostname, "process", None, None, None, None, None, round(cpu_usage, 2), round(rss, 1)]]
+
+        snapshot = self.TIMER.snapshot(reset_window=True)
+        for stage, histogram in sorted(snapshot.items()):
+            window = histogram.since(self._previous.get(stage))
+            if window.count == 0:
+                continue
+            rows.append([
+                current_time, hostname, stage, window.count,
+                round(window.total / window.count * 1000, 3),
+                round(window.quantile(0.5) * 1000, 3), round(window.quantile(0.99) * 1000, 3),
+                round(window.maximum * 1000, 3), None, None
+            ])
+        self._previous = snapshot
+        self.save_rows(rows)
+
+        if self.OVERHEAD_BUDGET is not None and cpu_usage > self.OVERHEAD_BUDGET:
+            print(f"Monitor overhead {cpu_usage:.2f}% of one core exceeds the budget of {self.OVERHEAD_BUDGET}%")
+        return rows
+
+class MonitorDaemon:
+    """
+    Keep monitors alive and sample them every `interval` seconds until SIGTERM.
+
+    With a BurstScheduler, `interval` is only the base rate: the scheduler
+    probes cheaply in between and runs the monitors more often while the
+    load is changing.
+    """
+    MIN_INTERVAL = 1.0
+
+    def __init__(self, monitors: list, interval: float = 1800, flush_rows: int = 1, flush_interval: float = None,
+                 self_monitor: SelfMonitor = None, self_metrics_interval: float = 60, scheduler: BurstScheduler = None):
+        if interval < self.MIN_INTERVAL:
+            raise ValueError(f"The interval must be at least {self.MIN_INTERVAL} second(s).")
+        if scheduler is not None and scheduler.BURST_INTERVAL < self.MIN_INTERVAL:
+            raise ValueError(f"The burst interval must be at least {self.MIN_INTERVAL} second(s).")
+        self.MONITORS = monitors
+        self.INTERVAL = interval
+        self.SCHEDULER = scheduler
+        # With a SelfMonitor, the monitors are timed and self-metrics written every self_metrics_interval seconds
+        self.SELF_MONITOR = self_monitor
+        self.SELF_METRICS_INTERVAL = self_metrics_interval
+        self._last_self_metrics = time.monotonic()
+        for monitor in self.MONITORS + ([self_monitor] if self_monitor is not None else []):
+            monitor.FLUSH_ROWS = flush_rows
+            monitor.FLUSH_INTERVAL = flush_interval
+        if self_monitor is not None:
+            for monitor in self.MONITORS:
+                monitor.instrument(self_monitor.TIMER)
+        self._stop_event = threading.Event()
+
+    def stop(self, signum=None, frame=None):
+        self._stop_event.set()
+
+    def tick(self, sample_interval: float = None):
+        """Run every monitor once; their rows record `sample_interval` (default: the interval)."""
+        sample_interval = round(sample_interval if sample_interval is not None else self.INTERVAL, 1)
+        for monitor in self.MONITORS:
+            monitor.SAMPLE_INTERVAL = sample_interval
+            try:
+                monitor.monitor()
+            except Exception:
+                # One failing collector must not take the daemon down
+                traceback.print_exc()
+        if self.SELF_MONITOR is not None and time.monotonic() - self._last_self_metrics >= self.SELF_METRICS_INTERVAL:
+            self._last_self_metrics = time.monotonic()
+            try:
+                self.SELF_MONITOR.monitor()
+            except Exception:
+                traceback.print_exc()
+
+    def _all_monitors(self) -> list:
+        return self.MONITORS + ([self.SELF_MONITOR] if self.SELF_MONITOR is not None else [])
+
+    def wait_until(self, deadline: float) -> bool:
+        """
+        Wait until `deadline` (a monotonic time), flushing buffered rows as their
+        flush interval passes, since storages only check it when rows arrive.
+        Returns whether the daemon was stopped.
+        """
+        while True:
+            flush_deadlines = []
+            for monitor in self._all_monitors():
+                try:
+                    monitor.flush_if_due()
+                except Exception:
+                    traceback.print_exc()
+                flush_deadlines.append(monitor.flush_deadline())
+            now = time.monotonic()
+            if now >= deadline:
+                return self._stop_event.is_set()
+            # Deadlines still in the past are failed flushes, retried with the next rows or wakeup
+            wakeup = min([deadline] + [d for d in flush_deadlines if d is not None and d > now])
+            if self._stop_event.wait(wakeup - now):
+                return True
+
+    def close(self):
+        if self.SELF_MONITOR is not None:
+            # Record the stages since the last self-metrics row
+            try:
+                self.SELF_MONITOR.monitor()
+            except Exception:
+                traceback.print_exc()
+        for monitor in self._all_monitors():
+            try:
+                monitor.close()
+            except Exception:
+                traceback.print_exc()
+
+    def run(self, max_ticks: int = None):
+        try:
+            self._run(max_ticks)
+        finally:
+            # Flush buffered rows on shutdown
+            self.close()
+
+    def _run(self, max_ticks: int = None):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        # Switch to delta-based cpu_percent and prime it, so the first tick has a baseline
+        for monitor in self.MONITORS:
+            monitor.CPU_INTERVAL = None
+        psutil.cpu_percent(interval=None)
+        if self._stop_event.wait(min(self.INTERVAL, 1.0)):
+            return
+        if self.SCHEDULER is not None:
+            self._run_adaptive(max_ticks)
+            return
+
+        ticks = 0
+        next_tick = time.monotonic()
+        while not self._stop_event.is_set():
+            self.tick()
+            ticks += 1
+            if max_ticks is not None and ticks >= max_ticks:
+                break
+            # Schedule against the absolute start time so ticks don't drift,
+            # and skip the ticks we missed if one overran the interval
+            next_tick += self.INTERVAL
+            now = time.monotonic()
+            if next_tick < now:
+                next_tick += ((now - next_tick) // self.INTERVAL + 1) * self.INTERVAL
+            self.wait_until(next_tick)
+
+    def _run_adaptive(self, max_ticks: int = None):
+        scheduler = self.SCHEDULER
+        ticks = 0
+        while not self._stop_event.is_set():
+            now = time.monotonic()
+            if scheduler.due(now):
+                self.tick(scheduler.collected(now))
+                ticks += 1
+                if max_ticks is not None and ticks >= max_ticks:
+                    break
+            now = time.monotonic()
+            self.wait_until(now + scheduler.next_wakeup(now))
 
 if __name__ == "__main__": 
     parser = argparse.ArgumentParser(description="Monitor CPU or GPU usage.")
     parser.add_argument(
-        "monitor_type", choices=["cpu", "gpu"], 
-        help="Specify whether to monitor CPU or GPU usage."
+        "monitor_type", choices=["cpu", "gpu", "daemon", "top"], 
+        help="Specify whether to monitor CPU or GPU usage, run a long-lived sampler daemon, "
+             "or show the top processes recorded by the daemon's --proc_history."
     )
     parser.add_argument(
         "--csv_path", type=str, 
         help="Specify the path to the CSV file for logging."
     )
+    parser.add_argument(
+        "--storage", choices=["csv", "segment"], default="csv",
+        help="Storage backend: a CSV file, or a directory of day-partitioned columnar segments."
+    )
+    parser.add_argument(
+        "--collector_url", type=str,
+        help="Send samples to a collector (collector.py) at this URL instead of local storage."
+    )
+    parser.add_argument(
+        "--targets", nargs="+", choices=["cpu", "gpu"], default=["cpu", "gpu"],
+        help="Monitors to run in daemon mode."
+    )
+    parser.add_argument(
+        "--interval", type=float, default=1800,
+        help="Sampling interval in seconds for daemon mode (minimum 1); the base interval with --burst."
+    )
+    parser.add_argument(
+        "--burst", action="store_true",
+        help="In daemon mode, probe load and CPU every --probe_interval seconds and sample every "
+             "--burst_interval seconds while they change, decaying back to --interval."
+    )
+    parser.add_argument("--probe_interval", type=float, default=5, help="Seconds between cheap probes with --burst.")
+    parser.add_argument("--burst_interval", type=float, default=10, help="Sampling interval right after a change with --burst.")
+    parser.add_argument(
+        "--cpu_delta", type=float, default=20.0,
+        help="Change in CPU usage (percentage points) since the last sample that starts a burst."
+    )
+    parser.add_argument(
+        "--load_delta", type=float,
+        help="Change in the 1 min load average since the last sample that starts a burst (default: cores / 4)."
+    )
+    parser.add_argument(
+        "--burst_decay", type=float, default=2.0,
+        help="Factor the sampling interval grows by after each sample without a change."
+    )
+    parser.add_argument(
+        "--gpu_stream", action="store_true",
+        help="In daemon mode, read GPU samples from one long-lived nvidia-smi process sampling every second."
+    )
+    parser.add_argument(
+        "--flush_rows", type=int, default=100,
+        help="Number of buffered rows that triggers a write in daemon mode."
+    )
+    parser.add_argument(
+        "--flush_interval", type=float, default=60,
+        help="Maximum age in seconds of buffered rows before they are written in daemon mode."
+    )
+    parser.add_argument(
+        "--alerts", action="store_true",
+        help="Send Slack alerts when samples cross the default thresholds (see alert.py)."
+    )
+    parser.add_argument(
+        "--alert_rules", type=str,
+        help="JSON file of alert rules to use instead of the defaults. Implies --alerts."
+    )
     
+    parser.add_argument(
+        "--self_metrics", action="store_true",
+        help="In daemon mode, time each collector and record the daemon's own CPU/RSS to self_metrics.csv."
+    )
+    parser.add_argument(
+        "--self_metrics_interval", type=float, default=60,
+        help="Seconds between self-metrics rows."
+    )
+    parser.add_argument(
+        "--overhead_budget", type=float,
+        help="Warn when the daemon uses more than this percent of one core (implies --self_metrics)."
+    )
+    parser.add_argument(
+        "--metrics_port", type=int,
+        help="In daemon mode, serve the latest samples at http://<host>:<port>/metrics (OpenMetrics)."
+    )
+    parser.add_argument("--metrics_host", type=str, default="0.0.0.0")
+    parser.add_argument(
+        "--proc_history", action="store_true",
+        help="In daemon mode, also sample every process's CPU, RSS and IO each second into --history_path."
+    )
+    parser.add_argument(
+        "--history_path", type=str, default=DEFAULT_PATH,
+        help="Memory-mapped ring buffer of the process history (in shared memory by default)."
+    )
+    parser.add_argument(
+        "--history_records", type=int, default=DEFAULT_CAPACITY,
+        help="Records kept in the process history ring; the oldest are overwritten."
+    )
+    parser.add_argument(
+        "--since", type=str, default="10m",
+        help="For top: the window to summarize, e.g. 30s, 10m or 2h."
+    )
+    parser.add_argument(
+        "--by", choices=["cpu", "rss", "io"], default="cpu",
+        help="For top: sort by mean CPU, peak RSS or mean IO."
+    )
+    parser.add_argument("-n", "--top_n", type=int, default=20, help="For top: number of rows to show.")
+    parser.add_argument(
+        "--cgroups", action="store_true",
+        help="For top: show totals per cgroup instead of processes."
+    )
+    parser.add_argument(
+        "--profile", type=int, metavar="N",
+        help="Run the daemon for N ticks under cProfile and save the profile to --profile_path."
+    )
+    parser.add_argument(
+        "--profile_path", type=str, default="monitor.prof",
+        help="Profile output (pstats format, e.g. for snakeviz or flameprof)."
+    )
     args = parser.parse_args()
     # Ensure the csv_path has the correct extension
     if args.csv_path:
         if not args.csv_path.endswith(".csv"):
             raise ValueError("The CSV path must end with '.csv'.")
     
-    csv_path = args.csv_path if args.csv_path else "cpu_usage.csv" if args.monitor_type == "cpu" else "gpu_usage.csv"
-    
-    if args.monitor_type == "cpu":
-        CPUMonitor(csv_path).monitor()
-    elif args.monitor_type == "gpu":
-        GPUMonitor(csv_path).monitor()
\ No newline at end of file
+    def storage_path(default_csv_path):
+        if args.collector_url:
+            # e.g. http://collector:8428/samples/cpu
+            return f"{args.collector_url.rstrip('/')}/samples/{default_csv_path.split('_')[0]}"
+        # Segment storage lives in a directory named after the CSV file
+        csv_path = args.csv_path or default_csv_path
+        return csv_path[:-len(".csv")] if args.storage == "segment" else csv_path
+
+    if args.monitor_type == "top":
+        if not os.path.exists(args.history_path):
+            parser.error(f"No process history at {args.history_path}: run `monitor.py daemon --proc_history` first.")
+        rows = top(args.history_path, since=parse_duration(args.since), by=args.by, n=args.top_n, cgroups=args.cgroups)
+        if args.cgroups:
+            print(f"{'CGROUP':<48} {'CPU%':>7} {'RSS MB':>9} {'READ KB/s':>10} {'WRITE KB/s':>10}")
+            for cgroup, _, _, cpu, rss, read_kbs, write_kbs in rows:
+                print(f"{cgroup[-48:]:<48} {cpu:>7.1f} {rss:>9.1f} {read_kbs:>10.1f} {write_kbs:>10.1f}")
+        else:
+            print(f"{'PID':>8} {'USER':<12} {'COMMAND':<16} {'CPU%':>7} {'RSS MB':>9} {'READ KB/s':>10} {'WRITE KB/s':>10}")
+            for pid, user, comm, cpu, rss, read_kbs, write_kbs in rows:
+                print(f"{pid:>8} {user:<12} {comm:<16} {cpu:>7.1f} {rss:>9.1f} {read_kbs:>10.1f} {write_kbs:>10.1f}")
+        sys.exit(0)
+
+    alert_engine = None
+    if args.alerts or args.alert_rules:
+        alert_engine = AlertEngine(load_rules(args.alert_rules) if args.alert_rules else None)
+
+    if args.monitor_type == "daemon":
+        if args.csv_path and len(args.targets) > 1:
+            raise ValueError("--csv_path can only be used with a single daemon target.")
+        monitors = []
+        if "cpu" in args.targets:
+            monitors.append(CPUMonitor(storage_path("cpu_usage.csv")))
+        if "gpu" in args.targets:
+            stream_interval_ms = STREAM_INTERVAL_MS if args.gpu_stream else None
+            monitors.append(GPUMonitor(storage_path("gpu_usage.csv"), stream_interval_ms=stream_interval_ms))
+        for monitor in monitors:
+            monitor.ALERT_ENGINE = alert_engine
+        self_monitor = None
+        if args.self_metrics or args.overhead_budget is not None:
+            # Kept locally even with a collector
+            self_monitor = SelfMonitor("self_metrics" if args.storage == "segment" else "self_metrics.csv",
+                                       overhead_budget=args.overhead_budget)
+        scheduler = None
+        if args.burst:
+            scheduler = BurstScheduler(
+                args.interval, burst_interval=args.burst_interval, probe_interval=args.probe_interval,
+                cpu_delta=args.cpu_delta, load_delta=args.load_delta, decay=args.burst_decay
+            )
+        daemon = MonitorDaemon(
+            monitors, interval=args.interval,
+            flush_rows=args.flush_rows, flush_interval=args.flush_interval,
+            self_monitor=self_monitor, self_metrics_interval=args.self_metrics_interval,
+            scheduler=scheduler
+        )
+        if args.metrics_port is not None:
+            exporter = MetricsExporter(timer=self_monitor.TIMER if self_monitor is not None else None)
+            for monitor in monitors + ([self_monitor] if self_monitor is not None else []):
+                monitor.EXPORTER = exporter
+            exporter.start(args.metrics_host, args.metrics_port)
+        history = None
+        if args.proc_history:
+            history = ProcessHistory(args.history_path, args.history_records)
+            history.start(interval=1.0)
+        try:
+            if args.profile:
+                profiler = cProfile.Profile()
+                profiler.enable()
+                daemon.run(max_ticks=args.profile)
+                profiler.disable()
+                profiler.dump_stats(args.profile_path)
+                print(f"Profile of {args.profile} ticks saved to {args.profile_path}")
+            else:
+                daemon.run()
+        finally:
+            if history is not None:
+                history.stop()
+    else:
+        if args.profile:
+            parser.error("--profile is only supported in daemon mode.")
+        csv_path = storage_path("cpu_usage.csv" if args.monitor_type == "cpu" else "gpu_usage.csv")
+
+        monitor = CPUMonitor(csv_path) if args.monitor_type == "cpu" else GPUMonitor(csv_path)
+        monitor.ALERT_ENGINE = alert_engine
+        monitor.monitor()
+        monitor.close()
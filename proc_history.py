@@ -0,0 +1,237 @@
+import os
+import re
+import threading
+import time
+import traceback
+import numpy as np
+
+from procfs import ProcScanner
+from ringbuffer import RingBuffer
+
+# One record per process (pid > 0) or cgroup total (pid == -1) per sample
+RECORD_DTYPE = np.dtype([
+    ("time", "<f8"), ("pid", "<i4"), ("uid", "<i4"),
+    ("cpu", "<f4"), ("rss_mb", "<f4"), ("read_kbs", "<f4"), ("write_kbs", "<f4"),
+    ("comm", "S16"), ("cgroup", "S80"),
+])
+DEFAULT_PATH = "/dev/shm/resource_monitor_proc_history" if os.path.isdir("/dev/shm") else "proc_history.ring"
+# ~40 MB: 10+ minutes of 1 s samples of a few hundred active processes
+DEFAULT_CAPACITY = 2 ** 18
+
+
+def parse_duration(text: str) -> float:
+    """Seconds in "90", "30s", "10m", "2h" or "1d"."""
+    match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smhd]?)\s*", text)
+    if match is None:
+        raise ValueError(f"Invalid duration: {text!r}")
+    return float(match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}[match.group(2)]
+
+
+class ProcessHistory:
+    """
+    Sample CPU, RSS and IO of every process, and their totals per cgroup,
+    into a RingBuffer every `interval` seconds.
+
+    Processes that used no CPU or IO in the interval and hold less than
+    `min_rss_mb` are skipped to save ring space; cgroup totals include them.
+    IO counters of other users' processes need root and are NaN otherwise.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH, capacity: int = DEFAULT_CAPACITY,
+                 scanner: ProcScanner = None, min_rss_mb: float = 100.0):
+        self.SCANNER = scanner or ProcScanner()
+        self.RING = RingBuffer(path, RECORD_DTYPE, capacity)
+        self.MIN_RSS_MB = min_rss_mb
+        # Reused between samples and grown as needed
+        self._buffer = np.zeros(1024, dtype=RECORD_DTYPE)
+        self._previous = {}  # (pid, starttime) -> (ticks, read_bytes, write_bytes)
+        self._cgroups = {}  # (pid, starttime) -> cgroup path
+        self._prev_uptime = None
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def read_io(self, pid: str):
+        try:
+            with open(os.path.join(self.SCANNER.PROC_ROOT, pid, "io"), "rb") as file:
+                io = file.read()
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            return None, None
+        read_bytes = write_bytes = None
+        for line in io.splitlines():
+            if line.startswith(b"read_bytes:"):
+                read_bytes = int(line.split()[1])
+            elif line.startswith(b"write_bytes:"):
+                write_bytes = int(line.split()[1])
+        return read_bytes, write_bytes
+
+    def read_cgroup(self, pid: str) -> bytes:
+        """The unified (v2) cgroup path, or the cpu controller's on cgroup v1."""
+        try:
+            with open(os.path.join(self.SCANNER.PROC_ROOT, pid, "cgroup"), "rb") as file:
+                lines = file.read().splitlines()
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            return b""
+        for line in lines:
+            hierarchy, controllers, path = line.split(b":", 2)
+            if hierarchy == b"0" or b"cpu" in controllers.split(b","):
+                # Keep the end of long paths, where container and job IDs are
+                return path[-RECORD_DTYPE["cgroup"].itemsize:]
+        return b""
+
+    def _put(self, i: int, record: tuple):
+        if i >= len(self._buffer):
+            self._buffer = np.resize(self._buffer, 2 * len(self._buffer))
+        self._buffer[i] = record
+
+    def sample(self, now: float = None) -> int:
+        """Scan all processes, append their records to the ring and return how many were written."""
+        now = time.time() if now is None else now
+        scanner = self.SCANNER
+        uptime = scanner.get_uptime()
+        prev_uptime = self._prev_uptime
+        previous, current, cgroups = self._previous, {}, {}
+        totals = {}
+        n = 0
+
+        for pid in os.listdir(scanner.PROC_ROOT):
+            if not pid.isdigit():
+                continue
+            info = scanner.read_process(pid)
+            if info is None:
+                continue
+            uid, ticks, starttime, rss_bytes = info
+            read_bytes, write_bytes = self.read_io(pid)
+            key = (pid, starttime)
+            current[key] = (ticks, read_bytes, write_bytes)
+            cgroup = self._cgroups.get(key)
+            if cgroup is None:
+                cgroup = self.read_cgroup(pid)
+            cgroups[key] = cgroup
+
+            before = previous.get(key)
+            if before is not None and prev_uptime is not None:
+                elapsed = uptime - prev_uptime
+                before_ticks, before_read, before_write = before
+            else:
+                elapsed = uptime - starttime / scanner.CLK_TCK
+                before_ticks, before_read, before_write = 0, 0, 0
+            if elapsed <= 0:
+                continue
+            cpu = 100.0 * (ticks - before_ticks) / (elapsed * scanner.CLK_TCK)
+            read_kbs = (read_bytes - before_read) / elapsed / 1024 if read_bytes is not None and before_read is not None else np.nan
+            write_kbs = (write_bytes - before_write) / elapsed / 1024 if write_bytes is not None and before_write is not None else np.nan
+            rss_mb = rss_bytes / 1024 ** 2
+
+            total = totals.setdefault(cgroup, [0.0, 0.0, 0.0, 0.0])
+            total[0] += cpu
+            total[1] += rss_mb
+            total[2] += read_kbs if read_kbs == read_kbs else 0.0
+            total[3] += write_kbs if write_kbs == write_kbs else 0.0
+
+            if cpu > 0 or rss_mb >= self.MIN_RSS_MB or (read_kbs > 0) or (write_kbs > 0):
+                self._put(n, (now, int(pid), uid, cpu, rss_mb, read_kbs, write_kbs, self._read_comm(pid), cgroup))
+                n += 1
+
+        for cgroup, (cpu, rss_mb, read_kbs, write_kbs) in totals.items():
+            self._put(n, (now, -1, -1, cpu, rss_mb, read_kbs, write_kbs, b"", cgroup))
+            n += 1
+
+        self._previous, self._cgroups, self._prev_uptime = current, cgroups, uptime
+        self.RING.append(self._buffer[:n])
+        return n
+
+    def _read_comm(self, pid: str) -> bytes:
+        try:
+            with open(os.path.join(self.SCANNER.PROC_ROOT, pid, "comm"), "rb") as file:
+                return file.read().strip()[:RECORD_DTYPE["comm"].itemsize]
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            return b""
+
+    def _run(self, interval: float):
+        next_sample = time.monotonic()
+        while not self._stop_event.is_set():
+            try:
+                self.sample()
+            except Exception:
+                traceback.print_exc()
+            next_sample += interval
+            now = time.monotonic()
+            if next_sample < now:
+                next_sample = now + interval
+            self._stop_event.wait(next_sample - now)
+
+    def start(self, interval: float = 1.0):
+        """Sample every `interval` seconds on a background thread until stop()."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.RING.close()
+
+
+def top(path: str = DEFAULT_PATH, since: float = 600, by: str = "cpu", n: int = 20,
+        cgroups: bool = False, now: float = None, scanner: ProcScanner = None) -> list:
+    """
+    The top-n processes (or cgroups) of the last `since` seconds in a history ring,
+    sorted by mean CPU%, peak RSS or mean IO. Filters the views of the mapped ring
+    in place and gathers only the selected records' fields, without blocking the sampler.
+    Returns [[pid or cgroup, user or None, command, cpu %, rss MB, read KB/s, write KB/s]].
+    """
+    if by not in ("cpu", "rss", "io"):
+        raise ValueError("by must be 'cpu', 'rss' or 'io'.")
+    scanner = scanner or ProcScanner()
+    ring = RingBuffer(path, RECORD_DTYPE, readonly=True)
+    now = time.time() if now is None else now
+    names = ["cpu", "rss_mb", "read_kbs", "write_kbs"] + (["cgroup"] if cgroups else ["pid", "uid", "comm"])
+    for _ in range(3):
+        first_number, views = ring.views(since=now - since)
+        # Each view is filtered in place; only the selected records' fields are gathered
+        n_samples, last_time, parts = 0, None, {name: [] for name in names}
+        for view in views:
+            # Records are in time order, so samples are counted where the time changes
+            time_field = view["time"]
+            if len(time_field):
+                n_samples += int(np.count_nonzero(time_field[1:] != time_field[:-1])) + int(time_field[0] != last_time)
+                last_time = time_field[-1]
+            selected = view["pid"] < 0 if cgroups else view["pid"] > 0
+            for name in names:
+                parts[name].append(view[name][selected])
+        fields = {name: np.concatenate(parts[name]) if views else np.array([], RECORD_DTYPE[name]) for name in names}
+        if not ring.overwritten(first_number):
+            break
+
+    n_samples = max(n_samples, 1)
+    keys = fields["cgroup"] if cgroups else fields["pid"]
+    if len(keys) == 0:
+        return []
+    unique_keys, group = np.unique(keys, return_inverse=True)
+
+    def group_sum(values):
+        return np.bincount(group, weights=np.nan_to_num(values), minlength=len(unique_keys))
+
+    # Processes missing from a sample were idle, so means are over every sample
+    cpu = group_sum(fields["cpu"]) / n_samples
+    read_kbs = group_sum(fields["read_kbs"]) / n_samples
+    write_kbs = group_sum(fields["write_kbs"]) / n_samples
+    rss = np.zeros(len(unique_keys))
+    np.maximum.at(rss, group, fields["rss_mb"])
+    # The latest record of each key gives its user and command
+    latest = np.zeros(len(unique_keys), dtype=np.int64)
+    np.maximum.at(latest, group, np.arange(len(group)))
+
+    order = np.argsort(-{"cpu": cpu, "rss": rss, "io": read_kbs + write_kbs}[by], kind="stable")[:n]
+    rows = []
+    for i in order:
+        usage = [round(float(values[i]), 1) for values in (cpu, rss, read_kbs, write_kbs)]
+        if cgroups:
+            rows.append([unique_keys[i].decode(errors="replace"), None, None] + usage)
+        else:
+            j = latest[i]
+            rows.append([int(unique_keys[i]), scanner.get_username(int(fields["uid"][j])),
+                         fields["comm"][j].decode(errors="replace")] + usage)
+    return rows
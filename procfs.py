@@ -0,0 +1,123 @@
+import os
+import pwd
+import time
+
+
+class ProcScanner:
+    """
+    Read per-process CPU ticks and RSS straight from /proc.
+
+    Tick counters are kept between scans, so CPU% is the usage over the
+    interval since the previous scan (like top) rather than the lifetime
+    average reported by `ps %cpu`.
+    """
+
+    def __init__(self, proc_root: str = "/proc"):
+        self.PROC_ROOT = proc_root
+        self.CLK_TCK = os.sysconf("SC_CLK_TCK")
+        self.PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+        self._prev_ticks = {}  # (pid, starttime) -> utime + stime
+        self._prev_uptime = None
+        self._usernames = {}
+
+    def get_uptime(self):
+        with open(os.path.join(self.PROC_ROOT, "uptime")) as file:
+            return float(file.read().split()[0])
+
+    def get_username(self, uid: int):
+        username = self._usernames.get(uid)
+        if username is None:
+            try:
+                username = pwd.getpwuid(uid).pw_name
+            except KeyError:
+                username = str(uid)
+            self._usernames[uid] = username
+        return username
+
+    def read_process(self, pid: str):
+        """Return (uid, ticks, starttime, rss_bytes) or None if the process is gone."""
+        base = os.path.join(self.PROC_ROOT, pid)
+        try:
+            with open(os.path.join(base, "stat"), "rb") as file:
+                stat = file.read()
+            with open(os.path.join(base, "status"), "rb") as file:
+                status = file.read()
+        except (FileNotFoundError, ProcessLookupError, PermissionError):
+            return None
+
+        # comm may contain spaces and parentheses, so split after the last ')'
+        fields = stat[stat.rindex(b")") + 2:].split()
+        ticks = int(fields[11]) + int(fields[12])  # utime + stime
+        starttime = int(fields[19])
+        rss_bytes = int(fields[21]) * self.PAGE_SIZE
+
+        uid = None
+        for line in status.splitlines():
+            if line.startswith(b"Uid:"):
+                uid = int(line.split()[1])
+                break
+        if uid is None:
+            return None
+        return uid, ticks, starttime, rss_bytes
+
+    def scan(self):
+        """
+        Scan all processes and return a list of (user, cpu_percent, rss_bytes).
+
+        Processes first seen in this scan are measured since their start time.
+        """
+        uptime = self.get_uptime()
+        prev_uptime = self._prev_uptime
+        prev_ticks = self._prev_ticks
+        current_ticks = {}
+        processes = []
+
+        for pid in os.listdir(self.PROC_ROOT):
+            if not pid.isdigit():
+                continue
+            info = self.read_process(pid)
+            if info is None:
+                continue
+            uid, ticks, starttime, rss_bytes = info
+            key = (pid, starttime)
+            current_ticks[key] = ticks
+
+            previous = prev_ticks.get(key)
+            if previous is not None and prev_uptime is not None:
+                elapsed = uptime - prev_uptime
+                delta = ticks - previous
+            else:
+                elapsed = uptime - starttime / self.CLK_TCK
+                delta = ticks
+            cpu_percent = 100.0 * delta / (elapsed * self.CLK_TCK) if elapsed > 0 else 0.0
+            processes.append((self.get_username(uid), cpu_percent, rss_bytes))
+
+        self._prev_ticks = current_ticks
+        self._prev_uptime = uptime
+        return processes
+
+    def get_user_usage(self):
+        """Aggregate one scan per user: {user: [cpu_percent, rss_bytes]}."""
+        usage = {}
+        for user, cpu_percent, rss_bytes in self.scan():
+            totals = usage.setdefault(user, [0.0, 0])
+            totals[0] += cpu_percent
+            totals[1] += rss_bytes
+        return usage
+
+    def get_top_users(self, n: int = 3, by: str = "cpu"):
+        """Return the top-n users as [[user, cpu_percent, rss_mb], ...] sorted by 'cpu' or 'rss'."""
+        if by not in ("cpu", "rss"):
+            raise ValueError("by must be either 'cpu' or 'rss'.")
+        index = 0 if by == "cpu" else 1
+        usage = self.get_user_usage()
+        top_users = sorted(usage.items(), key=lambda item: item[1][index], reverse=True)[:n]
+        return [[user, round(cpu, 1), rss // (1024 ** 2)] for user, (cpu, rss) in top_users]
+
+
+if __name__ == "__main__":
+    scanner = ProcScanner()
+    scanner.scan()
+    time.sleep(1)
+    for user, cpu, rss in scanner.get_top_users(n=10):
+        print(f"{user:<16} {cpu:>6.1f}% {rss:>8} MB")
@@ -1,8 +1,11 @@
 import pandas as pd
 import seaborn as sns
+import matplotlib
+matplotlib.use("Agg")  # Headless: charts are only saved to files
 import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from matplotlib.ticker import FuncFormatter
+from matplotlib.collections import LineCollection, PolyCollection
 from PIL import Image
 import numpy as np
 from datetime import datetime
@@ -10,34 +13,123 @@ import pytz
 from abc import ABC, abstractmethod
 from datetime import datetime, timedelta
 import pytz
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 from slack import SlackNotificator
 from clean_usage import clean_usage
+from storage import INTERVAL_COLUMN, SegmentStorage, RollupStorage
+from aggregate import group_quantiles, minmax_decimate
+from report_cache import ReportCache
+from usage_frame import UsageFrame
+
+# Chart jobs of the running report. The parent fills this before forking the
+# worker pool, so workers inherit the sliced data copy-on-write instead of
+# receiving a pickled copy each.
+_CHART_JOBS = []
+
+
+def _render_chart_job(i: int):
+    report, method, args, kwargs = _CHART_JOBS[i]
+    report.render_chart(method, *args, **kwargs)
+    return i
 
 
 class ResourceReport(ABC):
-    def __init__(self, cpu_usage_filepath: str = "cpu_usage.csv", gpu_usage_filepath: str = "gpu_usage.csv"):
-        self.cpu_usage_df = self._read_usage_data(cpu_usage_filepath)
-        self.gpu_usage_df = self._read_usage_data(gpu_usage_filepath)
+    # Columns and history the report needs, used to read only part of segment storage
+    CPU_COLUMNS = ["Timestamp", "Hostname", "CPU Usage(%)", INTERVAL_COLUMN]
+    GPU_COLUMNS = ["Timestamp", "Hostname", "GPU Util(%)", INTERVAL_COLUMN]
+    PAST_DAYS = 28
+    # Stripplot jitter and lineplot bootstraps draw from numpy's global RNG;
+    # seeding it per chart makes every chart reproducible in any process
+    CHART_SEED = 0
+    # Rollup tier read from segment storage for windows of up to N days (None: raw samples)
+    ROLLUP_TIERS = [(2, None), (14, "5min"), (120, "1h"), (None, "1d")]
+
+    SAVE_DPI = 200
+    # Rendered charts that can be reused while their data is unchanged
+    CACHEABLE_CHARTS = ("plot_timeseries_trend", "plot_dayofweek_boxplot", "plot_hour_boxplot")
+
+    def __init__(self, cpu_usage_filepath: str = "cpu_usage.csv", gpu_usage_filepath: str = "gpu_usage.csv",
+                 fast: bool = False, cache_dir: str = None):
+        # fast: draw aggregated statistics and decimated lines instead of every raw sample
+        self.FAST = fast
+        self.CACHE = ReportCache(cache_dir) if cache_dir else None
+        self.cpu_usage_filepath = cpu_usage_filepath
+        self.gpu_usage_filepath = gpu_usage_filepath
+        self._cpu_usage_df = None
+        self._gpu_usage_df = None
         self.now = datetime.now(pytz.timezone("Asia/Tokyo")).strftime("%Y-%m-%d_%H:%M:%S")
 
-    def _read_usage_data(self, filepath: str) -> pd.DataFrame:
-        df = pd.read_csv(filepath)
-        # df['Timestamp'] = pd.to_datetime(df['Timestamp'], errors='coerce').dt.tz_localize("Asia/Tokyo", ambiguous='NaT', nonexistent='shift_forward')
-        jst = pytz.timezone("Asia/Tokyo")
-        df["Timestamp"] = pd.to_datetime(df["Timestamp"], errors="coerce")
-        if df["Timestamp"].dt.tz is None:
-            df["Timestamp"] = df["Timestamp"].dt.tz_localize("Asia/Tokyo")
-        else:
-            df["Timestamp"] = df["Timestamp"].dt.tz_convert("Asia/Tokyo")
-        return df.dropna(subset=['Timestamp'])
+    @property
+    def cpu_usage_df(self) -> UsageFrame:
+        # Raw samples are loaded on first use, since rollup-backed charts don't need them
+        if self._cpu_usage_df is None:
+            self.load_usage_data()
+        return self._cpu_usage_df
+
+    @property
+    def gpu_usage_df(self) -> UsageFrame:
+        if self._gpu_usage_df is None:
+            self.load_usage_data()
+        return self._gpu_usage_df
 
-    def get_past_days_usage(self, usage_df: pd.DataFrame, past_days: int = 1) -> pd.DataFrame:
-        usage_df = usage_df.copy()
-        usage_df['Date'] = usage_df['Timestamp'].dt.floor('D')
-        last_date = usage_df['Date'].max()
-        start_date = last_date - pd.Timedelta(days=past_days)
-        return usage_df[usage_df['Date'] >= start_date].drop(columns='Date')
+    def load_usage_data(self):
+        """Load the raw CPU and GPU samples not loaded yet, both files at once."""
+        jobs = {}
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            if self._cpu_usage_df is None:
+                jobs["cpu"] = pool.submit(self._read_usage_data, self.cpu_usage_filepath, self.CPU_COLUMNS)
+            if self._gpu_usage_df is None:
+                jobs["gpu"] = pool.submit(self._read_usage_data, self.gpu_usage_filepath, self.GPU_COLUMNS)
+        if "cpu" in jobs:
+            self._cpu_usage_df = jobs["cpu"].result()
+        if "gpu" in jobs:
+            self._gpu_usage_df = jobs["gpu"].result()
+
+    def get_usage_data(self, kind: str, y_col: str, past_days: int) -> UsageFrame:
+        """
+        Return the data for a chart over `past_days`: the coarsest rollup tier that
+        fits the window when reading segment storage, raw samples otherwise.
+        Rollup frames hold the bucket mean in `y_col`.
+        """
+        filepath = self.cpu_usage_filepath if kind == "cpu" else self.gpu_usage_filepath
+        tier = next(tier for max_days, tier in self.ROLLUP_TIERS if max_days is None or past_days <= max_days)
+        if os.path.isdir(filepath) and tier is not None:
+            df = RollupStorage(filepath, tier).read(columns=[y_col], past_days=past_days)
+            if len(df) > 0:
+                return UsageFrame(df)
+        return self.cpu_usage_df if kind == "cpu" else self.gpu_usage_df
+
+    def _read_usage_data(self, filepath: str, columns: list = None) -> UsageFrame:
+        if os.path.isdir(filepath):
+            # Segment storage: read only the needed columns and day partitions
+            return UsageFrame(SegmentStorage(filepath).read(columns=columns, past_days=self.PAST_DAYS))
+        return UsageFrame.read_csv(filepath, columns)
+
+    def get_past_days_usage(self, usage: UsageFrame, past_days: int = 1) -> UsageFrame:
+        if not isinstance(usage, UsageFrame):
+            usage = UsageFrame(usage)
+        return usage.past_days(past_days)
+
+    def _sample_weights(self, host_df: pd.DataFrame):
+        """
+        Seconds each sample of one host stands for, from the Interval(s) column,
+        so bursts of samples don't outweigh the hours sampled at the base rate.
+        Samples without an interval get the host's median one, so the weights
+        depend on that host's data only. None when all samples weigh the same.
+        """
+        if INTERVAL_COLUMN not in host_df.columns:
+            return None
+        values = host_df[INTERVAL_COLUMN].to_numpy(dtype=np.float64)
+        known = np.isfinite(values) & (values > 0)
+        if not known.any():
+            return None
+        median = np.median(values[known])
+        weights = np.where(known, values, median)
+        return None if (weights == median).all() else weights
 
     def _custom_date_formatter(self, x, pos):
         timestamp = mdates.num2date(x)
@@ -49,15 +141,20 @@ class ResourceReport(ABC):
         axes = axes.flatten() if isinstance(axes, np.ndarray) else [axes]
         return fig, axes
 
-    def plot_timeseries_trend(self, usage_df: pd.DataFrame, y_col: str, past_days=8, color="blue", save_path="timeseries_trend.jpg"):
-        df = self.get_past_days_usage(usage_df, past_days)
-        hostnames = sorted(df['Hostname'].unique())
+    def plot_timeseries_trend(self, usage: UsageFrame, y_col: str, past_days=8, color="blue", save_path="timeseries_trend.jpg"):
+        usage = self.get_past_days_usage(usage, past_days)
+        hostnames = usage.hostnames
         fig, axes = self._prepare_axes(len(hostnames))
 
         for i, hostname in enumerate(hostnames):
             ax = axes[i]
-            sns.lineplot(data=df[df['Hostname'] == hostname], x='Timestamp', y=y_col, ax=ax, color=color)
-            ax.set_title(f'{y_col} Trend for {hostname} @ {self.now}')
+            if self.FAST:
+                self._plot_decimated_line(ax, usage.host(hostname), y_col, color)
+            else:
+                sns.lineplot(data=usage.host(hostname), x='Timestamp', y=y_col, ax=ax, color=color)
+            # The last sample's time rather than the report's, so the chart can be cached while the data is unchanged
+            last_sample = usage.host(hostname)['Timestamp'].iloc[-1]
+            ax.set_title(f'{y_col} Trend for {hostname} @ {last_sample:%Y-%m-%d_%H:%M:%S}')
             ax.set_ylim(0, 100)
             ax.xaxis.set_major_locator(mdates.HourLocator(byhour=[0, 12]))
             ax.xaxis.set_minor_locator(mdates.HourLocator(byhour=[0, 6, 12, 18]))
@@ -67,36 +164,112 @@ class ResourceReport(ABC):
             ax.grid(True, which='minor', axis='x', linestyle=':', linewidth=0.5)
 
         plt.tight_layout()
-        plt.savefig(save_path, dpi=200)
+        plt.savefig(save_path, dpi=self.SAVE_DPI)
 
-    def _plot_categorical_strip(self, usage_df, y_col, category, past_days, recent_days, color, recent_color, save_path, title_suffix):
-        df_all = self.get_past_days_usage(usage_df, past_days)
-        df_recent = self.get_past_days_usage(usage_df, recent_days)
-        df_all[category] = getattr(df_all['Timestamp'].dt, category)
-        df_recent[category] = getattr(df_recent['Timestamp'].dt, category)
+    def _plot_categorical_strip(self, usage, y_col, category, past_days, recent_days, color, recent_color, save_path, title_suffix):
+        usage_all = self.get_past_days_usage(usage, past_days)
+        usage_recent = self.get_past_days_usage(usage, recent_days)
 
         if category == "dayofweek":
             mapper = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         else:  # hour
             mapper = list(range(24))
 
-        df_all[category] = pd.Categorical(df_all[category], categories=mapper, ordered=True)
-        df_recent[category] = pd.Categorical(df_recent[category], categories=mapper, ordered=True)
+        def categories(host_df):
+            # dt.dayofweek/dt.hour are positions in mapper
+            codes = getattr(host_df['Timestamp'].dt, category)
+            return pd.Series(pd.Categorical.from_codes(codes, categories=mapper, ordered=True), index=host_df.index, name=category)
 
-        hostnames = sorted(df_all['Hostname'].unique())
+        hostnames = usage_all.hostnames
         fig, axes = self._prepare_axes(len(hostnames))
 
+        if self.FAST:
+            stats_all = self._category_stats(usage_all, category, y_col, hostnames, len(mapper))
+            stats_recent = self._category_stats(usage_recent, category, y_col, hostnames, len(mapper))
+
         for i, hostname in enumerate(hostnames):
             ax = axes[i]
-            sns.stripplot(data=df_all[df_all['Hostname'] == hostname], x=category, y=y_col, ax=ax, color=color)
-            sns.stripplot(data=df_recent[df_recent['Hostname'] == hostname], x=category, y=y_col, ax=ax, color=recent_color)
+            if self.FAST:
+                self._draw_category_stats(ax, stats_all[i], color, offset=-0.15)
+                self._draw_category_stats(ax, stats_recent[i], recent_color, offset=0.15)
+                ax.set_xticks(range(len(mapper)), mapper)
+                ax.set_xlim(-0.5, len(mapper) - 0.5)
+                ax.set_xlabel(category)
+                ax.set_ylabel(y_col)
+            else:
+                for host_df, strip_color in [(usage_all.host(hostname), color), (usage_recent.host(hostname), recent_color)]:
+                    sns.stripplot(x=categories(host_df), y=host_df[y_col], ax=ax, color=strip_color)
             ax.set_title(f'{y_col} {title_suffix} for {hostname}')
             ax.set_ylim(0, 100)
             ax.tick_params(axis='x', rotation=90)
             ax.grid(True, which='major', axis='x', linestyle='--', linewidth=0.5)
 
         plt.tight_layout()
-        plt.savefig(save_path, dpi=200)
+        plt.savefig(save_path, dpi=self.SAVE_DPI)
+
+    def _plot_decimated_line(self, ax, host_df: pd.DataFrame, y_col: str, color: str):
+        """Draw the min/max envelope of each pixel column instead of every sample."""
+        n_pixels = int(ax.bbox.width * self.SAVE_DPI / ax.figure.dpi)
+        points = None
+        if self.CACHE is not None:
+            key = ReportCache.key("trend", y_col, n_pixels, ReportCache.watermark(host_df))
+            points = self.CACHE.get_arrays(key)
+        if points is None:
+            # Host slices of a UsageFrame are already in time order
+            x = host_df['Timestamp'].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+            y = host_df[y_col].to_numpy(dtype=np.float64)
+            index = minmax_decimate(x, y, n_pixels)
+            points = {"x": x[index], "y": y[index]}
+            if self.CACHE is not None:
+                self.CACHE.put_arrays(key, points)
+        timestamps = pd.to_datetime(points["x"], unit="ns", utc=True).tz_convert(host_df['Timestamp'].dt.tz)
+        ax.plot(timestamps, points["y"], color=color, linewidth=0.8)
+        ax.set_xlabel('Timestamp')
+        ax.set_ylabel(y_col)
+
+    def _category_stats(self, usage: UsageFrame, category: str, y_col: str, hostnames: list, n_buckets: int):
+        """
+        Per-host (p5, p25, p50, p75, p95) of y_col per `category` bucket (dt.hour or
+        dt.dayofweek), as an array of shape (hosts, 5, buckets).
+        """
+        stats = np.full((len(hostnames), 5, n_buckets), np.nan)
+        keys = {}
+        if self.CACHE is not None:
+            # Only hosts whose data changed since the cached aggregates are recomputed
+            watermark = ReportCache.watermark(usage)
+            for host_mark in watermark[1:]:
+                keys[host_mark[0]] = ReportCache.key("category_stats", y_col, n_buckets, watermark[0], host_mark)
+            for i, hostname in enumerate(hostnames):
+                cached = self.CACHE.get_arrays(keys[str(hostname)]) if str(hostname) in keys else None
+                if cached is not None:
+                    stats[i] = cached["stats"]
+        for i, hostname in enumerate(hostnames):
+            if not np.isnan(stats[i]).all():
+                continue
+            host_df = usage.host(hostname)
+            bucket = getattr(host_df['Timestamp'].dt, category).to_numpy(dtype=np.int64)
+            quantiles, counts = group_quantiles(
+                bucket, host_df[y_col].to_numpy(dtype=np.float64), n_buckets, weights=self._sample_weights(host_df)
+            )
+            stats[i] = quantiles
+            if str(hostname) in keys:
+                self.CACHE.put_arrays(keys[str(hostname)], {"stats": quantiles})
+        return stats
+
+    def _draw_category_stats(self, ax, stats: np.ndarray, color: str, offset: float, width: float = 0.25):
+        """Draw p5-p95 whiskers, p25-p75 boxes and p50 marks for each bucket with data."""
+        p5, p25, p50, p75, p95 = stats
+        x = np.arange(len(p50)) + offset
+        present = ~np.isnan(p50)
+        x, p5, p25, p50, p75, p95 = (values[present] for values in (x, p5, p25, p50, p75, p95))
+        left, right = x - width / 2, x + width / 2
+        ax.add_collection(LineCollection(np.stack([np.column_stack([x, p5]), np.column_stack([x, p95])], axis=1),
+                                         colors=color, linewidths=0.8))
+        boxes = np.stack([np.column_stack([left, p25]), np.column_stack([right, p25]),
+                          np.column_stack([right, p75]), np.column_stack([left, p75])], axis=1)
+        ax.add_collection(PolyCollection(boxes, facecolors=color, edgecolors=color, alpha=0.5))
+        ax.add_collection(LineCollection(np.stack([np.column_stack([left, p50]), np.column_stack([right, p50])], axis=1),
+                                         colors="black", linewidths=1.0))
 
     def plot_dayofweek_boxplot(self, usage_df, y_col, past_days=28, color="blue", save_path="dayofweek_boxplot.jpg"):
         self._plot_categorical_strip(usage_df, y_col, "dayofweek", past_days, 7, color, "orange", save_path, "by Day")
@@ -104,6 +277,50 @@ class ResourceReport(ABC):
     def plot_hour_boxplot(self, usage_df, y_col, past_days=28, color="blue", save_path="hour_boxplot.jpg"):
         self._plot_categorical_strip(usage_df, y_col, "hour", past_days, 7, color, "orange", save_path, "by Hour")
 
+    def _chart_cache_key(self, method: str, args: tuple, kwargs: dict):
+        if self.CACHE is None or method not in self.CACHEABLE_CHARTS or not args:
+            return None
+        options = sorted((name, value) for name, value in kwargs.items() if name != "save_path")
+        return ReportCache.key(
+            "chart", method, self.FAST, self.SAVE_DPI, self.CHART_SEED, options, ReportCache.watermark(args[0])
+        )
+
+    def render_chart(self, method: str, *args, **kwargs):
+        key = self._chart_cache_key(method, args, kwargs)
+        if key is not None:
+            data = self.CACHE.get(key)
+            if data is not None:
+                with open(kwargs["save_path"], "wb") as file:
+                    file.write(data)
+                return
+
+        np.random.seed(self.CHART_SEED)
+        getattr(self, method)(*args, **kwargs)
+        plt.close("all")
+
+        if key is not None:
+            with open(kwargs["save_path"], "rb") as file:
+                self.CACHE.put(key, file.read())
+
+    def render_charts(self, jobs: list, n_workers: int = None):
+        """
+        Render (method, args, kwargs) chart jobs, in parallel on a forked
+        process pool when possible. The output is identical to n_workers=1.
+        """
+        if n_workers is None:
+            n_workers = min(len(jobs), os.cpu_count() or 1)
+        if n_workers <= 1 or "fork" not in multiprocessing.get_all_start_methods():
+            for method, args, kwargs in jobs:
+                self.render_chart(method, *args, **kwargs)
+            return
+
+        _CHART_JOBS[:] = [(self, method, args, kwargs) for method, args, kwargs in jobs]
+        try:
+            with ProcessPoolExecutor(max_workers=n_workers, mp_context=multiprocessing.get_context("fork")) as pool:
+                list(pool.map(_render_chart_job, range(len(jobs))))
+        finally:
+            _CHART_JOBS.clear()
+
     def merge_images(self, image_files, direction="vertical", save_path="combined.jpg"):
         images = [Image.open(p) for p in image_files]
         widths, heights = zip(*(i.size for i in images))
@@ -121,19 +338,25 @@ class ResourceReport(ABC):
                 offset += img.width
         new_img.save(save_path)
 
-    def report(self, report_to: str = "slack"):
-        self.plot_timeseries_trend(self.cpu_usage_df, y_col="CPU Usage(%)", save_path="img/timeseries_trend_cpu.jpg")
-        self.plot_dayofweek_boxplot(self.cpu_usage_df, y_col="CPU Usage(%)", save_path="img/dayofweek_boxplot_cpu.jpg")
-        self.plot_hour_boxplot(self.cpu_usage_df, y_col="CPU Usage(%)", save_path="img/hour_boxplot_cpu.jpg")
+    def report(self, report_to: str = "slack", n_workers: int = None):
+        # Load and slice the data once in the parent; the charts are independent
+        jobs = []
+        for kind, y_col in [("cpu", "CPU Usage(%)"), ("gpu", "GPU Util(%)")]:
+            trend_df = self.get_past_days_usage(self.get_usage_data(kind, y_col, 8), 8)
+            categorical_df = self.get_past_days_usage(self.get_usage_data(kind, y_col, 28), 28)
+            jobs += [
+                ("plot_timeseries_trend", (trend_df,), {"y_col": y_col, "save_path": f"img/timeseries_trend_{kind}.jpg"}),
+                ("plot_dayofweek_boxplot", (categorical_df,), {"y_col": y_col, "save_path": f"img/dayofweek_boxplot_{kind}.jpg"}),
+                ("plot_hour_boxplot", (categorical_df,), {"y_col": y_col, "save_path": f"img/hour_boxplot_{kind}.jpg"}),
+            ]
+        self.render_charts(jobs, n_workers=n_workers)
+
         self.merge_images(
             ["img/timeseries_trend_cpu.jpg", "img/dayofweek_boxplot_cpu.jpg", "img/hour_boxplot_cpu.jpg"],
             direction="vertical",
             save_path="img/combined_image_cpu.jpg"
         )
 
-        self.plot_timeseries_trend(self.gpu_usage_df, y_col="GPU Util(%)", save_path="img/timeseries_trend_gpu.jpg")
-        self.plot_dayofweek_boxplot(self.gpu_usage_df, y_col="GPU Util(%)", save_path="img/dayofweek_boxplot_gpu.jpg")
-        self.plot_hour_boxplot(self.gpu_usage_df, y_col="GPU Util(%)", save_path="img/hour_boxplot_gpu.jpg")
         self.merge_images(
             ["img/timeseries_trend_gpu.jpg", "img/dayofweek_boxplot_gpu.jpg", "img/hour_boxplot_gpu.jpg"],
             direction="vertical",
@@ -149,9 +372,34 @@ class ResourceReport(ABC):
         if report_to == "slack":
             notificator = SlackNotificator()
             notificator.post_message_with_files("Resource Report", 'img/combined_image.jpg')
+            # Undelivered reports are spooled and sent by the next run
+            notificator.close()
 
 
 if __name__ == "__main__":
-    clean_usage()
-    report = ResourceReport()
-    report.report()
+    parser = argparse.ArgumentParser(description="Report CPU and GPU usage to Slack.")
+    parser.add_argument(
+        "--storage", choices=["csv", "segment"], default="csv",
+        help="Read cpu_usage.csv/gpu_usage.csv, or the cpu_usage/gpu_usage segment directories."
+    )
+    parser.add_argument(
+        "--fast", action="store_true",
+        help="Draw per-bucket quantiles and decimated lines instead of every raw sample."
+    )
+    parser.add_argument(
+        "--cache_dir", type=str, default=".report_cache",
+        help="Directory of the incremental chart cache; pass an empty string to disable it."
+    )
+    parser.add_argument(
+        "--workers", type=int, default=None,
+        help="Number of processes rendering charts in parallel (default: one per chart, up to the CPU count)."
+    )
+    args = parser.parse_args()
+
+    if args.storage == "segment":
+        clean_usage("cpu_usage", "gpu_usage")
+        report = ResourceReport("cpu_usage", "gpu_usage", fast=args.fast, cache_dir=args.cache_dir)
+    else:
+        clean_usage()
+        report = ResourceReport(fast=args.fast, cache_dir=args.cache_dir)
+    report.report(n_workers=args.workers)
@@ -0,0 +1,92 @@
+import hashlib
+import io
+import os
+import numpy as np
+import pandas as pd
+
+from usage_frame import UsageFrame
+
+
+class ReportCache:
+    """
+    Size-bounded on-disk cache of chart aggregates and rendered charts.
+
+    Entries are keyed by a hash of their inputs, which include the data
+    watermark (last timestamp and row count per host), so an entry is reused
+    exactly as long as the data behind it is unchanged. Reads refresh an
+    entry's mtime and the least recently used entries are evicted once the
+    cache exceeds max_bytes.
+    """
+
+    def __init__(self, cache_dir: str = ".report_cache", max_bytes: int = 256 * 1024 ** 2):
+        self.CACHE_DIR = cache_dir
+        self.MAX_BYTES = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+    @staticmethod
+    def watermark(df: pd.DataFrame) -> tuple:
+        """(first timestamp, ((host, last timestamp, rows), ...)) of a frame or UsageFrame."""
+        if isinstance(df, UsageFrame):
+            return df.watermark()
+        if len(df) == 0:
+            return ()
+        grouped = df.groupby('Hostname', observed=True)['Timestamp'].agg(['max', 'size'])
+        return (str(df['Timestamp'].min()),) + tuple(
+            (str(hostname), str(row['max']), int(row['size'])) for hostname, row in grouped.iterrows()
+        )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.CACHE_DIR, key)
+
+    def get(self, key: str):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as file:
+                data = file.read()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def put(self, key: str, data: bytes):
+        tmp_path = f"{self._path(key)}.tmp.{os.getpid()}"
+        with open(tmp_path, "wb") as file:
+            file.write(data)
+        os.replace(tmp_path, self._path(key))
+        self.evict()
+
+    def get_arrays(self, key: str):
+        data = self.get(key)
+        if data is None:
+            return None
+        with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+            return {name: arrays[name] for name in arrays.files}
+
+    def put_arrays(self, key: str, arrays: dict):
+        buffer = io.BytesIO()
+        np.savez(buffer, **arrays)
+        self.put(key, buffer.getvalue())
+
+    def evict(self):
+        entries = []
+        for name in os.listdir(self.CACHE_DIR):
+            if ".tmp." in name:
+                continue
+            try:
+                stat = os.stat(self._path(name))
+            except FileNotFoundError:  # evicted by another process
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in sorted(entries):
+            if total <= self.MAX_BYTES:
+                break
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+            total -= size
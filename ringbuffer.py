@@ -0,0 +1,109 @@
+import os
+import numpy as np
+
+MAGIC = b"RMRING01"
+HEADER_SIZE = 64
+# reserved is advanced before a write and head after it, so readers can tell
+# which records a write in progress may be overwriting
+HEADER_DTYPE = np.dtype([
+    ("magic", "S8"), ("capacity", "<u8"), ("record_size", "<u8"), ("head", "<u8"), ("reserved", "<u8")
+])
+
+
+class RingBuffer:
+    """
+    Fixed-size ring of numpy records in a memory-mapped file.
+
+    The file is a 64-byte header followed by `capacity` records of `dtype`.
+    `head` counts the records ever written; record i lives at slot
+    i % capacity. A single writer appends time-ordered records and advances
+    head after the data is in place. Readers map the same file read-only and
+    get views of it, so the file size (and memory) stays fixed and queries
+    don't copy or disturb the writer. Put the file on /dev/shm to keep it in
+    shared memory.
+
+    Records a reader holds may be overwritten once the writer laps them;
+    check overwritten() after using them.
+    """
+
+    def __init__(self, path: str, dtype: np.dtype, capacity: int = None, readonly: bool = False):
+        self.PATH = path
+        self.DTYPE = np.dtype(dtype)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if readonly:
+            header = np.memmap(path, dtype=HEADER_DTYPE, mode="r", shape=(1,))
+            if header["magic"][0] != MAGIC or header["record_size"][0] != self.DTYPE.itemsize:
+                raise ValueError(f"{path} is not a ring buffer of this record type.")
+            capacity = int(header["capacity"][0])
+        else:
+            if capacity is None:
+                raise ValueError("A capacity is needed to create a ring buffer.")
+            if size != HEADER_SIZE + capacity * self.DTYPE.itemsize:
+                # (Re)create: ftruncate leaves the file sparse until written
+                with open(path, "wb") as file:
+                    file.truncate(HEADER_SIZE + capacity * self.DTYPE.itemsize)
+                header = np.memmap(path, dtype=HEADER_DTYPE, mode="r+", shape=(1,))
+                header[0] = (MAGIC, capacity, self.DTYPE.itemsize, 0, 0)
+            header = np.memmap(path, dtype=HEADER_DTYPE, mode="r+", shape=(1,))
+            if header["magic"][0] != MAGIC or header["record_size"][0] != self.DTYPE.itemsize:
+                raise ValueError(f"{path} is not a ring buffer of this record type.")
+        self.CAPACITY = capacity
+        self._header = header
+        self._records = np.memmap(path, dtype=self.DTYPE, mode="r" if readonly else "r+",
+                                  offset=HEADER_SIZE, shape=(capacity,))
+
+    @property
+    def head(self) -> int:
+        return int(self._header["head"][0])
+
+    def append(self, records: np.ndarray):
+        """Copy records into the next slots, wrapping around, then publish them."""
+        n = len(records)
+        if n == 0:
+            return
+        head = self.head
+        self._header["reserved"][0] = head + n
+        if n > self.CAPACITY:
+            # Only the last lap survives
+            head, records = head + n - self.CAPACITY, records[-self.CAPACITY:]
+        start = head % self.CAPACITY
+        first = min(len(records), self.CAPACITY - start)
+        self._records[start:start + first] = records[:first]
+        if first < len(records):
+            self._records[:len(records) - first] = records[first:]
+        self._header["head"][0] = head + len(records)
+
+    def views(self, since: float = None, time_field: str = "time"):
+        """
+        (oldest record number, [views]) of the records with `time_field` >= since,
+        oldest first, as up to two views of the mapped file.
+        """
+        head = self.head
+        oldest = max(0, head - self.CAPACITY)
+        if head == oldest:
+            return head, []
+        start, end = oldest % self.CAPACITY, head % self.CAPACITY
+        if end <= start:
+            segments = [(oldest, self._records[start:]), (oldest + self.CAPACITY - start, self._records[:end])]
+        else:
+            segments = [(oldest, self._records[start:end])]
+        segments = [(number, view) for number, view in segments if len(view)]
+        if since is None:
+            return oldest, [view for _, view in segments]
+
+        views, first_number = [], None
+        for number, view in segments:
+            i = int(np.searchsorted(view[time_field], since, side="left"))
+            if i < len(view):
+                if first_number is None:
+                    first_number = number + i
+                views.append(view[i:])
+        return (first_number if first_number is not None else head), views
+
+    def overwritten(self, first_number: int) -> bool:
+        """Whether records from `first_number` on may have been overwritten since views() returned."""
+        return int(self._header["reserved"][0]) - self.CAPACITY > first_number
+
+    def close(self):
+        self._records.flush()
+        self._header.flush()
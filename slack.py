@@ -1,50 +1,289 @@
+import json
 import os
+import queue
+import shutil
+import threading
+import time
+import traceback
+import uuid
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from dotenv import load_dotenv
 
+from storage import FileLock
+
 # https://tools.slack.dev/python-slack-sdk/web/
 
+load_dotenv()
+
+# One client and auth.test result per (token, base_url), shared by every SlackNotificator in the process
+_CLIENTS = {}
+_AUTH_RESPONSES = {}
+_CLIENTS_LOCK = threading.Lock()
+
+# https://api.slack.com/methods/chat.postMessage#errors
+# Errors that retrying won't fix: the message goes to the dead-letter file instead
+PERMANENT_ERRORS = {
+    "channel_not_found", "not_in_channel", "is_archived", "invalid_auth", "not_authed",
+    "account_inactive", "token_revoked", "token_expired", "missing_scope", "no_permission",
+    "msg_too_long", "no_text", "invalid_arguments", "invalid_blocks", "too_many_attachments",
+}
+
+
+def get_client(token: str, base_url: str) -> WebClient:
+    with _CLIENTS_LOCK:
+        if (token, base_url) not in _CLIENTS:
+            _CLIENTS[(token, base_url)] = WebClient(token=token, base_url=base_url)
+        return _CLIENTS[(token, base_url)]
+
+
 class SlackNotificator():
-    def __init__(self):
-        load_dotenv()
-        self.SLACK_BOT_TOKEN = os.getenv('SLACK_BOT_TOKEN')
-        self.SLACK_CHANNEL_ID = os.getenv('SLACK_CHANNEL_ID')
-        self.CLIENT = WebClient(token=self.SLACK_BOT_TOKEN)
-        # https://api.slack.com/methods/auth.test
-        self.AUTH_RESPONSE = self._test_authorize()  
+    """
+    Post messages and files to a Slack channel from a background thread.
+
+    post_message() and post_message_with_files() only enqueue and never block
+    on Slack. Queued text messages are sent in batches of up to `batch_size`
+    as one message. Failed calls are retried with exponential backoff, and a
+    rate limit (429) waits for its Retry-After. Messages that still can't be
+    delivered, or don't fit in the bounded queue, are persisted to
+    `spool_path` and redelivered before the next message or on the next start,
+    so messages arrive in order. The spool is guarded by a FileLock, since
+    every process in the working directory shares it by default. Messages
+    Slack rejects for good (PERMANENT_ERRORS, a missing file) or that failed
+    `max_redeliveries` redeliveries are moved to `<spool_path>.dead` so they
+    don't hold back newer ones. Call close() to wait for delivery before exiting.
+    """
 
-    def _test_authorize(self):
-        auth_test = self.CLIENT.auth_test()
-        assert auth_test["ok"] is True
+    def __init__(self, token: str = None, channel_id: str = None, base_url: str = "https://slack.com/api/",
+                 spool_path: str = "slack_spool.jsonl", max_queue: int = 1000, batch_size: int = 20,
+                 max_retries: int = 5, retry_delay: float = 1.0, max_retry_delay: float = 60.0,
+                 max_redeliveries: int = 10):
+        self.SLACK_BOT_TOKEN = token or os.getenv('SLACK_BOT_TOKEN')
+        self.SLACK_CHANNEL_ID = channel_id or os.getenv('SLACK_CHANNEL_ID')
+        self.BASE_URL = base_url
+        self.CLIENT = get_client(self.SLACK_BOT_TOKEN, base_url)
+        self.SPOOL_PATH = spool_path
+        # Copies of spooled files, so later reports don't overwrite them
+        self.SPOOL_FILES_DIR = f"{spool_path}.files"
+        self.DEAD_LETTER_PATH = f"{spool_path}.dead"
+        self.BATCH_SIZE = batch_size
+        self.MAX_RETRIES = max_retries
+        self.RETRY_DELAY = retry_delay
+        self.MAX_RETRY_DELAY = max_retry_delay
+        self.MAX_REDELIVERIES = max_redeliveries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._spool_lock = threading.RLock()
+        self._spool_file_lock = FileLock(spool_path)
+        self._stop_event = threading.Event()
+        self._held = []
+        self._thread = None
+        self._closed = False
+
+    @property
+    def AUTH_RESPONSE(self):
+        # https://api.slack.com/methods/auth.test
+        key = (self.SLACK_BOT_TOKEN, self.BASE_URL)
+        if key not in _AUTH_RESPONSES:
+            auth_test = self.CLIENT.auth_test()
+            assert auth_test["ok"] is True
+            _AUTH_RESPONSES[key] = auth_test.data
+        return _AUTH_RESPONSES[key]
 
     def get_bot_user_id(self):
         return self.AUTH_RESPONSE["user_id"]
-    
-    def post_message(self, message: str):
+
+    def post_message(self, message: str) -> bool:
+        """Queue a message. Returns False if the queue was full and it was spooled instead."""
+        return self._enqueue({"message": message, "filepath": None})
+
+    def post_message_with_files(self, message: str, filepath: str) -> bool:
+        return self._enqueue({"message": message, "filepath": filepath})
+
+    def _enqueue(self, item: dict) -> bool:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
         try:
-            response = self.CLIENT.chat_postMessage(
-                channel=self.SLACK_CHANNEL_ID,
-                text=message
-            )
-            return response
-        except SlackApiError as e:
-            # You will get a SlackApiError if "ok" is False
-            assert e.response["error"]    # str like 'invalid_auth', 'channel_not_found'
+            self._queue.put_nowait(item)
+        except queue.Full:
+            self._spool([item])
+            return False
+        return True
 
-    def post_message_with_files(self, message: str, filepath: str):
+    def _next_batch(self, item: dict) -> list:
+        """Merge queued text messages following `item` into one, up to BATCH_SIZE."""
+        if item["filepath"] is not None:
+            return [item]
+        batch = [item]
+        while len(batch) < self.BATCH_SIZE:
+            try:
+                following = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if following is None or following["filepath"] is not None:
+                # Keep the order: handle it after this batch
+                self._held.append(following)
+                break
+            batch.append(following)
+        return batch
+
+    def _run(self):
         try:
-            response = self.CLIENT.files_upload_v2(
+            self._redeliver_spool()
+        except Exception:
+            traceback.print_exc()
+        while True:
+            item = self._held.pop() if self._held else self._queue.get()
+            if item is None:
+                break
+            # One bad message must not kill the worker, or every later one would pile up in the queue
+            try:
+                batch = self._next_batch(item)
+                # Spooled messages are older, so they go first; while any are left, the batch is spooled behind them
+                if self._stop_event.is_set() or not self._redeliver_spool() or not self._deliver(batch):
+                    self._spool(batch)
+            except Exception:
+                traceback.print_exc()
+
+    def _send(self, batch: list):
+        self.AUTH_RESPONSE
+        message = "\n".join(item["message"] for item in batch)
+        if batch[0]["filepath"] is not None:
+            return self.CLIENT.files_upload_v2(
                 channel=self.SLACK_CHANNEL_ID,
-                file=filepath,
+                file=batch[0]["filepath"],
                 initial_comment=message,
             )
-            return response
-        except SlackApiError as e:
-            assert e.response["error"]
+        return self.CLIENT.chat_postMessage(
+            channel=self.SLACK_CHANNEL_ID,
+            text=message
+        )
+
+    def _deliver(self, batch: list) -> bool:
+        """
+        Send a batch, retrying with backoff. Returns False if it should be spooled and
+        retried later; a batch Slack rejects for good is dead-lettered and counts as done.
+        """
+        filepath = batch[0]["filepath"]
+        if filepath is not None and not os.path.isfile(filepath):
+            self._dead_letter(batch, f"file not found: {filepath}")
+            return True
+        delay = self.RETRY_DELAY
+        for attempt in range(self.MAX_RETRIES):
+            try:
+                self._send(batch)
+                if batch[0].get("spooled"):
+                    os.remove(filepath)
+                return True
+            except SlackApiError as e:
+                # You will get a SlackApiError if "ok" is False
+                error = e.response.get("error")
+                if error in PERMANENT_ERRORS:
+                    self._dead_letter(batch, error)
+                    return True
+                if e.response.status_code == 429:
+                    wait = float(e.response.headers.get("Retry-After", delay))
+                else:
+                    print(f"Slack API error: {error}")
+                    wait = delay
+            except Exception:
+                traceback.print_exc()
+                wait = delay
+            if attempt + 1 < self.MAX_RETRIES and self._stop_event.wait(wait):
+                break
+            delay = min(delay * 2, self.MAX_RETRY_DELAY)
+        return False
+
+    def _spool_item(self, item: dict) -> dict:
+        if item["filepath"] is None or item.get("spooled"):
+            return item
+        try:
+            os.makedirs(self.SPOOL_FILES_DIR, exist_ok=True)
+            copy_path = os.path.join(self.SPOOL_FILES_DIR, f"{uuid.uuid4().hex}_{os.path.basename(item['filepath'])}")
+            shutil.copyfile(item["filepath"], copy_path)
+        except OSError:
+            traceback.print_exc()
+            # Still send the text, e.g. if the report it came with is gone
+            return {"message": item["message"], "filepath": None}
+        return {"message": item["message"], "filepath": copy_path, "spooled": True}
+
+    def _spool(self, batch: list):
+        with self._spool_lock, self._spool_file_lock:
+            with open(self.SPOOL_PATH, mode="a") as file:
+                for item in batch:
+                    file.write(json.dumps(self._spool_item(item)) + "\n")
+
+    def _dead_letter(self, batch: list, error: str):
+        print(f"Slack message dropped ({error}), kept in {self.DEAD_LETTER_PATH}")
+        with self._spool_lock, self._spool_file_lock:
+            with open(self.DEAD_LETTER_PATH, mode="a") as file:
+                for item in batch:
+                    file.write(json.dumps({"message": item["message"], "filepath": item["filepath"], "error": error}) + "\n")
+
+    def _redeliver_spool(self) -> bool:
+        """Resend spooled messages in order, keeping the ones that still fail. Returns whether all were sent."""
+        with self._spool_lock, self._spool_file_lock:
+            if not os.path.exists(self.SPOOL_PATH):
+                return True
+            with open(self.SPOOL_PATH, mode="r") as file:
+                items = [json.loads(line) for line in file if line.endswith("\n")]
+            os.remove(self.SPOOL_PATH)
+        for i, item in enumerate(items):
+            if self._stop_event.is_set():
+                self._respool(items[i:])
+                return False
+            if not self._deliver([item]):
+                item["attempts"] = item.get("attempts", 0) + 1
+                if item["attempts"] < self.MAX_REDELIVERIES:
+                    self._respool(items[i:])
+                    return False
+                self._dead_letter([item], f"failed {item['attempts']} redeliveries")
+        return True
+
+    def _respool(self, items: list):
+        """Put undelivered spooled items back at the head of the spool, before any spooled since it was read."""
+        with self._spool_lock, self._spool_file_lock:
+            tmp_path = f"{self.SPOOL_PATH}.tmp"
+            with open(tmp_path, mode="w") as file:
+                for item in items:
+                    file.write(json.dumps(item) + "\n")
+                if os.path.exists(self.SPOOL_PATH):
+                    with open(self.SPOOL_PATH, mode="r") as newer:
+                        shutil.copyfileobj(newer, file)
+            os.replace(tmp_path, self.SPOOL_PATH)
+
+    def close(self, timeout: float = 60.0):
+        """Wait up to `timeout` seconds for queued messages, then spool the rest."""
+        if self._closed or self._thread is None:
+            self._closed = True
+            return
+        self._closed = True
+        deadline = time.monotonic() + timeout
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(max(deadline - time.monotonic(), 0))
+        if self._thread.is_alive():
+            # Abort backoff waits; the worker spools what it's holding and exits
+            self._stop_event.set()
+            self._thread.join(self.RETRY_DELAY + 30)
+            remaining = []
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is not None:
+                    remaining.append(item)
+            if remaining:
+                self._spool(remaining)
+        self._spool_file_lock.close()
+
 
-if __name__ == "__main__": 
+if __name__ == "__main__":
     notificator = SlackNotificator()
     message = "test message"
     filepath = "cat.jpg"
-    notificator.post_message_with_files(message, filepath)
\ No newline at end of file
+    notificator.post_message_with_files(message, filepath)
+    notificator.close()
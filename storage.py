@@ -0,0 +1,836 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+import csv
+import fcntl
+import io
+import os
+import shutil
+import time
+import json
+import numpy as np
+import pandas as pd
+import requests
+
+# Naive timestamps written by the monitors are interpreted in this timezone,
+# the same one ResourceReport localizes to
+TIMEZONE = "Asia/Tokyo"
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+# Seconds each sample stands for, used to weight averages of unevenly spaced samples
+INTERVAL_COLUMN = "Interval(s)"
+
+
+class FileLock:
+    """
+    Exclusive flock on <path>.lock, shared by CSV writers and clean_usage.
+
+    The lock lives in a separate file so it survives the data file being
+    atomically replaced.
+    """
+
+    def __init__(self, path: str):
+        self.LOCK_PATH = f"{path}.lock"
+        self._fd = None
+
+    def __enter__(self):
+        if self._fd is None:
+            self._fd = os.open(self.LOCK_PATH, os.O_RDWR | os.O_CREAT, 0o644)
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+class BufferedCSVWriter:
+    """
+    Append rows to a CSV file through a single, long-lived file descriptor.
+
+    The header is validated (or created) once when the file is opened. Rows are
+    buffered in memory and flushed by row count, by age or on close, each batch
+    with one O_APPEND write so readers never see half a line. Flushes hold the
+    FileLock, and the file is reopened if clean_usage replaced it meanwhile.
+    """
+
+    def __init__(self, path: str, columns: list, max_rows: int = 1, flush_interval: float = None):
+        self.PATH = path
+        self.COLUMNS = columns
+        self.MAX_ROWS = max_rows
+        self.FLUSH_INTERVAL = flush_interval
+        self._fd = None
+        self._lock = FileLock(path)
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._n_rows = 0
+        self._first_row_time = None
+
+    def _ensure_header(self):
+        header = io.StringIO()
+        csv.writer(header).writerow(self.COLUMNS)
+        header = header.getvalue().encode()
+
+        if not os.path.exists(self.PATH) or os.path.getsize(self.PATH) == 0:
+            with open(self.PATH, mode="wb") as file:
+                file.write(header)
+            return
+
+        with open(self.PATH, mode="r", newline="") as file:
+            first_row = next(csv.reader(file), None)
+        if first_row == self.COLUMNS:
+            return
+
+        # Replace a stale header, or prepend one if the file starts with data,
+        # by rewriting into a temporary file so no row is ever lost
+        tmp_path = f"{self.PATH}.tmp.{os.getpid()}"
+        with open(self.PATH, mode="rb") as src, open(tmp_path, mode="wb") as dst:
+            dst.write(header)
+            first_line = src.readline()
+            if not (first_row and first_row[0] == self.COLUMNS[0]):
+                dst.write(first_line)
+                first_row = None
+            if first_row and len(first_row) < len(self.COLUMNS) and self.COLUMNS[:len(first_row)] == first_row:
+                # Columns were added at the end: pad the old rows with empty values
+                padding = b"," * (len(self.COLUMNS) - len(first_row))
+                for line in src:
+                    if line.strip():
+                        line = line.rstrip(b"\r\n") + padding + b"\n"
+                    dst.write(line)
+            while chunk := src.read(1024 ** 2):
+                dst.write(chunk)
+        os.replace(tmp_path, self.PATH)
+
+    def _replaced(self):
+        try:
+            return os.stat(self.PATH).st_ino != os.fstat(self._fd).st_ino
+        except FileNotFoundError:
+            return True
+
+    def open(self):
+        """Open the file for appending. Call while holding the lock."""
+        if self._fd is not None:
+            if not self._replaced():
+                return
+            os.close(self._fd)
+            self._fd = None
+        self._ensure_header()
+        self._fd = os.open(self.PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        # Terminate a torn last line left by an older writer so our rows start clean
+        if os.path.getsize(self.PATH) > 0:
+            with open(self.PATH, mode="rb") as file:
+                file.seek(-1, os.SEEK_END)
+                if file.read(1) != b"\n":
+                    os.write(self._fd, b"\n")
+
+    def write(self, row: list):
+        self.write_rows([row])
+
+    def write_rows(self, rows: list):
+        if not rows:
+            return
+        if self._first_row_time is None:
+            self._first_row_time = time.monotonic()
+        self._writer.writerows(rows)
+        self._n_rows += len(rows)
+        if self._flush_due():
+            self.flush()
+
+    def _flush_due(self):
+        if self._n_rows >= self.MAX_ROWS:
+            return True
+        deadline = self.flush_deadline()
+        return deadline is not None and time.monotonic() >= deadline
+
+    def flush_deadline(self) -> float:
+        """Monotonic time by which the buffered rows are due to be flushed, or None."""
+        if self.FLUSH_INTERVAL is None or self._first_row_time is None:
+            return None
+        return self._first_row_time + self.FLUSH_INTERVAL
+
+    def flush(self):
+        if self._n_rows == 0:
+            return
+        data = self._buffer.getvalue().encode()
+        with self._lock:
+            self.open()
+            written = os.write(self._fd, data)
+            while written < len(data):  # only on a short write (e.g. a full disk being freed)
+                written += os.write(self._fd, data[written:])
+        self.discard()
+
+    def discard(self):
+        """Drop the rows not written yet."""
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        self._n_rows = 0
+        self._first_row_time = None
+
+    def close(self):
+        self.flush()
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        self._lock.close()
+
+
+class Storage(ABC):
+    """Backend that ResourceMonitor appends sample rows to and ResourceReport reads from."""
+
+    @abstractmethod
+    def append(self, rows: list):
+        pass
+
+    @abstractmethod
+    def flush(self):
+        pass
+
+    @abstractmethod
+    def discard(self):
+        """Drop the buffered rows, e.g. after a failed flush."""
+        pass
+
+    def flush_deadline(self) -> float:
+        """
+        Monotonic time by which the buffered rows are due to be flushed, or None.
+        Appends only check it when rows arrive, so a long-lived writer calls
+        flush_if_due() in between.
+        """
+        if self.FLUSH_INTERVAL is None or self._first_row_time is None:
+            return None
+        return self._first_row_time + self.FLUSH_INTERVAL
+
+    def flush_if_due(self):
+        deadline = self.flush_deadline()
+        if deadline is not None and time.monotonic() >= deadline:
+            self.flush()
+
+    def time_flush(self, timer, stage: str):
+        """Time every flush (from append, flush_if_due or close) as `stage` of a StageTimer."""
+        self.flush = timer.wrap(stage, self.flush)
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    @abstractmethod
+    def read(self, columns: list = None, past_days: int = None) -> pd.DataFrame:
+        """
+        Read samples with a tz-aware Timestamp column.
+        past_days keeps the days from (last date - past_days) onwards, like
+        ResourceReport.get_past_days_usage.
+        """
+        pass
+
+
+class CSVStorage(Storage):
+    def __init__(self, path: str, columns: list, max_rows: int = 1, flush_interval: float = None):
+        self.PATH = path
+        self.COLUMNS = columns
+        self.WRITER = BufferedCSVWriter(path, columns, max_rows=max_rows, flush_interval=flush_interval)
+
+    def append(self, rows: list):
+        self.WRITER.write_rows(rows)
+
+    def flush(self):
+        self.WRITER.flush()
+
+    def discard(self):
+        self.WRITER.discard()
+
+    def flush_deadline(self) -> float:
+        return self.WRITER.flush_deadline()
+
+    def time_flush(self, timer, stage: str):
+        # The writer flushes itself on append and close
+        self.WRITER.flush = timer.wrap(stage, self.WRITER.flush)
+
+    def close(self):
+        self.WRITER.close()
+
+    def read(self, columns: list = None, past_days: int = None) -> pd.DataFrame:
+        df = pd.read_csv(self.PATH, usecols=columns)
+        df["Timestamp"] = pd.to_datetime(df["Timestamp"], format=TIMESTAMP_FORMAT, errors="coerce")
+        df["Timestamp"] = df["Timestamp"].dt.tz_localize(TIMEZONE, ambiguous="NaT", nonexistent="shift_forward")
+        df = df.dropna(subset=["Timestamp"])
+        if past_days is not None and len(df) > 0:
+            start_date = df["Timestamp"].max().floor("D") - pd.Timedelta(days=past_days)
+            df = df[df["Timestamp"] >= start_date]
+        return df
+
+
+class SegmentStorage(Storage):
+    """
+    Columnar storage in day-partitioned, numpy-backed segment files.
+
+    Layout: <path>/<YYYY-MM-DD>/seg-<epoch ms>-<pid>.npz, one file per flushed
+    batch and day. Timestamps are stored as int64 epoch seconds, category
+    columns (hostnames, users) as int32 codes plus a categories array, and all
+    other columns as float64. Segments are written to a temporary name and
+    renamed into place, so readers never see a partial segment. Writing a
+    segment, compacting and expiring hold a per-partition FileLock
+    (<path>/.locks/<YYYY-MM-DD>.lock), so a segment written into a partition
+    being swapped out is never lost.
+    """
+
+    def __init__(self, path: str, columns: list = None, category_columns: list = None,
+                 max_rows: int = 1, flush_interval: float = None, rollup_columns: list = None):
+        self.PATH = path
+        self.COLUMNS = columns
+        self.CATEGORY_COLUMNS = category_columns or []
+        self.MAX_ROWS = max_rows
+        self.FLUSH_INTERVAL = flush_interval
+        self.TZ = ZoneInfo(TIMEZONE)
+        self._rows = []
+        self._first_row_time = None
+        self._n_segments = 0
+        # Rollup tiers are maintained at ingest for these metric columns
+        self.ROLLUPS = [RollupStorage(path, tier, rollup_columns) for tier in ROLLUP_TIERS] if rollup_columns else []
+
+    def append(self, rows: list):
+        if not rows:
+            return
+        if self._first_row_time is None:
+            self._first_row_time = time.monotonic()
+        self._rows.extend(rows)
+        if len(self._rows) >= self.MAX_ROWS:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows = self._rows
+        epochs = [self._to_epoch(row[0]) for row in rows]
+        valid = [epoch is not None for epoch in epochs]
+        if not all(valid):
+            # Dropped from the buffer, so a row that can't be parsed never blocks later flushes
+            print(f"Dropped {valid.count(False)} rows with an invalid Timestamp from {self.PATH}: "
+                  f"{next(row for row, ok in zip(rows, valid) if not ok)}")
+            rows = self._rows = [row for row, ok in zip(rows, valid) if ok]
+            epochs = [epoch for epoch in epochs if epoch is not None]
+            if not rows:
+                self.discard()
+                return
+        df = pd.DataFrame(rows, columns=self.COLUMNS)
+        df["Timestamp"] = epochs
+        # Kept buffered if the write fails (e.g. a full disk), and retried with the next flush
+        self.append_frame(df)
+        self.discard()
+
+    def discard(self):
+        self._rows = []
+        self._first_row_time = None
+
+    def close(self):
+        self.flush()
+
+    def _to_epoch(self, timestamp: str) -> int:
+        """Epoch seconds of a monitor timestamp, or None if it can't be parsed."""
+        try:
+            return int(datetime.strptime(timestamp, TIMESTAMP_FORMAT).replace(tzinfo=self.TZ).timestamp())
+        except (TypeError, ValueError):
+            return None
+
+    def _partition_of(self, epoch: np.ndarray) -> np.ndarray:
+        local = pd.to_datetime(epoch, unit="s", utc=True).tz_convert(TIMEZONE)
+        return np.asarray(local.strftime("%Y-%m-%d"))
+
+    def append_frame(self, df: pd.DataFrame):
+        """Write a frame whose Timestamp column holds int64 epoch seconds, one segment per day."""
+        epoch = df["Timestamp"].to_numpy(dtype=np.int64)
+        partitions = self._partition_of(epoch)
+        for partition in np.unique(partitions):
+            self._write_segment(partition, df[partitions == partition])
+        for rollup in self.ROLLUPS:
+            rollup.add(df)
+
+    def _write_segment(self, partition: str, df: pd.DataFrame):
+        self._save_segment(partition, self._segment_arrays(df, self.COLUMNS, self.CATEGORY_COLUMNS))
+
+    def _segment_arrays(self, df: pd.DataFrame, columns: list, category_columns: list) -> dict:
+        arrays = {"columns": np.array(columns)}
+        for i, column in enumerate(columns):
+            values = df[column]
+            if column == "Timestamp":
+                arrays[f"c{i}"] = values.to_numpy(dtype=np.int64)
+            elif column in category_columns:
+                categorical = pd.Categorical(values.astype("string"))
+                arrays[f"c{i}"] = categorical.codes.astype(np.int32)
+                arrays[f"c{i}_categories"] = np.asarray(categorical.categories, dtype=str)
+            else:
+                arrays[f"c{i}"] = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+        return arrays
+
+    @contextmanager
+    def _partition_lock(self, partition: str):
+        lock_dir = os.path.join(self.PATH, ".locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        lock = FileLock(os.path.join(lock_dir, partition))
+        try:
+            with lock:
+                yield
+        finally:
+            lock.close()
+
+    def _save_segment(self, partition: str, arrays: dict, compressed: bool = False):
+        with self._partition_lock(partition):
+            self._save_file(os.path.join(self.PATH, partition), arrays, compressed)
+
+    def _save_file(self, partition_dir: str, arrays: dict, compressed: bool = False):
+        os.makedirs(partition_dir, exist_ok=True)
+        name = f"seg-{time.time_ns() // 10 ** 6}-{os.getpid()}-{self._n_segments}"
+        self._n_segments += 1
+        tmp_path = os.path.join(partition_dir, f".{name}.tmp.npz")
+        if compressed:
+            np.savez_compressed(tmp_path, **arrays)
+        else:
+            np.savez(tmp_path, **arrays)
+        os.replace(tmp_path, os.path.join(partition_dir, f"{name}.npz"))
+
+    def list_partitions(self) -> list:
+        if not os.path.isdir(self.PATH):
+            return []
+        return sorted(
+            name for name in os.listdir(self.PATH)
+            if len(name) == 10 and os.path.isdir(os.path.join(self.PATH, name))
+        )
+
+    def list_segments(self, partition: str) -> list:
+        partition_dir = os.path.join(self.PATH, partition)
+        return sorted(
+            os.path.join(partition_dir, name) for name in os.listdir(partition_dir)
+            if name.startswith("seg-") and name.endswith(".npz")
+        )
+
+    def expire(self, before: str) -> list:
+        """
+        Delete whole day partitions older than `before` (YYYY-MM-DD).
+        Each partition is renamed away first, so readers see it either complete
+        or not at all, and live partitions are never rewritten.
+        """
+        expired = [partition for partition in self.list_partitions() if partition < before]
+        for partition in expired:
+            trash_path = os.path.join(self.PATH, f".expired-{partition}-{os.getpid()}")
+            with self._partition_lock(partition):
+                os.rename(os.path.join(self.PATH, partition), trash_path)
+            shutil.rmtree(trash_path)
+        return expired
+
+    def compact(self, before: str) -> list:
+        """
+        Merge the segments of each partition older than `before` (YYYY-MM-DD)
+        into one. The merged partition is built next to the old one and swapped
+        in with renames, so readers never see rows twice.
+        """
+        compacted = []
+        for partition in self.list_partitions():
+            if partition >= before:
+                continue
+            # Held until the swap, so no segment is written into the partition being replaced
+            with self._partition_lock(partition):
+                if len(self.list_segments(partition)) < 2:
+                    continue
+                staging_dir = os.path.join(self.PATH, f".compact-{partition}-{os.getpid()}")
+                self._compact_into(partition, staging_dir)
+                trash_path = os.path.join(self.PATH, f".expired-{partition}-{os.getpid()}")
+                os.rename(os.path.join(self.PATH, partition), trash_path)
+                os.rename(staging_dir, os.path.join(self.PATH, partition))
+            shutil.rmtree(trash_path)
+            compacted.append(partition)
+        return compacted
+
+    def _compact_into(self, partition: str, staging_dir: str):
+        with np.load(self.list_segments(partition)[-1], allow_pickle=False) as segment:
+            columns = list(segment["columns"])
+            category_columns = [column for i, column in enumerate(columns) if f"c{i}_categories" in segment.files]
+        df = self._read_frame([partition], columns).sort_values("Timestamp", kind="stable")
+        self._save_file(staging_dir, self._segment_arrays(df, columns, category_columns))
+
+    def _read_segment(self, segment_path: str, columns: list) -> dict:
+        with np.load(segment_path, allow_pickle=False) as segment:
+            index = {name: i for i, name in enumerate(segment["columns"])}
+            data = {}
+            for column in columns:
+                if column not in index:
+                    data[column] = None
+                    continue
+                key = f"c{index[column]}"
+                if f"{key}_categories" in segment.files:
+                    data[column] = pd.Categorical.from_codes(segment[key], categories=segment[f"{key}_categories"])
+                else:
+                    data[column] = segment[key]
+            n_rows = len(segment[f"c{index['Timestamp']}"])
+        for column, values in data.items():
+            if values is None:
+                data[column] = np.full(n_rows, np.nan)
+        return data
+
+    def select_partitions(self, past_days: int = None) -> list:
+        partitions = self.list_partitions()
+        if past_days is not None and partitions:
+            start_date = (datetime.strptime(partitions[-1], "%Y-%m-%d") - timedelta(days=past_days)).strftime("%Y-%m-%d")
+            partitions = [partition for partition in partitions if partition >= start_date]
+        return partitions
+
+    def _read_frame(self, partitions: list, columns: list) -> pd.DataFrame:
+        """Read the given partitions with Timestamp left as int64 epoch seconds."""
+        chunks = [
+            self._read_segment(segment_path, columns)
+            for partition in partitions for segment_path in self.list_segments(partition)
+        ]
+        if not chunks:
+            return pd.DataFrame(columns=columns)
+        return pd.DataFrame({
+            column: self._concat([chunk[column] for chunk in chunks]) for column in columns
+        })
+
+    def read(self, columns: list = None, past_days: int = None) -> pd.DataFrame:
+        partitions = self.select_partitions(past_days)
+
+        if columns is None:
+            columns = self.COLUMNS
+            if columns is None:
+                segments = [s for p in partitions for s in self.list_segments(p)]
+                if not segments:
+                    return pd.DataFrame()
+                with np.load(segments[-1], allow_pickle=False) as segment:
+                    columns = list(segment["columns"])
+        if "Timestamp" not in columns:
+            columns = ["Timestamp"] + list(columns)
+
+        df = self._read_frame(partitions, columns)
+        if len(df) == 0:
+            return df
+        df["Timestamp"] = pd.to_datetime(df["Timestamp"], unit="s", utc=True).dt.tz_convert(TIMEZONE)
+        return df.sort_values("Timestamp", kind="stable").reset_index(drop=True)
+
+    def _concat(self, values: list):
+        if isinstance(values[0], pd.Categorical):
+            categoricals = [v if isinstance(v, pd.Categorical) else pd.Categorical(v) for v in values]
+            # A segment whose column was all missing has empty categories of another dtype
+            return pd.api.types.union_categoricals([
+                v.set_categories(v.categories.astype(str)) if len(v.categories) == 0 else v for v in categoricals
+            ])
+        return np.concatenate([np.asarray(v) for v in values])
+
+    def export_csv(self, csv_path: str):
+        """Export all segments as a CSV file in the monitors' format."""
+        df = self.read()
+        df["Timestamp"] = df["Timestamp"].dt.strftime(TIMESTAMP_FORMAT)
+        df.to_csv(csv_path, index=False)
+
+
+# Rollup tiers: bucket width and retention in days
+ROLLUP_TIERS = {"5min": 300, "1h": 3600, "1d": 86400}
+ROLLUP_RETENTION_DAYS = {"5min": 92, "1h": 400, "1d": 1830}
+# Log-bucketed percentile sketch: bin 0 holds [0, 1), bin k holds [gamma^(k-1), gamma^k)
+SKETCH_GAMMA = 1.05
+SKETCH_BINS = 340
+QUANTILES = [5, 25, 50, 75, 95]
+# Per-metric arrays of a rollup row; wsum/weight are the interval-weighted sum and total interval
+ROLLUP_STATS = ("min", "max", "sum", "count", "sketch", "wsum", "weight")
+
+
+class RollupStorage(SegmentStorage):
+    """
+    Downsampled per-host aggregates of a SegmentStorage, one instance per tier.
+
+    Each bucket row holds min/max/sum/count and a percentile sketch per metric.
+    Every flush writes partial buckets as a new segment; rows of the same bucket
+    and host are merged when reading or compacting, so one-shot monitors and the
+    daemon can both feed the same tier.
+    Layout: <path>/_rollup/<tier>/<YYYY-MM-DD>/seg-*.npz
+    """
+
+    def __init__(self, path: str, tier: str, metrics: list = None):
+        super().__init__(os.path.join(path, "_rollup", tier))
+        self.TIER = tier
+        self.BUCKET_SECONDS = ROLLUP_TIERS[tier]
+        self.METRICS = metrics
+        # Align daily buckets to local midnight
+        self.UTC_OFFSET = int(datetime.now(self.TZ).utcoffset().total_seconds())
+
+    def _sketch_bins(self, values: np.ndarray) -> np.ndarray:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            bins = 1 + np.floor(np.log(np.maximum(values, 1.0)) / np.log(SKETCH_GAMMA))
+        bins[values < 1.0] = 0
+        return np.minimum(bins, SKETCH_BINS - 1).astype(np.int64)
+
+    def add(self, df: pd.DataFrame):
+        """Aggregate a raw frame (Timestamp as epoch seconds) and write its buckets."""
+        epoch = df["Timestamp"].to_numpy(dtype=np.int64)
+        bucket = (epoch + self.UTC_OFFSET) // self.BUCKET_SECONDS * self.BUCKET_SECONDS - self.UTC_OFFSET
+        hostname = pd.Categorical(df["Hostname"].astype("string"))
+        group_keys = pd.DataFrame({"bucket": bucket, "host": hostname.codes})
+        group = group_keys.groupby(["bucket", "host"], sort=True).ngroup().to_numpy()
+        keys = group_keys.drop_duplicates().sort_values(["bucket", "host"])
+        n_groups = len(keys)
+
+        arrays = {
+            "bucket": keys["bucket"].to_numpy(dtype=np.int64),
+            "hostname": keys["host"].to_numpy(dtype=np.int32),
+            "hostname_categories": np.asarray(hostname.categories, dtype=str),
+            "metrics": np.array(self.METRICS),
+        }
+        weights = (pd.to_numeric(df[INTERVAL_COLUMN], errors="coerce").to_numpy(dtype=np.float64)
+                   if INTERVAL_COLUMN in df.columns else np.full(len(df), np.nan))
+        for i, metric in enumerate(self.METRICS):
+            values = pd.to_numeric(df[metric], errors="coerce").to_numpy(dtype=np.float64)
+            valid = ~np.isnan(values)
+            g, v = group[valid], values[valid]
+            # Interval-weighted sums, over the samples whose interval is known
+            weighted = valid & (weights > 0)
+            arrays[f"m{i}_wsum"] = np.zeros(n_groups)
+            arrays[f"m{i}_weight"] = np.zeros(n_groups)
+            np.add.at(arrays[f"m{i}_wsum"], group[weighted], values[weighted] * weights[weighted])
+            np.add.at(arrays[f"m{i}_weight"], group[weighted], weights[weighted])
+            arrays[f"m{i}_min"] = np.full(n_groups, np.inf)
+            arrays[f"m{i}_max"] = np.full(n_groups, -np.inf)
+            arrays[f"m{i}_sum"] = np.zeros(n_groups)
+            arrays[f"m{i}_count"] = np.zeros(n_groups)
+            arrays[f"m{i}_sketch"] = np.zeros((n_groups, SKETCH_BINS), dtype=np.uint32)
+            np.minimum.at(arrays[f"m{i}_min"], g, v)
+            np.maximum.at(arrays[f"m{i}_max"], g, v)
+            np.add.at(arrays[f"m{i}_sum"], g, v)
+            np.add.at(arrays[f"m{i}_count"], g, 1)
+            np.add.at(arrays[f"m{i}_sketch"], (g, self._sketch_bins(v)), 1)
+
+        partitions = self._partition_of(arrays["bucket"])
+        for partition in np.unique(partitions):
+            mask = partitions == partition
+            self._save_segment(partition, {
+                key: (value[mask] if key not in ("hostname_categories", "metrics") else value)
+                for key, value in arrays.items()
+            }, compressed=True)
+
+    def _read_merged(self, partitions: list, metrics: list) -> dict:
+        """Read rollup rows and merge those sharing a bucket and host."""
+        buckets, hostnames, parts = [], [], {metric: [] for metric in metrics}
+        for partition in partitions:
+            for segment_path in self.list_segments(partition):
+                with np.load(segment_path, allow_pickle=False) as segment:
+                    index = {name: i for i, name in enumerate(segment["metrics"])}
+                    buckets.append(segment["bucket"])
+                    hostnames.append(pd.Categorical.from_codes(segment["hostname"], categories=segment["hostname_categories"]))
+                    for metric in metrics:
+                        n = len(segment["bucket"])
+                        if metric in index:
+                            i = index[metric]
+                            # Segments written before samples carried intervals have no weighted sums
+                            parts[metric].append([
+                                segment[f"m{i}_{stat}"] if f"m{i}_{stat}" in segment.files else np.zeros(n)
+                                for stat in ROLLUP_STATS
+                            ])
+                        else:
+                            parts[metric].append([np.full(n, np.inf), np.full(n, -np.inf), np.zeros(n), np.zeros(n),
+                                                  np.zeros((n, SKETCH_BINS), dtype=np.uint32), np.zeros(n), np.zeros(n)])
+        if not buckets:
+            return None
+
+        bucket = np.concatenate(buckets)
+        hostname = pd.api.types.union_categoricals(hostnames)
+        group_keys = pd.DataFrame({"bucket": bucket, "host": hostname.codes})
+        group = group_keys.groupby(["bucket", "host"], sort=True).ngroup().to_numpy()
+        keys = group_keys.drop_duplicates().sort_values(["bucket", "host"])
+        n_groups = len(keys)
+
+        merged = {
+            "bucket": keys["bucket"].to_numpy(dtype=np.int64),
+            "hostname": pd.Categorical.from_codes(keys["host"].to_numpy(), categories=hostname.categories),
+        }
+        for metric in metrics:
+            stats = [np.concatenate([part[j] for part in parts[metric]]) for j in range(len(ROLLUP_STATS))]
+            merged_min = np.full(n_groups, np.inf)
+            merged_max = np.full(n_groups, -np.inf)
+            merged_sum = np.zeros(n_groups)
+            merged_count = np.zeros(n_groups)
+            merged_sketch = np.zeros((n_groups, SKETCH_BINS), dtype=np.uint32)
+            merged_wsum = np.zeros(n_groups)
+            merged_weight = np.zeros(n_groups)
+            np.minimum.at(merged_min, group, stats[0])
+            np.maximum.at(merged_max, group, stats[1])
+            np.add.at(merged_sum, group, stats[2])
+            np.add.at(merged_count, group, stats[3])
+            np.add.at(merged_sketch, group, stats[4])
+            np.add.at(merged_wsum, group, stats[5])
+            np.add.at(merged_weight, group, stats[6])
+            merged[metric] = (merged_min, merged_max, merged_sum, merged_count, merged_sketch, merged_wsum, merged_weight)
+        return merged
+
+    def _quantiles(self, sketch: np.ndarray, low: np.ndarray, high: np.ndarray) -> dict:
+        representative = np.concatenate([[0.0], SKETCH_GAMMA ** np.arange(SKETCH_BINS - 1) * (1 + SKETCH_GAMMA) / 2])
+        cumulative = np.cumsum(sketch, axis=1)
+        total = cumulative[:, -1]
+        quantiles = {}
+        for q in QUANTILES:
+            index = (cumulative >= (q / 100 * total)[:, None]).argmax(axis=1)
+            # Estimates never leave the exact [min, max] range of the bucket
+            quantiles[q] = np.clip(representative[index], low, high)
+        return quantiles
+
+    def read(self, columns: list = None, past_days: int = None) -> pd.DataFrame:
+        """
+        Return one row per bucket and host: Timestamp (bucket start), Hostname,
+        and for each metric its mean (named after the metric), min, max, count
+        and p5/p25/p50/p75/p95.
+        """
+        partitions = self.select_partitions(past_days)
+        if columns is None:
+            columns = self.METRICS
+            if columns is None:
+                segments = [s for p in partitions for s in self.list_segments(p)]
+                columns = []
+                if segments:
+                    with np.load(segments[-1], allow_pickle=False) as segment:
+                        columns = list(segment["metrics"])
+        metrics = [column for column in columns if column not in ("Timestamp", "Hostname")]
+        merged = self._read_merged(partitions, metrics)
+        if merged is None:
+            return pd.DataFrame(columns=["Timestamp", "Hostname"] + metrics)
+
+        data = {
+            "Timestamp": pd.to_datetime(merged["bucket"], unit="s", utc=True).tz_convert(TIMEZONE),
+            "Hostname": merged["hostname"],
+        }
+        for metric in metrics:
+            low, high, total, count, sketch, weighted_total, weight = merged[metric]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                # Weighted by sample interval where known, so bursts of samples don't skew the mean
+                data[metric] = np.where(weight > 0, weighted_total / weight, np.where(count > 0, total / count, np.nan))
+            data[f"{metric} min"] = np.where(count > 0, low, np.nan)
+            data[f"{metric} max"] = np.where(count > 0, high, np.nan)
+            data[f"{metric} count"] = count
+            for q, values in self._quantiles(sketch, low, high).items():
+                data[f"{metric} p{q}"] = np.where(count > 0, values, np.nan)
+        return pd.DataFrame(data).sort_values("Timestamp", kind="stable").reset_index(drop=True)
+
+    def _compact_into(self, partition: str, staging_dir: str):
+        with np.load(self.list_segments(partition)[-1], allow_pickle=False) as segment:
+            metrics = list(segment["metrics"])
+        merged = self._read_merged([partition], metrics)
+        arrays = {
+            "bucket": merged["bucket"],
+            "hostname": merged["hostname"].codes.astype(np.int32),
+            "hostname_categories": np.asarray(merged["hostname"].categories, dtype=str),
+            "metrics": np.array(metrics),
+        }
+        for i, metric in enumerate(metrics):
+            for stat, values in zip(ROLLUP_STATS, merged[metric]):
+                arrays[f"m{i}_{stat}"] = values
+        self._save_file(staging_dir, arrays, compressed=True)
+
+
+class RemoteStorage(Storage):
+    """
+    Send sample batches to a collector (collector.py) over HTTP.
+
+    Batches that can't be delivered go to a bounded local spool (JSON lines,
+    oldest batches dropped beyond spool_max_bytes) and are resent, in order,
+    before the next batch once the collector is reachable again.
+    """
+
+    def __init__(self, url: str, max_rows: int = 1, flush_interval: float = None,
+                 spool_path: str = None, spool_max_bytes: int = 64 * 1024 ** 2, timeout: float = 10.0):
+        self.URL = url
+        self.MAX_ROWS = max_rows
+        self.FLUSH_INTERVAL = flush_interval
+        self.SPOOL_PATH = spool_path or f"spool_{url.rstrip('/').rsplit('/', 1)[-1]}.jsonl"
+        self.SPOOL_MAX_BYTES = spool_max_bytes
+        self.TIMEOUT = timeout
+        self._session = requests.Session()
+        self._rows = []
+        self._first_row_time = None
+
+    def append(self, rows: list):
+        if not rows:
+            return
+        if self._first_row_time is None:
+            self._first_row_time = time.monotonic()
+        self._rows.extend(rows)
+        if len(self._rows) >= self.MAX_ROWS:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def _post(self, rows: list) -> bool:
+        try:
+            response = self._session.post(self.URL, data=json.dumps(rows), timeout=self.TIMEOUT,
+                                          headers={"Content-Type": "application/json"})
+        except requests.RequestException:
+            return False
+        return response.status_code == 200
+
+    def _read_spool(self) -> list:
+        if not os.path.exists(self.SPOOL_PATH):
+            return []
+        with open(self.SPOOL_PATH, mode="r") as file:
+            return [line for line in file if line.endswith("\n")]
+
+    def _write_spool(self, lines: list):
+        # Keep the newest batches that fit in the size bound
+        kept, size = [], 0
+        for line in reversed(lines):
+            size += len(line.encode())
+            if size > self.SPOOL_MAX_BYTES:
+                break
+            kept.append(line)
+        if not kept:
+            if os.path.exists(self.SPOOL_PATH):
+                os.remove(self.SPOOL_PATH)
+            return
+        tmp_path = f"{self.SPOOL_PATH}.tmp.{os.getpid()}"
+        with open(tmp_path, mode="w") as file:
+            file.writelines(reversed(kept))
+        os.replace(tmp_path, self.SPOOL_PATH)
+
+    def flush(self):
+        if not self._rows:
+            return
+        rows = self._rows
+        self._rows = []
+        self._first_row_time = None
+
+        spooled = self._read_spool()
+        delivered = 0
+        for line in spooled:
+            if not self._post(json.loads(line)):
+                break
+            delivered += 1
+        pending = spooled[delivered:]
+        if pending or not self._post(rows):
+            pending.append(json.dumps(rows) + "\n")
+        if pending or spooled:
+            self._write_spool(pending)
+
+    def discard(self):
+        self._rows = []
+        self._first_row_time = None
+
+    def close(self):
+        self.flush()
+        self._session.close()
+
+    def read(self, columns: list = None, past_days: int = None) -> pd.DataFrame:
+        raise NotImplementedError("Samples sent to a collector are read from the collector's storage.")
+
+
+def open_storage(path: str, columns: list, category_columns: list = None,
+                 max_rows: int = 1, flush_interval: float = None, rollup_columns: list = None) -> Storage:
+    """
+    http(s) URLs use RemoteStorage, paths ending in .csv use CSVStorage and
+    anything else is a SegmentStorage directory.
+    """
+    if path.startswith(("http://", "https://")):
+        return RemoteStorage(path, max_rows=max_rows, flush_interval=flush_interval)
+    if path.endswith(".csv"):
+        return CSVStorage(path, columns, max_rows=max_rows, flush_interval=flush_interval)
+    return SegmentStorage(
+        path, columns, category_columns,
+        max_rows=max_rows, flush_interval=flush_interval, rollup_columns=rollup_columns
+    )
@@ -0,0 +1,69 @@
+import unittest
+from unittest.mock import patch
+from adaptive import BurstScheduler
+
+
+class TestBurstScheduler(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = BurstScheduler(600, burst_interval=10, probe_interval=5, cpu_delta=20, load_delta=2)
+        self.probes = []
+        self.scheduler.probe = lambda: self.probes.pop(0)
+
+    def step(self, now, probe):
+        """Probe at `now`; return the effective interval if a collection ran."""
+        self.probes.append(probe)
+        if self.scheduler.due(now):
+            return self.scheduler.collected(now)
+        return None
+
+    def test_base_rate_while_idle(self):
+        self.assertEqual(self.step(0, (None, 0.5)), 600)
+        self.assertIsNone(self.step(5, (5.0, 0.5)))
+        self.assertIsNone(self.step(595, (8.0, 0.6)))
+        self.assertEqual(self.step(600, (6.0, 0.5)), 600)
+        self.assertEqual(self.scheduler.next_wakeup(600), 5)
+
+    def test_change_starts_a_burst_that_decays(self):
+        self.step(0, (None, 0.5))
+        self.step(5, (5.0, 0.5))
+        # CPU jumps: collect right away, then every 10 s while it keeps changing
+        self.assertEqual(self.step(100, (80.0, 0.5)), 100)
+        self.assertEqual(self.scheduler.interval, 10)
+        self.assertIsNone(self.step(105, (82.0, 0.5)))
+        self.assertEqual(self.step(110, (20.0, 0.5)), 10)
+        # Steady again: the interval doubles after each quiet sample, up to the base interval
+        self.assertEqual(self.step(120, (21.0, 0.5)), 10)
+        self.assertEqual(self.scheduler.interval, 20)
+        self.assertIsNone(self.step(130, (21.0, 0.5)))
+        self.assertEqual(self.step(140, (21.0, 0.5)), 20)
+        self.assertEqual(self.scheduler.interval, 40)
+        for _ in range(10):
+            self.scheduler.collected(self.scheduler.next_collection)
+        self.assertEqual(self.scheduler.interval, 600)
+
+    def test_load_change_starts_a_burst(self):
+        self.step(0, (None, 0.5))
+        self.assertEqual(self.step(30, (None, 4.0)), 30)
+        self.assertEqual(self.scheduler.interval, 10)
+
+    def test_burst_waits_for_burst_interval_after_a_collection(self):
+        self.step(0, (None, 0.5))
+        self.assertIsNone(self.step(5, (None, 4.0)))
+        self.assertEqual(self.scheduler.next_wakeup(5), 5)
+        self.assertEqual(self.step(10, (None, 0.5)), 10)
+
+    def test_probe_does_not_reset_cpu_percent(self):
+        scheduler = BurstScheduler(60)
+        with patch('psutil.cpu_percent') as mock_cpu_percent:
+            scheduler.probe()
+            cpu_usage, load1m = scheduler.probe()
+        mock_cpu_percent.assert_not_called()
+        self.assertTrue(cpu_usage is None or 0 <= cpu_usage <= 100)
+
+    def test_rejects_burst_longer_than_base(self):
+        with self.assertRaises(ValueError):
+            BurstScheduler(60, burst_interval=120)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+import numpy as np
+from aggregate import group_quantiles, minmax_decimate
+
+
+class TestGroupQuantiles(unittest.TestCase):
+    def test_matches_numpy_percentile(self):
+        rng = np.random.default_rng(0)
+        group = rng.integers(0, 5, size=1000)
+        values = rng.uniform(0, 100, size=1000)
+        values[::50] = np.nan
+        quantiles, counts = group_quantiles(group, values, n_groups=6)
+        for g in range(5):
+            expected = np.nanpercentile(values[group == g], [5, 25, 50, 75, 95])
+            np.testing.assert_allclose(quantiles[:, g], expected)
+            self.assertEqual(counts[g], np.count_nonzero((group == g) & ~np.isnan(values)))
+        self.assertTrue(np.isnan(quantiles[:, 5]).all())
+        self.assertEqual(counts[5], 0)
+
+    def test_weighted_matches_numpy_percentile(self):
+        rng = np.random.default_rng(0)
+        group = rng.integers(0, 3, size=300)
+        values = rng.uniform(0, 100, size=300)
+        weights = rng.choice([10.0, 1800.0], size=300)
+        quantiles, counts = group_quantiles(group, values, n_groups=3, weights=weights)
+        for g in range(3):
+            order = np.argsort(values[group == g])
+            cumulative = np.cumsum(weights[group == g][order])
+            # The smallest value whose cumulative weight reaches q%
+            expected = [values[group == g][order][np.argmax(cumulative >= q / 100 * cumulative[-1])]
+                        for q in [5, 25, 50, 75, 95]]
+            np.testing.assert_allclose(quantiles[:, g], expected)
+            self.assertEqual(counts[g], np.count_nonzero(group == g))
+
+    def test_empty_input(self):
+        quantiles, counts = group_quantiles(np.array([], dtype=int), np.array([]), n_groups=2)
+        self.assertEqual(quantiles.shape, (5, 2))
+        self.assertEqual(counts.tolist(), [0, 0])
+
+
+class TestMinmaxDecimate(unittest.TestCase):
+    def test_keeps_extremes_within_budget(self):
+        x = np.arange(100_000)
+        y = np.sin(x / 1000.0)
+        y[12345] = 10.0
+        y[67890] = -10.0
+        index = minmax_decimate(x, y, n_bins=100)
+        self.assertLessEqual(len(index), 200)
+        self.assertIn(12345, index)
+        self.assertIn(67890, index)
+        self.assertTrue(np.all(np.diff(index) > 0))
+
+    def test_long_nanosecond_window(self):
+        # Two years of hourly samples: the bin index must not overflow int64
+        x = np.arange(np.datetime64("2023-01-01"), np.datetime64("2025-01-01"), np.timedelta64(1, "h"))
+        x = x.astype("datetime64[ns]").view(np.int64)
+        y = np.random.default_rng(0).uniform(0, 100, len(x))
+        index = minmax_decimate(x, y, n_bins=1000)
+        bins = [(int(value) - int(x[0])) * 1000 // (int(x[-1]) - int(x[0]) + 1) for value in x]
+        expected = set()
+        for b in range(1000):
+            members = [i for i, value in enumerate(bins) if value == b]
+            expected.update([min(members, key=lambda i: y[i]), max(members, key=lambda i: y[i])])
+        self.assertEqual(set(index.tolist()), expected)
+
+    def test_short_series_is_kept(self):
+        index = minmax_decimate(np.arange(5), np.array([1.0, np.nan, 3.0, 4.0, 5.0]), n_bins=10)
+        self.assertEqual(index.tolist(), [0, 2, 3, 4])
+
+
+if __name__ == "__main__":
+    unittest.main()
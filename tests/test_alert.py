@@ -0,0 +1,140 @@
+import unittest
+import os
+import tempfile
+from datetime import datetime, timezone
+from alert import AlertEngine, AlertRule, load_rules
+from monitor import CPUMonitor
+
+COLUMNS = ["Timestamp", "Hostname", "CPU Usage(%)"]
+GPU_COLUMNS = ["Timestamp", "Hostname", "GPU Index", "GPU Util(%)", "Mem Usage(MB)"]
+CPU_RULE = AlertRule("CPU high", "CPU Usage(%)", ">", 90, duration=600, clear_threshold=80)
+
+
+def row(minute, cpu_usage, hostname="host1"):
+    return [f"2024-10-01 10:{minute:02d}:00", hostname, cpu_usage]
+
+
+class TestAlertEngine(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.state_path = os.path.join(self.tmpdir.name, "alert_state.json")
+        self.messages = []
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def engine(self, rules=(CPU_RULE,), **kwargs):
+        return AlertEngine(list(rules), state_path=self.state_path, notify=self.messages.append, **kwargs)
+
+    def test_fires_after_duration(self):
+        engine = self.engine()
+        engine.evaluate(COLUMNS, [row(0, 95), row(5, 95)])
+        self.assertEqual(self.messages, [])
+        engine.evaluate(COLUMNS, [row(10, 95)])
+        self.assertEqual(len(self.messages), 1)
+        self.assertIn("[ALERT] CPU high", self.messages[0])
+        engine.evaluate(COLUMNS, [row(15, 99)])
+        self.assertEqual(len(self.messages), 1)
+
+    def test_dip_restarts_window(self):
+        engine = self.engine()
+        engine.evaluate(COLUMNS, [row(0, 95), row(5, 50), row(10, 95)])
+        self.assertEqual(self.messages, [])
+
+    def test_hysteresis(self):
+        engine = self.engine()
+        engine.evaluate(COLUMNS, [row(0, 95), row(10, 95)])
+        engine.evaluate(COLUMNS, [row(15, 85)])
+        self.assertEqual(len(self.messages), 1)
+        engine.evaluate(COLUMNS, [row(20, 75)])
+        self.assertEqual(len(self.messages), 2)
+        self.assertIn("[RESOLVED] CPU high", self.messages[1])
+
+    def test_state_survives_restart(self):
+        self.engine().evaluate(COLUMNS, [row(0, 95)])
+        self.engine().evaluate(COLUMNS, [row(10, 95)])
+        self.assertEqual(len(self.messages), 1)
+
+    def test_concurrent_engines_keep_each_others_state(self):
+        # e.g. the cpu and gpu cron jobs sharing alert_state.json
+        first, second = self.engine(), self.engine()
+        first.evaluate(COLUMNS, [row(0, 95, "host1")])
+        second.evaluate(COLUMNS, [row(0, 95, "host2")])
+        first.evaluate(COLUMNS, [row(5, 95, "host1")])
+        self.assertEqual(set(self.engine().STATE["rules"]["CPU high"]), {"host1", "host2"})
+        second.evaluate(COLUMNS, [row(10, 95, "host1"), row(10, 95, "host2")])
+        self.assertEqual(len(self.messages), 1)
+        self.assertIn("on 2 host(s)", self.messages[0])
+
+    def test_close_sends_grouped_events(self):
+        engine = self.engine(group_wait=60)
+        engine.evaluate(COLUMNS, [row(0, 95), row(10, 95)])
+        self.assertEqual(self.messages, [])
+        engine.close()
+        self.assertEqual(len(self.messages), 1)
+        self.assertEqual(self.engine().STATE["pending"], [])
+
+    def test_groups_hosts_into_one_message(self):
+        engine = self.engine(group_wait=60)
+        rows = [row(minute, 95, f"host{i}") for minute in (0, 10) for i in range(30)]
+        engine.evaluate(COLUMNS, rows)
+        self.assertEqual(self.messages, [])
+        engine.dispatch(force=True)
+        self.assertEqual(len(self.messages), 1)
+        self.assertIn("on 30 host(s): host0, host1", self.messages[0])
+        self.assertIn("(+20 more)", self.messages[0])
+
+    def test_where_condition_and_keys(self):
+        rule = AlertRule(
+            "GPU idle", "GPU Util(%)", "==", 0, duration=3600,
+            where=[["Mem Usage(MB)", ">", 0]], key_columns=["Hostname", "GPU Index"]
+        )
+        engine = self.engine([rule])
+        engine.evaluate(GPU_COLUMNS, [
+            ["2024-10-01 10:00:00", "host1", 0, 0, 500], ["2024-10-01 10:00:00", "host1", 1, 0, 0],
+            ["2024-10-01 10:30:00", "host1", 0, 0, 500], ["2024-10-01 10:30:00", "host1", 1, 0, 0],
+            ["2024-10-01 11:00:00", "host1", 0, 0, 500], ["2024-10-01 11:00:00", "host1", 1, 0, 0],
+        ])
+        self.assertEqual(len(self.messages), 1)
+        self.assertIn("on 1 host(s): host1 0", self.messages[0])
+        # CPU rows don't have the rule's columns
+        self.assertEqual(engine.evaluate(COLUMNS, [row(0, 95)]), [])
+
+    def test_load_rules(self):
+        path = os.path.join(self.tmpdir.name, "rules.json")
+        with open(path, mode="w") as file:
+            file.write('[{"name": "Load", "column": "Load Average(5m)", "op": ">", "threshold": "cpu_count"}]')
+        rules = load_rules(path)
+        self.assertEqual(rules[0].get_threshold(), float(os.cpu_count()))
+
+    def test_cpu_count_threshold_of_the_row_host(self):
+        rule = AlertRule("Load", "Load Average(5m)", ">", "cpu_count", cpu_counts={"big": 64})
+        engine = self.engine([rule])
+        columns = ["Timestamp", "Hostname", "Load Average(5m)"]
+        events = engine.evaluate(columns, [
+            ["2024-10-01 10:00:00", "big", 32.0],
+            ["2024-10-01 10:00:00", "small", 10 ** 6],
+            ["2024-10-01 10:00:00", os.uname()[1], os.cpu_count() + 1.0],
+        ])
+        # "small" has no known core count, so its row is skipped instead of compared with this host's
+        self.assertEqual([event["key"] for event in events], [os.uname()[1]])
+        self.assertEqual(rule.get_threshold(hostname="big"), 64.0)
+        self.assertIsNone(rule.get_threshold(hostname="small"))
+
+    def test_sample_time_in_storage_timezone(self):
+        engine = self.engine()
+        engine.evaluate(COLUMNS, [row(0, 95)])
+        last = engine.STATE["rules"]["CPU high"]["host1"]["last"]
+        self.assertEqual(last, datetime(2024, 10, 1, 1, 0, tzinfo=timezone.utc).timestamp())
+
+    def test_monitor_evaluates_saved_rows(self):
+        monitor = CPUMonitor(os.path.join(self.tmpdir.name, "cpu_usage.csv"))
+        monitor.ALERT_ENGINE = self.engine([AlertRule("CPU any", "CPU Usage(%)", ">=", 0)])
+        monitor.CPU_INTERVAL = None
+        monitor.monitor()
+        monitor.close()
+        self.assertEqual(len(self.messages), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
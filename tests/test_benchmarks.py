@@ -0,0 +1,59 @@
+import unittest
+import os
+import tempfile
+from datetime import datetime
+import pandas as pd
+from benchmarks.fleet import generate_fleet
+from benchmarks.run import run_benchmarks, compare
+
+
+class TestFleetGenerator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_writes_parameterized_fleet(self):
+        counts = generate_fleet(self.tmpdir.name, n_hosts=3, gpus_per_host=2, interval=3600, days=14,
+                                malformed_rate=0.0, end=datetime(2024, 10, 14))
+        self.assertEqual(counts, {"cpu_usage.csv": 3 * 14 * 24, "gpu_usage.csv": 3 * 2 * 14 * 24})
+        cpu_df = pd.read_csv(os.path.join(self.tmpdir.name, "cpu_usage.csv"), parse_dates=["Timestamp"])
+        self.assertEqual(cpu_df["Hostname"].nunique(), 3)
+        self.assertTrue(cpu_df["Timestamp"].is_monotonic_increasing)
+
+        # Busier in the afternoon than before dawn, and on weekdays than weekends
+        by_hour = cpu_df.groupby(cpu_df["Timestamp"].dt.hour)["CPU Usage(%)"].mean()
+        self.assertGreater(by_hour[15], by_hour[4])
+        weekend = cpu_df["Timestamp"].dt.dayofweek >= 5
+        self.assertGreater(cpu_df.loc[~weekend, "CPU Usage(%)"].mean(), cpu_df.loc[weekend, "CPU Usage(%)"].mean())
+
+    def test_malformed_rows(self):
+        generate_fleet(self.tmpdir.name, n_hosts=2, gpus_per_host=1, interval=600, days=7, malformed_rate=0.05)
+        with open(os.path.join(self.tmpdir.name, "gpu_usage.csv")) as file:
+            lines = file.read().split("\n")
+        n_fields = len(lines[0].split(","))
+        malformed = [line for line in lines[1:] if len(line.split(",")) != n_fields or ",," in line or line.endswith(",")]
+        self.assertGreater(len(malformed), 0)
+        self.assertLess(len(malformed), len(lines) * 0.1)
+
+
+class TestRunBenchmarks(unittest.TestCase):
+    def test_reports_every_stage(self):
+        with tempfile.TemporaryDirectory() as work_dir:
+            results = run_benchmarks(work_dir, n_hosts=2, gpus_per_host=1, interval=3600, days=10,
+                                     save_rows=50, fast=True)
+        names = [stage["name"] for stage in results["stages"]]
+        self.assertIn("save (flush_rows=1)", names)
+        self.assertIn("clean_usage cpu", names)
+        self.assertIn("_read_usage_data gpu", names)
+        self.assertIn("plot_hour_boxplot gpu", names)
+        for stage in results["stages"]:
+            self.assertGreater(stage["seconds"], 0)
+            self.assertGreater(stage["peak_rss_mb"], 0)
+            self.assertGreater(stage["rows_per_s"], 0)
+        self.assertTrue(all(ratio == 1.0 for _, ratio, _ in compare(results, results)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+import csv
+import os
+import tempfile
+from datetime import datetime, timedelta
+from monitor import GPUMonitor
+from storage import SegmentStorage, RollupStorage
+from clean_usage import clean_usage
+
+
+def gpu_row(timestamp):
+    return [timestamp.strftime("%Y-%m-%d %H:%M:%S"), "host1", "0", "A100", "50", "100", "200", "1000", "4000", "80", "60.0"]
+
+
+class TestCleanUsage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cpu_path = os.path.join(self.tmpdir.name, "missing_cpu_usage.csv")
+        self.gpu_path = os.path.join(self.tmpdir.name, "gpu_usage.csv")
+        self.now = datetime.now()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_rows(self):
+        with open(self.gpu_path, mode="r", newline="") as file:
+            return list(csv.reader(file))[1:]
+
+    def test_drops_expired_rows(self):
+        monitor = GPUMonitor(self.gpu_path)
+        monitor.save_rows([gpu_row(self.now - timedelta(days=200)), gpu_row(self.now)])
+        monitor.close()
+        clean_usage(self.cpu_path, self.gpu_path)
+        self.assertEqual(self.read_rows(), [gpu_row(self.now)])
+
+    def test_skips_rewrite_when_nothing_expired(self):
+        monitor = GPUMonitor(self.gpu_path)
+        monitor.save(gpu_row(self.now))
+        monitor.close()
+        inode = os.stat(self.gpu_path).st_ino
+        clean_usage(self.cpu_path, self.gpu_path)
+        self.assertEqual(os.stat(self.gpu_path).st_ino, inode)
+
+    def test_open_writer_follows_replaced_file(self):
+        monitor = GPUMonitor(self.gpu_path)
+        monitor.save(gpu_row(self.now - timedelta(days=200)))
+        clean_usage(self.cpu_path, self.gpu_path)
+        monitor.save(gpu_row(self.now))
+        monitor.close()
+        self.assertEqual(self.read_rows(), [gpu_row(self.now)])
+
+    def test_expires_segment_partitions(self):
+        segment_dir = os.path.join(self.tmpdir.name, "gpu_usage")
+        monitor = GPUMonitor(segment_dir)
+        monitor.save_rows([gpu_row(self.now - timedelta(days=200)), gpu_row(self.now)])
+        monitor.close()
+        clean_usage(self.cpu_path, segment_dir)
+        storage = SegmentStorage(segment_dir)
+        self.assertEqual(storage.list_partitions(), [self.now.strftime("%Y-%m-%d")])
+        self.assertEqual(sorted(os.listdir(segment_dir)), [".locks", self.now.strftime("%Y-%m-%d"), "_rollup"])
+        # Each rollup tier has its own retention
+        self.assertEqual(len(RollupStorage(segment_dir, "5min").list_partitions()), 1)
+        self.assertEqual(len(RollupStorage(segment_dir, "1h").list_partitions()), 2)
+
+    def test_compacts_closed_segment_partitions(self):
+        segment_dir = os.path.join(self.tmpdir.name, "gpu_usage")
+        old_day = self.now - timedelta(days=3)
+        for minutes in range(3):
+            monitor = GPUMonitor(segment_dir)
+            monitor.save(gpu_row(old_day + timedelta(minutes=minutes)))
+            monitor.close()
+        clean_usage(self.cpu_path, segment_dir)
+        storage = SegmentStorage(segment_dir)
+        self.assertEqual(len(storage.list_segments(old_day.strftime("%Y-%m-%d"))), 1)
+        self.assertEqual(len(storage.read()), 3)
+        rollup = RollupStorage(segment_dir, "1h")
+        self.assertEqual(len(rollup.list_segments(old_day.strftime("%Y-%m-%d"))), 1)
+        self.assertEqual(rollup.read()["GPU Util(%) count"].sum(), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
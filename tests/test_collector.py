@@ -0,0 +1,205 @@
+import unittest
+import asyncio
+import csv
+import io
+import os
+import socket
+import tempfile
+import threading
+from contextlib import redirect_stderr
+import requests
+from monitor import CPUMonitor
+from storage import RemoteStorage, SegmentStorage
+from collector import CollectorServer
+
+
+def cpu_row(i, hostname="host1"):
+    return [f"2024-10-01 10:{i:02d}:00", hostname, 10.0 + i, 1.0, 2.0, 3.0, 16000.0, 8000.0,
+            8000.0, "alice", 50.0, "bob", 20.0, None, None, 60.0]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class TestCollector(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmpdir.name, "cpu_usage.csv")
+        self.spool_path = os.path.join(self.tmpdir.name, "spool_cpu.jsonl")
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}/samples/cpu"
+        self.loop = None
+
+    def tearDown(self):
+        self.stop_server()
+        self.tmpdir.cleanup()
+
+    def start_server(self, path=None, exporter=None):
+        monitor = CPUMonitor(path or self.csv_path)
+        monitor.FLUSH_ROWS = float("inf")
+        monitor.EXPORTER = exporter
+        self.server = CollectorServer({"cpu": monitor}, port=self.port)
+        self.loop = asyncio.new_event_loop()
+        started = threading.Event()
+
+        def run():
+            asyncio.set_event_loop(self.loop)
+            self.loop.run_until_complete(self.server.start())
+            started.set()
+            self.loop.run_forever()
+
+        self.thread = threading.Thread(target=run, daemon=True)
+        self.thread.start()
+        started.wait(5)
+
+    def stop_server(self):
+        if self.loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result(5)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.loop = None
+
+    def read_rows(self):
+        with open(self.csv_path, mode="r", newline="") as file:
+            return list(csv.reader(file))
+
+    def test_ingests_batches_from_agents(self):
+        self.start_server()
+        agents = [RemoteStorage(self.url, max_rows=2, spool_path=self.spool_path) for _ in range(2)]
+        agents[0].append([cpu_row(0), cpu_row(1)])
+        agents[1].append([cpu_row(2, "host2"), cpu_row(3, "host2")])
+        self.stop_server()
+
+        rows = self.read_rows()
+        self.assertEqual(rows[0], CPUMonitor(self.csv_path).COLUMNS)
+        self.assertEqual([row[1] for row in rows[1:]], ["host1", "host1", "host2", "host2"])
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_accepts_rows_without_interval_from_older_agents(self):
+        self.start_server()
+        self.assertEqual(requests.post(self.url, json=[cpu_row(0)[:-1]]).status_code, 200)
+        self.stop_server()
+        self.assertEqual(self.read_rows()[1][-1], "")
+
+    def test_rejects_malformed_batches(self):
+        self.start_server()
+        self.assertEqual(requests.post(self.url, data="[[1, 2]]").status_code, 400)
+        self.assertEqual(requests.post(self.url, data="not json").status_code, 400)
+        self.assertEqual(requests.post(self.url.replace("cpu", "disk"), data="[]").status_code, 404)
+        self.assertEqual(requests.get(f"http://127.0.0.1:{self.port}/health").status_code, 200)
+
+    def test_rejects_invalid_values_before_storing(self):
+        segment_path = os.path.join(self.tmpdir.name, "cpu_usage")
+        self.start_server(segment_path)
+        bad_timestamp = cpu_row(0)
+        bad_timestamp[0] = "garbage"
+        bad_number = cpu_row(1)
+        bad_number[2] = "busy"
+        self.assertEqual(requests.post(self.url, json=[cpu_row(2), bad_timestamp]).status_code, 400)
+        self.assertEqual(requests.post(self.url, json=[bad_number]).status_code, 400)
+        self.assertEqual(requests.post(self.url, json=[cpu_row(3)]).status_code, 200)
+        self.stop_server()
+        df = SegmentStorage(segment_path).read()
+        self.assertEqual(df["Timestamp"].dt.strftime("%M").tolist(), ["03"])
+
+    def test_failing_batch_is_rejected_alone(self):
+        monitor = CPUMonitor(self.csv_path)
+        monitor.FLUSH_ROWS = float("inf")
+        server = CollectorServer({"cpu": monitor})
+        writer = server.STORAGES["cpu"].WRITER
+        flush = writer.flush
+
+        def failing_flush():
+            if "bad-host" in writer._buffer.getvalue():
+                raise OSError("disk error")
+            flush()
+
+        writer.flush = failing_flush
+        batches = [("cpu", [cpu_row(0)], None), ("cpu", [cpu_row(1, "bad-host")], None), ("cpu", [cpu_row(2)], None)]
+        with redirect_stderr(io.StringIO()):
+            errors = server._commit(batches)
+        monitor.close()
+        self.assertEqual([error is None for error in errors], [True, False, True])
+        self.assertEqual([row[0][-5:-3] for row in self.read_rows()[1:]], ["00", "02"])
+
+    def test_exporter_errors_do_not_fail_written_rows(self):
+        class FailingExporter:
+            def update(self, kind, columns, rows):
+                raise RuntimeError("exporter is broken")
+
+        self.start_server(exporter=FailingExporter())
+        with redirect_stderr(io.StringIO()):
+            self.assertEqual(requests.post(self.url, json=[cpu_row(0)]).status_code, 200)
+            self.stop_server()
+        self.assertEqual(len(self.read_rows()), 2)
+
+    def test_stop_finishes_the_running_commit(self):
+        class RecordingEngine:
+            def __init__(self):
+                self.calls = []
+
+            def evaluate(self, columns, rows):
+                self.calls.append("evaluate")
+
+            def close(self):
+                self.calls.append("close")
+
+        self.start_server()
+        engine = RecordingEngine()
+        self.server.MONITORS["cpu"].ALERT_ENGINE = engine
+        committing, release = threading.Event(), threading.Event()
+        commit = self.server._commit
+
+        def slow_commit(batches):
+            committing.set()
+            release.wait(5)
+            return commit(batches)
+
+        self.server._commit = slow_commit
+        responses = []
+        poster = threading.Thread(target=lambda: responses.append(requests.post(self.url, json=[cpu_row(0)])))
+        poster.start()
+        self.assertTrue(committing.wait(5))
+        stopped = asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop)
+        release.set()
+        stopped.result(5)
+        poster.join(5)
+        self.assertEqual(len(self.read_rows()), 2)
+        # Published before the monitors, and with them the alert engine, were closed
+        self.assertEqual(engine.calls, ["evaluate", "close"])
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(5)
+        self.loop.close()
+        self.loop = None
+
+    def test_spools_while_collector_is_down(self):
+        agent = RemoteStorage(self.url, spool_path=self.spool_path, timeout=1.0)
+        agent.append([cpu_row(0)])
+        agent.append([cpu_row(1)])
+        with open(self.spool_path) as file:
+            self.assertEqual(len(file.readlines()), 2)
+
+        self.start_server()
+        agent.append([cpu_row(2)])
+        self.stop_server()
+
+        minutes = [row[0][-5:-3] for row in self.read_rows()[1:]]
+        self.assertEqual(minutes, ["00", "01", "02"])
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_spool_is_bounded(self):
+        agent = RemoteStorage(self.url, spool_path=self.spool_path, spool_max_bytes=500, timeout=1.0)
+        for i in range(10):
+            agent.append([cpu_row(i)])
+        self.assertLessEqual(os.path.getsize(self.spool_path), 500)
+        with open(self.spool_path) as file:
+            self.assertIn("10:09:00", file.readlines()[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import unittest
+from unittest.mock import MagicMock
+import threading
+import requests
+from exporter import MetricsExporter
+from instrument import StageTimer
+from monitor import CPUMonitor, GPUMonitor
+
+CPU_COLUMNS = CPUMonitor().COLUMNS
+GPU_COLUMNS = GPUMonitor().COLUMNS
+CPU_ROW = ["2024-10-01 10:00:00", "host1", 42.5, 1.0, 2.0, 3.0, 2048, 1024, 1024,
+           "alice", 30.0, "b\"ob", 10.0, None, None]
+GPU_ROWS = [
+    ["2024-10-01 10:00:00", "host1", 0, "A100", 50.0, 100.0, 400.0, 1024, 81920, 80.0],
+    ["2024-10-01 10:00:00", "host1", 1, "A100", None, None, 400.0, 0, 81920, 0.0],
+]
+
+
+class TestMetricsExporter(unittest.TestCase):
+    def setUp(self):
+        self.exporter = MetricsExporter()
+
+    def tearDown(self):
+        self.exporter.stop()
+
+    def text(self, openmetrics=True):
+        return self.exporter.payload(openmetrics).decode()
+
+    def test_renders_latest_samples(self):
+        self.exporter.update("cpu", CPU_COLUMNS, [CPU_ROW])
+        self.exporter.update("gpu", GPU_COLUMNS, GPU_ROWS)
+        text = self.text()
+        self.assertIn('resource_monitor_cpu_usage_percent{host="host1"} 42.5', text)
+        self.assertIn('resource_monitor_load_average{host="host1",period="5m"} 2.0', text)
+        self.assertIn('resource_monitor_memory_used_bytes{host="host1"} 1073741824.0', text)
+        self.assertIn('resource_monitor_top_user_cpu_usage_percent{host="host1",rank="2",user="b\\"ob"} 10.0', text)
+        self.assertNotIn('rank="3"', text)
+        self.assertIn('resource_monitor_gpu_utilization_percent{host="host1",gpu="1",name="A100"} 0.0', text)
+        self.assertNotIn('resource_monitor_gpu_temperature_celsius{host="host1",gpu="1"', text)
+        self.assertEqual(text.count("# TYPE resource_monitor_load_average gauge"), 1)
+        self.assertTrue(text.endswith("# EOF\n"))
+        self.assertFalse(self.text(openmetrics=False).endswith("# EOF\n"))
+
+    def test_update_replaces_host_rows(self):
+        self.exporter.update("gpu", GPU_COLUMNS, GPU_ROWS)
+        self.exporter.update("gpu", GPU_COLUMNS, GPU_ROWS[:1])
+        self.assertNotIn('gpu="1"', self.text())
+
+    def test_exports_stage_histograms(self):
+        timer = StageTimer()
+        timer.observe("CPUMonitor.get_cpu_usage", 0.002)
+        exporter = MetricsExporter(timer=timer)
+        exporter.update("cpu", CPU_COLUMNS, [CPU_ROW])
+        text = exporter.payload().decode()
+        self.assertIn('resource_monitor_stage_duration_seconds_bucket{stage="CPUMonitor.get_cpu_usage",le="+Inf"} 1', text)
+        self.assertIn('resource_monitor_stage_duration_seconds_count{stage="CPUMonitor.get_cpu_usage"} 1', text)
+
+    def test_serves_cached_payload(self):
+        self.exporter.update("cpu", CPU_COLUMNS, [CPU_ROW])
+        port = self.exporter.start("127.0.0.1", 0)
+        url = f"http://127.0.0.1:{port}/metrics"
+        response = requests.get(url, headers={"Accept": "application/openmetrics-text; version=1.0.0"})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.headers["Content-Type"].startswith("application/openmetrics-text"))
+        self.assertEqual(response.content, self.exporter.payload())
+        self.assertTrue(requests.get(url).headers["Content-Type"].startswith("text/plain"))
+        self.assertEqual(requests.get(f"http://127.0.0.1:{port}/other").status_code, 404)
+
+        # Concurrent scrapes all get the same cached bytes
+        bodies = []
+        threads = [threading.Thread(target=lambda: bodies.append(requests.get(url).content)) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(set(bodies), {self.exporter.payload(openmetrics=False)})
+
+    def test_monitor_updates_exporter(self):
+        monitor = CPUMonitor("unused.csv")
+        monitor.STORAGE = MagicMock()
+        monitor.EXPORTER = self.exporter
+        monitor.save(CPU_ROW)
+        self.assertIn('resource_monitor_cpu_usage_percent{host="host1"} 42.5', self.text())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import unittest
+import os
+import stat
+import sys
+import tempfile
+import textwrap
+import time
+from gpu_stream import GPURecord, NvidiaSmiStream, parse_gpu_line
+
+FAKE_NVIDIA_SMI = """\
+#!{python}
+import sys, time
+lines = [
+    "2024/10/01 10:00:00.000, 2, 0, NVIDIA A100, 40, 100.5, 400.00, 1000, 40960, 80",
+    "2024/10/01 10:00:00.000, 2, 1, NVIDIA A100, 41, [N/A], 400.00, 0, 40960, 0",
+    "2024/10/01 10:00:01.000, 2, 0, NVIDIA A100, 42, 110.0, 400.00, 2000, 40960, 90",
+    "2024/10/01 10:00:01.000, 2, 1, NVIDIA A100, [Not Supported], 60.0, 400.00, 0, 40960, 5",
+]
+for line in lines[:{n_lines}]:
+    print(line, flush=True)
+{tail}
+"""
+
+
+class TestParseGPULine(unittest.TestCase):
+    def test_parses_typed_values(self):
+        record = parse_gpu_line("0, GeForce GTX 1080, 50, 150.25, 250.00, 2000, 8192, 80")
+        self.assertEqual(record, GPURecord(0, "GeForce GTX 1080", 50.0, 150.25, 250.0, 2000.0, 8192.0, 80.0))
+
+    def test_missing_values_become_none(self):
+        record = parse_gpu_line("1, Tesla T4, [N/A], [Not Supported], 70.00, 0, 15360, [N/A]")
+        self.assertEqual(record.to_row(), [1, "Tesla T4", None, None, 70.0, 0.0, 15360.0, None])
+
+    def test_malformed_line(self):
+        self.assertIsNone(parse_gpu_line(""))
+        self.assertIsNone(parse_gpu_line("NVIDIA-SMI has failed"))
+
+
+class TestNvidiaSmiStream(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def fake_nvidia_smi(self, tail, n_lines=4):
+        path = os.path.join(self.tmpdir.name, "nvidia-smi")
+        with open(path, "w") as file:
+            file.write(FAKE_NVIDIA_SMI.format(python=sys.executable, tail=textwrap.dedent(tail), n_lines=n_lines))
+        os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+        return path
+
+    def test_groups_lines_into_samples(self):
+        stream = NvidiaSmiStream(command=self.fake_nvidia_smi("time.sleep(30)"))
+        samples = stream.samples()
+        first, second = next(samples), next(samples)
+        stream.stop()
+        self.assertEqual([record.index for record in first], [0, 1])
+        self.assertIsNone(first[1].power_draw)
+        self.assertEqual([record.utilization for record in second], [90.0, 5.0])
+
+    def test_yields_a_sample_once_every_gpu_reported(self):
+        # The next timestamp never arrives, yet the first sample is complete
+        stream = NvidiaSmiStream(command=self.fake_nvidia_smi("time.sleep(30)", n_lines=2))
+        start = time.monotonic()
+        first = next(stream.samples())
+        stream.stop()
+        self.assertLess(time.monotonic() - start, 10)
+        self.assertEqual([record.index for record in first], [0, 1])
+
+    def test_restarts_exited_child(self):
+        stream = NvidiaSmiStream(command=self.fake_nvidia_smi("sys.exit(1)"), restart_delay=0.01)
+        samples = stream.samples()
+        received = [next(samples) for _ in range(4)]
+        stream.stop()
+        self.assertEqual(len(received), 4)
+        self.assertGreaterEqual(stream.N_RESTARTS, 1)
+
+    def test_background_consumer(self):
+        stream = NvidiaSmiStream(command=self.fake_nvidia_smi("time.sleep(30)"))
+        stream.start()
+        self.assertIsNotNone(stream.latest(timeout=10))
+        for _ in range(100):
+            latest = stream.latest()
+            if latest is not None and latest[0].utilization == 90.0:
+                break
+            stream._stop_event.wait(0.05)
+        stream.stop()
+        self.assertEqual(latest[0].utilization, 90.0)
+        # The same sample is returned until it is too old
+        self.assertEqual(stream.latest(), latest)
+        self.assertIsNone(stream.latest(max_age=0))
+
+
+if __name__ == "__main__":
+    unittest.main()
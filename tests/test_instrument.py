@@ -0,0 +1,113 @@
+import unittest
+import csv
+import os
+import tempfile
+from unittest.mock import patch
+from instrument import LatencyHistogram, StageTimer
+from monitor import CPUMonitor, SelfMonitor, MonitorDaemon
+
+
+class TestLatencyHistogram(unittest.TestCase):
+    def test_quantiles(self):
+        histogram = LatencyHistogram()
+        for _ in range(99):
+            histogram.observe(0.001)
+        histogram.observe(1.0)
+        self.assertEqual(histogram.count, 100)
+        self.assertAlmostEqual(histogram.quantile(0.5), 0.001, delta=0.001)
+        self.assertGreater(histogram.quantile(0.999), 0.5)
+        self.assertEqual(histogram.maximum, 1.0)
+        self.assertIsNone(LatencyHistogram().quantile(0.5))
+
+    def test_since(self):
+        histogram = LatencyHistogram()
+        histogram.observe(0.01)
+        earlier = histogram.copy()
+        histogram.observe(0.02)
+        histogram.observe(0.03)
+        window = histogram.since(earlier)
+        self.assertEqual(window.count, 2)
+        self.assertAlmostEqual(window.total, 0.05)
+
+    def test_window_maximum_resets_with_the_snapshot(self):
+        timer = StageTimer()
+        timer.observe("stage", 1.0)
+        first = timer.snapshot(reset_window=True)
+        self.assertEqual(first["stage"].since(None).maximum, 1.0)
+        timer.observe("stage", 0.01)
+        timer.snapshot()  # another reader, e.g. the exporter, does not reset the window
+        second = timer.snapshot(reset_window=True)
+        window = second["stage"].since(first["stage"])
+        self.assertEqual(window.count, 1)
+        self.assertEqual(window.maximum, 0.01)
+        self.assertEqual(second["stage"].maximum, 1.0)
+
+
+class TestStageTimer(unittest.TestCase):
+    def test_wrap_and_time(self):
+        timer = StageTimer()
+        double = timer.wrap("double", lambda x: 2 * x)
+        self.assertEqual(double(2), 4)
+        with timer.time("block"):
+            pass
+        with self.assertRaises(ZeroDivisionError):
+            timer.wrap("fails", lambda: 1 / 0)()
+        snapshot = timer.snapshot()
+        self.assertEqual({stage: histogram.count for stage, histogram in snapshot.items()},
+                         {"double": 1, "block": 1, "fails": 1})
+
+
+class TestSelfMonitor(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cpu_path = os.path.join(self.tmpdir.name, "cpu_usage.csv")
+        self.self_path = os.path.join(self.tmpdir.name, "self_metrics.csv")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def read_rows(self):
+        with open(self.self_path, mode="r", newline="") as file:
+            return list(csv.DictReader(file))
+
+    def test_instrumented_monitor_records_stages(self):
+        self_monitor = SelfMonitor(self.self_path)
+        monitor = CPUMonitor(self.cpu_path)
+        monitor.CPU_INTERVAL = None
+        monitor.instrument(self_monitor.TIMER)
+        monitor.monitor()
+        monitor.monitor()
+        monitor.close()
+        self_monitor.monitor()
+        self_monitor.close()
+
+        rows = {row["Stage"]: row for row in self.read_rows()}
+        self.assertIn("process", rows)
+        self.assertGreater(float(rows["process"]["Process RSS(MB)"]), 0)
+        for stage in ["CPUMonitor.get_cpu_usage", "CPUMonitor.get_top_cpu_users", "CPUMonitor.save_rows", "CPUMonitor.monitor"]:
+            self.assertEqual(rows[stage]["Count"], "2", stage)
+            self.assertGreaterEqual(float(rows[stage]["Max(ms)"]), float(rows[stage]["P50(ms)"]) * 0.99)
+        self.assertNotIn("CPUMonitor.get_storage", rows)
+        # The storage write is timed apart from buffering the rows, whether an append or close() triggers it
+        self.assertGreaterEqual(int(rows["CPUMonitor.flush"]["Count"]), 2)
+
+    def test_rows_cover_only_the_last_window(self):
+        self_monitor = SelfMonitor(self.self_path)
+        with self_monitor.TIMER.time("stage"):
+            pass
+        self_monitor.monitor()
+        self_monitor.monitor()
+        self_monitor.close()
+        self.assertEqual([row["Stage"] for row in self.read_rows()], ["process", "stage", "process", "SelfMonitor.flush"])
+
+    @patch('psutil.cpu_percent')
+    def test_daemon_writes_self_metrics(self, mock_cpu_percent):
+        self_monitor = SelfMonitor(self.self_path)
+        monitor = CPUMonitor(self.cpu_path)
+        MonitorDaemon([monitor], interval=1, self_monitor=self_monitor, self_metrics_interval=3600).run(max_ticks=1)
+        stages = [row["Stage"] for row in self.read_rows()]
+        self.assertIn("CPUMonitor.monitor", stages)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -3,7 +3,8 @@ from unittest.mock import patch, MagicMock
 import os
 import csv
 import tempfile
-from monitor import CPUMonitor, GPUMonitor
+import time
+from monitor import CPUMonitor, GPUMonitor, MonitorDaemon
 
 class TestResourceMonitor(unittest.TestCase):
     @patch('os.uname')
@@ -34,49 +35,189 @@ class TestResourceMonitor(unittest.TestCase):
         self.assertEqual(used_memory, 1024)
         self.assertEqual(free_memory, 1024)
 
+    @patch('platform.system')
     @patch('subprocess.run')
-    def test_get_top_cpu_users(self, mock_subprocess):
+    def test_get_top_cpu_users(self, mock_subprocess, mock_platform):
+        # Non-Linux hosts fall back to the ps pipeline
+        mock_platform.return_value = 'Darwin'
+        mock_subprocess.return_value.returncode = 0
         mock_subprocess.return_value.stdout = "user1,20.0\nuser2,15.0\nuser3,10.0"
         monitor = CPUMonitor("dummy.csv")
         top_users = monitor.get_top_cpu_users()
         self.assertEqual(top_users, [['user1', 20.0], ['user2', 15.0], ['user3', 10.0]])
 
-    @patch('os.path.exists')
-    @patch('builtins.open')
-    def test_check_existing_csv(self, mock_open, mock_exists):
-        mock_exists.return_value = True
-        mock_open.return_value.__enter__.return_value = MagicMock()
+    @patch('platform.system')
+    @patch('subprocess.run')
+    def test_get_top_cpu_users_pads_missing_users(self, mock_subprocess, mock_platform):
+        mock_platform.return_value = 'Darwin'
+        mock_subprocess.return_value.returncode = 1
         monitor = CPUMonitor("dummy.csv")
-        monitor.COLUMNS = ['Column1', 'Column2']
-        self.assertTrue(monitor.check_existing_csv())
+        self.assertEqual(monitor.get_top_cpu_users(), [[None, None]] * 3)
 
-    @patch('os.path.exists')
-    @patch('builtins.open')
-    def test_create_csv(self, mock_open, mock_exists):
-        mock_exists.return_value = False
-        monitor = CPUMonitor("dummy.csv")
-        monitor.COLUMNS = ['Column1', 'Column2']
-        monitor.create_csv()
-        mock_open.assert_called_once_with("dummy.csv", mode='w', newline='')
-
-    @patch('os.path.exists')
-    @patch('builtins.open')
-    def test_save(self, mock_open, mock_exists):
-        mock_exists.return_value = True
+    @patch('platform.system')
+    @patch('subprocess.run')
+    def test_get_top_cpu_users_from_proc(self, mock_subprocess, mock_platform):
+        mock_platform.return_value = 'Linux'
         monitor = CPUMonitor("dummy.csv")
-        monitor.save(["data1", "data2"])
-        mock_open.assert_called_once_with("dummy.csv", mode='a', newline='')
+        monitor.PROC_SCANNER = MagicMock()
+        monitor.PROC_SCANNER.get_top_users.return_value = [['user1', 20.0, 100]]
+        top_users = monitor.get_top_cpu_users()
+        self.assertEqual(top_users, [['user1', 20.0], [None, None], [None, None]])
+        mock_subprocess.assert_not_called()
+
+    def test_save_appends_to_existing_csv(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "cpu_usage.csv")
+            with open(csv_path, mode='w') as file:
+                file.write("Column1,Column2\nold1,old2\n")
+            inode = os.stat(csv_path).st_ino
+            monitor = CPUMonitor(csv_path)
+            monitor.COLUMNS = ['Column1', 'Column2']
+            monitor.save(["data1", "data2"])
+            monitor.close()
+            # A correct header is left alone, so the file isn't rewritten
+            self.assertEqual(os.stat(csv_path).st_ino, inode)
+            with open(csv_path, mode='r', newline='') as file:
+                rows = list(csv.reader(file))
+            self.assertEqual(rows, [['Column1', 'Column2'], ['old1', 'old2'], ['data1', 'data2']])
+
+    def test_save(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "cpu_usage.csv")
+            monitor = CPUMonitor(csv_path)
+            monitor.COLUMNS = ['Column1', 'Column2']
+            monitor.save(["data1", "data2"])
+            monitor.save(["data3", "data4"])
+            monitor.close()
+            with open(csv_path, mode='r', newline='') as file:
+                rows = list(csv.reader(file))
+            self.assertEqual(rows, [['Column1', 'Column2'], ['data1', 'data2'], ['data3', 'data4']])
+
+    @patch('os.write', wraps=os.write)
+    def test_save_buffers_rows_until_flush(self, mock_write):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "cpu_usage.csv")
+            monitor = CPUMonitor(csv_path)
+            monitor.COLUMNS = ['Column1', 'Column2']
+            monitor.FLUSH_ROWS = 3
+            monitor.save(["data1", "data2"])
+            monitor.save(["data3", "data4"])
+            self.assertFalse(os.path.exists(csv_path))
+            monitor.save(["data5", "data6"])
+            # One write syscall for the whole batch
+            self.assertEqual(mock_write.call_count, 1)
+            monitor.save(["data7", "data8"])
+            monitor.close()
+            with open(csv_path, mode='r', newline='') as file:
+                rows = list(csv.reader(file))
+            self.assertEqual(len(rows), 5)
+
+    def test_save_repairs_header_and_torn_line(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "cpu_usage.csv")
+            with open(csv_path, mode='w') as file:
+                file.write("old1,old2\ntorn")
+            monitor = CPUMonitor(csv_path)
+            monitor.COLUMNS = ['Column1', 'Column2']
+            monitor.save(["data1", "data2"])
+            monitor.close()
+            with open(csv_path, mode='r', newline='') as file:
+                rows = list(csv.reader(file))
+            self.assertEqual(rows, [['Column1', 'Column2'], ['old1', 'old2'], ['torn'], ['data1', 'data2']])
+
+    def test_save_pads_rows_of_an_older_header(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "cpu_usage.csv")
+            with open(csv_path, mode='w') as file:
+                file.write("Column1,Column2\nold1,old2\n")
+            monitor = CPUMonitor(csv_path)
+            monitor.COLUMNS = ['Column1', 'Column2', 'Interval(s)']
+            monitor.save(["data1", "data2", 60.0])
+            monitor.close()
+            with open(csv_path, mode='r', newline='') as file:
+                rows = list(csv.reader(file))
+            self.assertEqual(rows, [['Column1', 'Column2', 'Interval(s)'], ['old1', 'old2', ''], ['data1', 'data2', '60.0']])
 
     @patch('subprocess.run')
     def test_gpu_monitor(self, mock_subprocess):
         mock_subprocess.return_value.stdout = "0, GeForce GTX 1080, 50, 150, 250, 2000, 8192, 80"
-        gpu_monitor = GPUMonitor("gpu_usage.csv")
-        gpu_monitor.monitor()
-        # Check if the CSV is created or appended correctly
-        with open("gpu_usage.csv", mode='r') as file:
-            reader = csv.reader(file)
-            rows = list(reader)
-            self.assertEqual(len(rows), 1)  # Only 1 entry should exist for this test
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "gpu_usage.csv")
+            gpu_monitor = GPUMonitor(csv_path)
+            gpu_monitor.monitor()
+            gpu_monitor.close()
+            # Check if the CSV is created or appended correctly
+            with open(csv_path, mode='r') as file:
+                reader = csv.reader(file)
+                rows = list(reader)
+                self.assertEqual(rows[0], gpu_monitor.COLUMNS)
+                self.assertEqual(len(rows[1:]), 1)  # Only 1 entry should exist for this test
+                self.assertEqual(rows[1][-1], "")  # No interval for one-shot samples
+
+def mock_monitor():
+    monitor = MagicMock()
+    monitor.flush_deadline.return_value = None
+    return monitor
+
+class TestMonitorDaemon(unittest.TestCase):
+    def test_rejects_sub_second_interval(self):
+        with self.assertRaises(ValueError):
+            MonitorDaemon([], interval=0.5)
+
+    @patch('psutil.cpu_percent')
+    def test_run_uses_non_blocking_cpu_percent(self, mock_cpu_percent):
+        monitor = mock_monitor()
+        daemon = MonitorDaemon([monitor], interval=1)
+        daemon.run(max_ticks=1)
+        self.assertIsNone(monitor.CPU_INTERVAL)
+        mock_cpu_percent.assert_called_once_with(interval=None)
+        monitor.monitor.assert_called_once()
+
+    @patch('psutil.cpu_percent')
+    def test_tick_records_sample_interval(self, mock_cpu_percent):
+        monitor = mock_monitor()
+        daemon = MonitorDaemon([monitor], interval=60)
+        daemon.tick()
+        self.assertEqual(monitor.SAMPLE_INTERVAL, 60)
+        daemon.tick(12.34)
+        self.assertEqual(monitor.SAMPLE_INTERVAL, 12.3)
+
+    @patch('psutil.cpu_percent')
+    def test_run_with_scheduler_samples_when_due(self, mock_cpu_percent):
+        monitor = mock_monitor()
+        scheduler = MagicMock(BURST_INTERVAL=10)
+        scheduler.due.side_effect = [False, False, True, True]
+        scheduler.collected.side_effect = [25.0, 10.0]
+        scheduler.next_wakeup.return_value = 0
+        daemon = MonitorDaemon([monitor], interval=1, scheduler=scheduler)
+        daemon.run(max_ticks=2)
+        self.assertEqual(scheduler.due.call_count, 4)
+        self.assertEqual(monitor.monitor.call_count, 2)
+        self.assertEqual(monitor.SAMPLE_INTERVAL, 10.0)
+
+    @patch('psutil.cpu_percent')
+    def test_buffered_rows_are_flushed_between_ticks(self, mock_cpu_percent):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "cpu_usage.csv")
+            monitor = CPUMonitor(csv_path)
+            monitor.monitor = lambda: monitor.save(["2024-10-01 10:00:00", "host1"] + [1.0] * 14)
+            daemon = MonitorDaemon([monitor], interval=60, flush_rows=100, flush_interval=0.2)
+            daemon.tick()
+            self.assertFalse(os.path.exists(csv_path))
+            # No other row arrives, yet the row is written once its flush interval has passed
+            start = time.monotonic()
+            daemon.wait_until(start + 0.5)
+            with open(csv_path, newline="") as file:
+                self.assertEqual(len(list(csv.reader(file))), 2)
+            daemon.close()
+
+    @patch('psutil.cpu_percent')
+    def test_stop_ends_run(self, mock_cpu_percent):
+        monitor = mock_monitor()
+        daemon = MonitorDaemon([monitor], interval=1)
+        monitor.monitor.side_effect = daemon.stop
+        daemon.run()
+        self.assertEqual(monitor.monitor.call_count, 1)
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,116 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from procfs import ProcScanner
+from proc_history import RECORD_DTYPE, ProcessHistory, parse_duration, top
+from ringbuffer import RingBuffer
+
+
+class TestProcessHistory(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.proc_root = os.path.join(self.tmpdir.name, "proc")
+        os.makedirs(self.proc_root)
+        self.path = os.path.join(self.tmpdir.name, "history")
+        self.scanner = ProcScanner(self.proc_root)
+        self.scanner.CLK_TCK = 100
+        self.scanner.PAGE_SIZE = 4096
+        self.scanner._usernames = {1000: "alice", 1001: "bob"}
+        self.history = ProcessHistory(self.path, capacity=64, scanner=self.scanner, min_rss_mb=100)
+
+    def tearDown(self):
+        self.history.stop()
+        self.tmpdir.cleanup()
+
+    def write_uptime(self, uptime):
+        with open(os.path.join(self.proc_root, "uptime"), "w") as file:
+            file.write(f"{uptime} 0.00\n")
+
+    def write_process(self, pid, uid, ticks, rss_pages=256, read_bytes=0, write_bytes=0,
+                      cgroup="/user.slice", comm="python"):
+        pid_dir = os.path.join(self.proc_root, str(pid))
+        os.makedirs(pid_dir, exist_ok=True)
+        fields = ["S", "1", "1", "1", "0", "-1", "0", "0", "0", "0", "0",
+                  str(ticks), "0", "0", "0", "20", "0", "1", "0", "0", "0", str(rss_pages)]
+        with open(os.path.join(pid_dir, "stat"), "w") as file:
+            file.write(f"{pid} ({comm}) " + " ".join(fields) + "\n")
+        with open(os.path.join(pid_dir, "status"), "w") as file:
+            file.write(f"Name:\t{comm}\nUid:\t{uid}\t{uid}\t{uid}\t{uid}\n")
+        with open(os.path.join(pid_dir, "comm"), "w") as file:
+            file.write(comm + "\n")
+        with open(os.path.join(pid_dir, "io"), "w") as file:
+            file.write(f"rchar: 0\nwchar: 0\nread_bytes: {read_bytes}\nwrite_bytes: {write_bytes}\n")
+        with open(os.path.join(pid_dir, "cgroup"), "w") as file:
+            file.write(f"0::{cgroup}\n")
+
+    def sample(self, uptime, processes):
+        self.write_uptime(uptime)
+        for process in processes:
+            self.write_process(**process)
+        return self.history.sample(now=uptime)
+
+    def test_samples_processes_and_cgroup_totals(self):
+        self.sample(100.0, [dict(pid=1, uid=1000, ticks=0), dict(pid=2, uid=1001, ticks=0, cgroup="/job/42")])
+        n = self.sample(110.0, [
+            dict(pid=1, uid=1000, ticks=500, write_bytes=10000 * 1024),  # 50% CPU, 1000 KB/s
+            dict(pid=2, uid=1001, ticks=0, rss_pages=51200, cgroup="/job/42"),  # idle, 200 MB
+        ])
+        self.assertEqual(n, 4)
+        self.assertEqual(self.history.RING.head, 2 + 4)
+
+        rows = top(self.path, since=5, now=110.0, scanner=self.scanner)
+        self.assertEqual(rows[0], [1, "alice", "python", 50.0, 1.0, 0.0, 1000.0])
+        self.assertEqual(rows[1], [2, "bob", "python", 0.0, 200.0, 0.0, 0.0])
+        cgroup_rows = top(self.path, since=5, by="rss", now=110.0, cgroups=True, scanner=self.scanner)
+        self.assertEqual([row[0] for row in cgroup_rows], ["/job/42", "/user.slice"])
+
+    def test_idle_small_processes_are_only_counted_in_cgroup_totals(self):
+        self.sample(100.0, [dict(pid=1, uid=1000, ticks=0)])
+        self.assertEqual(self.sample(110.0, [dict(pid=1, uid=1000, ticks=0)]), 1)
+
+    def test_top_averages_over_the_window(self):
+        self.sample(100.0, [dict(pid=1, uid=1000, ticks=0), dict(pid=2, uid=1001, ticks=0)])
+        self.sample(110.0, [dict(pid=1, uid=1000, ticks=1000), dict(pid=2, uid=1001, ticks=200)])
+        self.sample(120.0, [dict(pid=1, uid=1000, ticks=1000), dict(pid=2, uid=1001, ticks=800)])
+        rows = top(self.path, since=15, now=120.0, scanner=self.scanner)
+        # pid 1: 100% then idle (no record), pid 2: 20% then 60%
+        self.assertEqual([(row[0], row[3]) for row in rows], [(1, 50.0), (2, 40.0)])
+        self.assertEqual(top(self.path, since=5, now=120.0, scanner=self.scanner, n=1)[0][:4], [2, "bob", "python", 60.0])
+
+    def test_top_counts_a_sample_split_across_the_wrap_once(self):
+        ring = RingBuffer(os.path.join(self.tmpdir.name, "wrapped"), RECORD_DTYPE, capacity=64)
+        for t in range(30):
+            ring.append(np.array([(t, 1, 1000, 50.0, 1.0, 0.0, 0.0, b"python", b"/a"),
+                                  (t, 2, 1001, 10.0, 1.0, 0.0, 0.0, b"python", b"/a"),
+                                  (t, -1, -1, 60.0, 2.0, 0.0, 0.0, b"", b"/a")], dtype=RECORD_DTYPE))
+        ring.close()
+        # Records 30-89 are samples 10-29; sample 21 has records on both sides of the wrap (record 64)
+        rows = top(ring.PATH, since=19.5, now=29.0, scanner=self.scanner)
+        self.assertEqual([(row[0], row[3]) for row in rows], [(1, 50.0), (2, 10.0)])
+
+    def test_missing_io_permission_is_nan(self):
+        self.sample(100.0, [dict(pid=1, uid=1000, ticks=0)])
+        self.write_uptime(110.0)
+        self.write_process(pid=1, uid=1000, ticks=100)
+        os.remove(os.path.join(self.proc_root, "1", "io"))
+        self.history.sample(now=110.0)
+        _, views = self.history.RING.views(since=110.0)
+        process = views[0][views[0]["pid"] == 1]
+        self.assertEqual(len(process), 1)
+        self.assertNotEqual(process["read_kbs"][0], process["read_kbs"][0])
+        self.assertEqual(process["cpu"][0], 10.0)
+
+
+class TestParseDuration(unittest.TestCase):
+    def test_units(self):
+        self.assertEqual(parse_duration("90"), 90)
+        self.assertEqual(parse_duration("30s"), 30)
+        self.assertEqual(parse_duration("10m"), 600)
+        self.assertEqual(parse_duration("2h"), 7200)
+        with self.assertRaises(ValueError):
+            parse_duration("ten minutes")
+
+
+if __name__ == "__main__":
+    unittest.main()
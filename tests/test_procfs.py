@@ -0,0 +1,85 @@
+import unittest
+from unittest.mock import patch
+import os
+import tempfile
+from procfs import ProcScanner
+
+
+class TestProcScanner(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.proc_root = self.tmpdir.name
+        self.scanner = ProcScanner(self.proc_root)
+        self.scanner.CLK_TCK = 100
+        self.scanner.PAGE_SIZE = 4096
+        self.scanner._usernames = {1000: "alice", 1001: "bob"}
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_uptime(self, uptime):
+        with open(os.path.join(self.proc_root, "uptime"), "w") as file:
+            file.write(f"{uptime} 0.00\n")
+
+    def write_process(self, pid, uid, utime, stime, starttime=0, rss_pages=256, comm="python (worker)"):
+        pid_dir = os.path.join(self.proc_root, str(pid))
+        os.makedirs(pid_dir, exist_ok=True)
+        fields = ["S", "1", "1", "1", "0", "-1", "0", "0", "0", "0", "0",
+                  str(utime), str(stime), "0", "0", "20", "0", "1", "0", str(starttime), "0", str(rss_pages)]
+        with open(os.path.join(pid_dir, "stat"), "w") as file:
+            file.write(f"{pid} ({comm}) " + " ".join(fields) + "\n")
+        with open(os.path.join(pid_dir, "status"), "w") as file:
+            file.write(f"Name:\tpython\nUid:\t{uid}\t{uid}\t{uid}\t{uid}\n")
+
+    def test_first_scan_uses_lifetime_average(self):
+        self.write_uptime(100.0)
+        self.write_process(1, 1000, utime=4000, stime=1000)  # 50 s of CPU over 100 s
+        self.assertEqual(self.scanner.scan(), [("alice", 50.0, 256 * 4096)])
+
+    def test_interval_cpu_percent_per_user(self):
+        self.write_uptime(100.0)
+        self.write_process(1, 1000, utime=1000, stime=0)
+        self.write_process(2, 1001, utime=1000, stime=0)
+        self.write_process(3, 1001, utime=1000, stime=0)
+        self.scanner.scan()
+
+        self.write_uptime(110.0)
+        self.write_process(1, 1000, utime=1000, stime=900)  # 9 s of CPU in 10 s
+        self.write_process(2, 1001, utime=1100, stime=0)  # 1 s
+        self.write_process(3, 1001, utime=1200, stime=0)  # 2 s
+        top_users = self.scanner.get_top_users(n=3, by="cpu")
+        self.assertEqual(top_users, [["alice", 90.0, 1], ["bob", 30.0, 2]])
+
+    def test_top_users_by_rss(self):
+        self.write_uptime(100.0)
+        self.write_process(1, 1000, utime=5000, stime=0, rss_pages=256)
+        self.write_process(2, 1001, utime=10, stime=0, rss_pages=2560)
+        top_users = self.scanner.get_top_users(n=1, by="rss")
+        self.assertEqual(top_users, [["bob", 0.1, 10]])
+
+    def test_reused_pid_is_measured_from_its_start(self):
+        self.write_uptime(100.0)
+        self.write_process(1, 1000, utime=9000, stime=0, starttime=0)
+        self.scanner.scan()
+
+        self.write_uptime(110.0)
+        self.write_process(1, 1000, utime=500, stime=0, starttime=10500)  # restarted at 105 s
+        self.assertEqual(self.scanner.scan()[0][1], 100.0)
+
+    def test_vanished_process_is_skipped(self):
+        self.write_uptime(100.0)
+        self.write_process(1, 1000, utime=100, stime=0)
+        os.makedirs(os.path.join(self.proc_root, "2"))
+        self.assertEqual(len(self.scanner.scan()), 1)
+
+    @patch('subprocess.run')
+    @patch('subprocess.Popen')
+    def test_scan_spawns_no_processes(self, mock_popen, mock_run):
+        scanner = ProcScanner()
+        scanner.scan()
+        mock_popen.assert_not_called()
+        mock_run.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import unittest
+import os
+import random
+import tempfile
+from unittest.mock import patch
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from monitor import CPUMonitor
+from aggregate import group_quantiles
+from report import ResourceReport
+from report_cache import ReportCache
+from usage_frame import UsageFrame
+
+
+def write_cpu_usage(csv_path, hostnames=("host1", "host2"), days=10, interval_minutes=30):
+    monitor = CPUMonitor(csv_path)
+    monitor.FLUSH_ROWS = 1000
+    rng = random.Random(0)
+    start = datetime(2024, 10, 1)
+    for i in range(days * 24 * 60 // interval_minutes):
+        timestamp = (start + timedelta(minutes=interval_minutes * i)).strftime("%Y-%m-%d %H:%M:%S")
+        for hostname in hostnames:
+            monitor.save([timestamp, hostname, rng.uniform(0, 100), 1.0, 1.0, 1.0, 2048, 1024, 1024,
+                          "alice", 10.0, "bob", 5.0, "carol", 1.0, interval_minutes * 60.0])
+    monitor.close()
+
+
+class TestResourceReport(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.csv_path = os.path.join(self.tmpdir.name, "cpu_usage.csv")
+        write_cpu_usage(self.csv_path)
+        self.report = ResourceReport(self.csv_path, self.csv_path)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def chart_jobs(self, out_dir, report=None):
+        os.makedirs(out_dir)
+        df = (report or self.report).cpu_usage_df
+        return [
+            ("plot_timeseries_trend", (df,), {"y_col": "CPU Usage(%)", "save_path": os.path.join(out_dir, "trend.jpg")}),
+            ("plot_dayofweek_boxplot", (df,), {"y_col": "CPU Usage(%)", "save_path": os.path.join(out_dir, "dayofweek.jpg")}),
+            ("plot_hour_boxplot", (df,), {"y_col": "CPU Usage(%)", "save_path": os.path.join(out_dir, "hour.jpg")}),
+        ]
+
+    def test_parallel_rendering_matches_serial(self):
+        serial_dir = os.path.join(self.tmpdir.name, "serial")
+        parallel_dir = os.path.join(self.tmpdir.name, "parallel")
+        self.report.render_charts(self.chart_jobs(serial_dir), n_workers=1)
+        self.report.render_charts(self.chart_jobs(parallel_dir), n_workers=3)
+        for name in ["trend.jpg", "dayofweek.jpg", "hour.jpg"]:
+            with open(os.path.join(serial_dir, name), "rb") as serial, open(os.path.join(parallel_dir, name), "rb") as parallel:
+                self.assertEqual(serial.read(), parallel.read(), name)
+
+    def test_fast_mode_renders_charts(self):
+        report = ResourceReport(self.csv_path, self.csv_path, fast=True)
+        out_dir = os.path.join(self.tmpdir.name, "fast")
+        report.render_charts(self.chart_jobs(out_dir), n_workers=1)
+        for name in ["trend.jpg", "dayofweek.jpg", "hour.jpg"]:
+            self.assertGreater(os.path.getsize(os.path.join(out_dir, name)), 0)
+
+    def test_category_stats_weight_samples_by_interval(self):
+        df = pd.DataFrame({
+            "Timestamp": pd.to_datetime(["2024-10-01 10:00:00"] * 4).tz_localize("Asia/Tokyo"),
+            "Hostname": ["host1"] * 4,
+            "CPU Usage(%)": [10.0, 90.0, 90.0, 90.0],
+            "Interval(s)": [1800.0, 10.0, 10.0, None],
+        })
+        usage = UsageFrame(df)
+        np.testing.assert_array_equal(self.report._sample_weights(usage.host("host1")), [1800.0, 10.0, 10.0, 10.0])
+        stats = self.report._category_stats(usage, "hour", "CPU Usage(%)", ["host1"], 24)
+        # The 30 min quiet sample outweighs a burst of 10 s samples
+        self.assertEqual(stats[0, 2, 10], 10.0)
+        self.assertIsNone(self.report._sample_weights(df.drop(columns="Interval(s)")))
+
+        # A host's weights don't depend on the other hosts of the window, which its cached aggregates aren't keyed by
+        other = pd.DataFrame({
+            "Timestamp": pd.to_datetime(["2024-10-01 10:00:00"] * 3).tz_localize("Asia/Tokyo"),
+            "Hostname": ["host2"] * 3,
+            "CPU Usage(%)": [50.0] * 3,
+            "Interval(s)": [5.0] * 3,
+        })
+        fleet = UsageFrame(pd.concat([df, other], ignore_index=True))
+        np.testing.assert_array_equal(self.report._sample_weights(fleet.host("host1")), [1800.0, 10.0, 10.0, 10.0])
+        fleet_stats = self.report._category_stats(fleet, "hour", "CPU Usage(%)", ["host1", "host2"], 24)
+        np.testing.assert_array_equal(fleet_stats[0], stats[0])
+
+    def test_cached_charts_match_and_follow_new_data(self):
+        cache_dir = os.path.join(self.tmpdir.name, "cache")
+        first_dir = os.path.join(self.tmpdir.name, "first")
+        second_dir = os.path.join(self.tmpdir.name, "second")
+        report = ResourceReport(self.csv_path, self.csv_path, fast=True, cache_dir=cache_dir)
+        report.render_charts(self.chart_jobs(first_dir), n_workers=1)
+        n_entries = len(os.listdir(cache_dir))
+        report.render_charts(self.chart_jobs(second_dir), n_workers=1)
+        self.assertEqual(len(os.listdir(cache_dir)), n_entries)
+        for name in ["trend.jpg", "dayofweek.jpg", "hour.jpg"]:
+            with open(os.path.join(first_dir, name), "rb") as first, open(os.path.join(second_dir, name), "rb") as second:
+                self.assertEqual(first.read(), second.read(), name)
+
+        # New samples for one host only recompute that host's aggregates
+        monitor = CPUMonitor(self.csv_path)
+        monitor.save(["2024-10-11 00:00:00", "host1", 50.0, 1.0, 1.0, 1.0, 2048, 1024, 1024,
+                      "alice", 10.0, "bob", 5.0, "carol", 1.0, 1800.0])
+        monitor.close()
+        report = ResourceReport(self.csv_path, self.csv_path, fast=True, cache_dir=cache_dir)
+        report.render_charts(self.chart_jobs(os.path.join(self.tmpdir.name, "third"), report), n_workers=1)
+        self.assertGreater(len(os.listdir(cache_dir)), n_entries)
+
+    def test_trend_chart_is_cached_in_every_mode(self):
+        cache_dir = os.path.join(self.tmpdir.name, "cache")
+        report = ResourceReport(self.csv_path, self.csv_path, cache_dir=cache_dir)
+        job = self.chart_jobs(os.path.join(self.tmpdir.name, "first"), report)[0]
+        report.render_chart(job[0], *job[1], **job[2])
+        # A later report (another report time) reuses the rendered chart
+        report = ResourceReport(self.csv_path, self.csv_path, cache_dir=cache_dir)
+        job = self.chart_jobs(os.path.join(self.tmpdir.name, "second"), report)[0]
+        with patch.object(ResourceReport, "plot_timeseries_trend") as plot:
+            report.render_chart(job[0], *job[1], **job[2])
+        plot.assert_not_called()
+        self.assertGreater(os.path.getsize(job[2]["save_path"]), 0)
+
+    def test_only_changed_hosts_are_recomputed(self):
+        cache_dir = os.path.join(self.tmpdir.name, "cache")
+        report = ResourceReport(self.csv_path, self.csv_path, fast=True, cache_dir=cache_dir)
+        hostnames = ["host1", "host2"]
+        before = report._category_stats(report.get_past_days_usage(report.cpu_usage_df, 7), "hour",
+                                        "CPU Usage(%)", hostnames, 24)
+        n_entries = len(os.listdir(cache_dir))
+
+        # A new sample for host1 within the last day, so the window doesn't move
+        monitor = CPUMonitor(self.csv_path)
+        monitor.save(["2024-10-10 23:45:00", "host1", 100.0, 1.0, 1.0, 1.0, 2048, 1024, 1024,
+                      "alice", 10.0, "bob", 5.0, "carol", 1.0, 900.0])
+        monitor.close()
+        report = ResourceReport(self.csv_path, self.csv_path, fast=True, cache_dir=cache_dir)
+        usage = report.get_past_days_usage(report.cpu_usage_df, 7)
+        with patch("report.group_quantiles", wraps=group_quantiles) as spy:
+            after = report._category_stats(usage, "hour", "CPU Usage(%)", hostnames, 24)
+        # host2's aggregates come from the cache; only host1's are recomputed and stored
+        self.assertEqual(spy.call_count, 1)
+        np.testing.assert_array_equal(spy.call_args.args[1], usage.host("host1")["CPU Usage(%)"].to_numpy())
+        self.assertEqual(len(os.listdir(cache_dir)), n_entries + 1)
+        np.testing.assert_array_equal(after[1], before[1])
+        self.assertFalse(np.array_equal(after[0][:, 23], before[0][:, 23], equal_nan=True))
+
+
+class TestReportCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        with tempfile.TemporaryDirectory() as cache_dir:
+            cache = ReportCache(cache_dir, max_bytes=20)
+            cache.put("a", b"0123456789")
+            os.utime(os.path.join(cache_dir, "a"), (0, 0))
+            cache.put("b", b"0123456789")
+            self.assertEqual(cache.get("a"), b"0123456789")  # refreshes a
+            os.utime(os.path.join(cache_dir, "b"), (1, 1))
+            cache.put("c", b"0123456789")
+            self.assertIsNone(cache.get("b"))
+            self.assertEqual(sorted(os.listdir(cache_dir)), ["a", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+from ringbuffer import RingBuffer
+
+DTYPE = np.dtype([("time", "<f8"), ("value", "<i4")])
+
+
+def records(times):
+    return np.array([(t, int(t) * 10) for t in times], dtype=DTYPE)
+
+
+class TestRingBuffer(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "ring")
+        self.ring = RingBuffer(self.path, DTYPE, capacity=8)
+
+    def tearDown(self):
+        self.ring.close()
+        self.tmpdir.cleanup()
+
+    def test_file_size_is_fixed(self):
+        size = os.path.getsize(self.path)
+        for start in range(0, 100, 5):
+            self.ring.append(records(range(start, start + 5)))
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertEqual(self.ring.head, 100)
+
+    def test_wraparound_keeps_latest_records_in_order(self):
+        self.ring.append(records(range(6)))
+        self.ring.append(records(range(6, 11)))
+        first_number, views = self.ring.views()
+        self.assertEqual(first_number, 3)
+        self.assertEqual(len(views), 2)
+        self.assertEqual(np.concatenate(views)["time"].tolist(), list(range(3, 11)))
+
+    def test_views_since_are_views_of_the_file(self):
+        self.ring.append(records(range(11)))
+        first_number, views = self.ring.views(since=7)
+        self.assertEqual(first_number, 7)
+        self.assertEqual(np.concatenate(views)["value"].tolist(), [70, 80, 90, 100])
+        for view in views:
+            self.assertIsInstance(view.base, np.memmap)
+
+        self.assertEqual(self.ring.views(since=100), (11, []))
+
+    def test_readonly_reader_sees_writer_appends(self):
+        reader = RingBuffer(self.path, DTYPE, readonly=True)
+        self.assertEqual(reader.views(), (0, []))
+        self.ring.append(records(range(3)))
+        self.assertEqual(np.concatenate(reader.views()[1])["time"].tolist(), [0, 1, 2])
+        with self.assertRaises(ValueError):
+            reader.views()[1][0]["time"] = 5
+
+    def test_reader_detects_overwritten_records(self):
+        reader = RingBuffer(self.path, DTYPE, readonly=True)
+        self.ring.append(records(range(8)))
+        first_number, _ = reader.views(since=2)
+        self.assertFalse(reader.overwritten(first_number))
+        self.ring.append(records(range(8, 11)))  # overwrites 0, 1 and 2
+        self.assertTrue(reader.overwritten(first_number))
+
+    def test_rejects_other_record_types(self):
+        with self.assertRaises(ValueError):
+            RingBuffer(self.path, np.dtype([("time", "<f8")]), readonly=True)
+
+
+if __name__ == "__main__":
+    unittest.main()
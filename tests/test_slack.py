@@ -0,0 +1,230 @@
+import unittest
+import json
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+import slack
+from slack import SlackNotificator
+from storage import FileLock
+
+
+class StubSlackHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        server = self.server
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode(errors="replace")
+        try:
+            params = json.loads(body)
+        except ValueError:
+            params = {key: values[0] for key, values in parse_qs(body).items()}
+        method = self.path.rsplit("/", 1)[-1]
+        server.calls.append((method, params or body))
+
+        if server.rate_limited > 0 and method == "chat.postMessage":
+            server.rate_limited -= 1
+            self.respond(429, {"ok": False, "error": "ratelimited"}, {"Retry-After": "0"})
+        elif method == "chat.postMessage" and params.get("text") in server.rejected:
+            self.respond(200, {"ok": False, "error": "channel_not_found"})
+        elif server.down:
+            self.respond(500, {"ok": False, "error": "internal_error"})
+        elif method == "auth.test":
+            self.respond(200, {"ok": True, "user_id": "U123"})
+        elif method == "files.getUploadURLExternal":
+            upload_url = f"http://127.0.0.1:{server.server_address[1]}/upload/F123"
+            self.respond(200, {"ok": True, "upload_url": upload_url, "file_id": "F123"})
+        elif method == "files.completeUploadExternal":
+            self.respond(200, {"ok": True, "files": [{"id": "F123"}]})
+        else:
+            self.respond(200, {"ok": True})
+
+    def respond(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestSlackNotificator(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.spool_path = os.path.join(self.tmpdir.name, "slack_spool.jsonl")
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), StubSlackHandler)
+        self.server.calls, self.server.rate_limited, self.server.down = [], 0, False
+        self.server.rejected = set()
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}/api/"
+        slack._AUTH_RESPONSES.clear()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def notificator(self, **kwargs):
+        return SlackNotificator(
+            token="xoxb-test", channel_id="C123", base_url=self.base_url,
+            spool_path=self.spool_path, retry_delay=0.01, **kwargs
+        )
+
+    def posted_texts(self):
+        return [params["text"] for method, params in self.server.calls if method == "chat.postMessage"]
+
+    def read_jsonl(self, path):
+        with open(path) as file:
+            return [json.loads(line) for line in file]
+
+    def test_auth_is_cached(self):
+        self.assertEqual(self.notificator().get_bot_user_id(), "U123")
+        self.assertEqual(self.notificator().get_bot_user_id(), "U123")
+        self.assertEqual([method for method, _ in self.server.calls], ["auth.test"])
+
+    def test_batches_queued_messages(self):
+        notificator = self.notificator(batch_size=3)
+        # Hold the worker until all messages are queued
+        with notificator._spool_lock:
+            for i in range(5):
+                notificator.post_message(f"message {i}")
+        notificator.close()
+        self.assertEqual(self.posted_texts(), ["message 0\nmessage 1\nmessage 2", "message 3\nmessage 4"])
+
+    def test_retries_after_rate_limit(self):
+        self.server.rate_limited = 2
+        notificator = self.notificator()
+        notificator.post_message("hello")
+        notificator.close()
+        self.assertEqual(self.posted_texts(), ["hello", "hello", "hello"])
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_spools_and_redelivers(self):
+        self.server.down = True
+        notificator = self.notificator(max_retries=2)
+        notificator.post_message("first")
+        notificator.close()
+        with open(self.spool_path) as file:
+            self.assertEqual(json.loads(file.readline())["message"], "first")
+
+        self.server.down = False
+        notificator = self.notificator()
+        notificator.post_message("second")
+        notificator.close()
+        self.assertEqual(self.posted_texts()[-2:], ["first", "second"])
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_spooled_messages_are_sent_before_newer_ones(self):
+        self.server.down = True
+        notificator = self.notificator(max_retries=1)
+        notificator.post_message("firing")
+        for _ in range(100):
+            if os.path.exists(self.spool_path):
+                break
+            time.sleep(0.05)
+        self.server.down = False
+        notificator.post_message("resolved")
+        notificator.close()
+        self.assertEqual(self.posted_texts()[-2:], ["firing", "resolved"])
+        self.assertFalse(os.path.exists(self.spool_path))
+
+    def test_spool_is_locked_across_processes(self):
+        notificator = self.notificator()
+        # Another process holding the spool's file lock
+        with FileLock(self.spool_path):
+            writer = threading.Thread(target=notificator._spool, args=([{"message": "a", "filepath": None}],))
+            writer.start()
+            writer.join(0.2)
+            self.assertTrue(writer.is_alive())
+        writer.join(5)
+        with open(self.spool_path) as file:
+            self.assertEqual(len(file.readlines()), 1)
+
+    def test_spooled_file_survives_overwrite(self):
+        filepath = os.path.join(self.tmpdir.name, "report.jpg")
+        with open(filepath, "wb") as file:
+            file.write(b"old report")
+        self.server.down = True
+        notificator = self.notificator(max_retries=1)
+        notificator.post_message_with_files("Resource Report", filepath)
+        notificator.close()
+        with open(filepath, "wb") as file:
+            file.write(b"new report")
+
+        self.server.down = False
+        notificator = self.notificator()
+        notificator.post_message("done")
+        notificator.close()
+        methods = [method for method, _ in self.server.calls]
+        self.assertIn("F123", methods)
+        self.assertIn("old report", self.server.calls[methods.index("F123")][1])
+        self.assertEqual(os.listdir(notificator.SPOOL_FILES_DIR), [])
+
+    def test_spools_when_queue_is_full(self):
+        self.server.down = True
+        notificator = self.notificator(max_queue=1, max_retries=1)
+        with notificator._spool_lock:
+            notificator.post_message("a")
+            notificator.post_message("b")
+            self.assertFalse(notificator.post_message("c"))
+        notificator.close(timeout=5)
+        with open(self.spool_path) as file:
+            self.assertEqual(len(file.readlines()), 3)
+
+    def test_rejected_message_does_not_block_newer_ones(self):
+        self.server.rejected = {"bad"}
+        notificator = self.notificator()
+        notificator._spool([{"message": "bad", "filepath": None}])
+        notificator.post_message("good")
+        notificator.close()
+        # Not retried, and the newer message still goes out
+        self.assertEqual(self.posted_texts(), ["bad", "good"])
+        self.assertFalse(os.path.exists(self.spool_path))
+        dead = self.read_jsonl(notificator.DEAD_LETTER_PATH)
+        self.assertEqual([(item["message"], item["error"]) for item in dead], [("bad", "channel_not_found")])
+
+    def test_redeliveries_are_capped(self):
+        self.server.down = True
+        notificator = self.notificator(max_retries=1, max_redeliveries=2)
+        notificator._spool([{"message": "old", "filepath": None, "attempts": 1}])
+        notificator.post_message("new")
+        notificator.close()
+        self.assertEqual([item["message"] for item in self.read_jsonl(notificator.DEAD_LETTER_PATH)], ["old"])
+        self.assertEqual([item["message"] for item in self.read_jsonl(self.spool_path)], ["new"])
+
+    def test_missing_file(self):
+        notificator = self.notificator()
+        missing = os.path.join(self.tmpdir.name, "missing.jpg")
+        # Spooled without the file rather than raising in the worker
+        notificator._spool([{"message": "report", "filepath": missing}])
+        self.assertEqual(self.read_jsonl(self.spool_path), [{"message": "report", "filepath": None}])
+        os.remove(self.spool_path)
+        notificator.post_message_with_files("report", missing)
+        notificator.post_message("after")
+        notificator.close()
+        self.assertEqual(self.posted_texts(), ["after"])
+        self.assertEqual([item["message"] for item in self.read_jsonl(notificator.DEAD_LETTER_PATH)], ["report"])
+
+    def test_failed_redelivery_stays_before_newer_spooled_messages(self):
+        notificator = self.notificator()
+        other = self.notificator()
+        notificator._spool([{"message": "old", "filepath": None}])
+
+        def deliver(batch):
+            # Another process spools a message while this one is redelivering
+            other._spool([{"message": "newer", "filepath": None}])
+            return False
+        notificator._deliver = deliver
+        self.assertFalse(notificator._redeliver_spool())
+        self.assertEqual([item["message"] for item in self.read_jsonl(self.spool_path)], ["old", "newer"])
+        other.close()
+        notificator.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,188 @@
+import unittest
+import io
+import os
+from contextlib import redirect_stdout
+import tempfile
+import threading
+from unittest.mock import patch
+import pandas as pd
+from monitor import CPUMonitor
+from storage import SegmentStorage, RollupStorage, CSVStorage, open_storage
+from migrate_usage import migrate_usage, export_usage
+
+COLUMNS = ["Timestamp", "Hostname", "CPU Usage(%)", "Top User"]
+ROWS = [
+    ["2024-10-01 10:00:00", "host1", 10.0, "alice"],
+    ["2024-10-01 10:30:00", "host2", 20.0, None],
+    ["2024-10-05 23:30:00", "host1", 30.0, "bob"],
+    ["2024-10-06 00:00:00", "host2", "[N/A]", "alice"],
+]
+
+
+class TestSegmentStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cpu_usage")
+        self.storage = SegmentStorage(self.path, COLUMNS, ["Hostname", "Top User"], max_rows=2)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_round_trip(self):
+        self.storage.append(ROWS)
+        self.storage.close()
+        df = SegmentStorage(self.path).read()
+        self.assertEqual(list(df.columns), COLUMNS)
+        self.assertEqual(str(df["Timestamp"].dt.tz), "Asia/Tokyo")
+        self.assertEqual(df["Timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S").tolist(), [row[0] for row in ROWS])
+        self.assertIsInstance(df["Hostname"].dtype, pd.CategoricalDtype)
+        self.assertEqual(df["Hostname"].tolist(), ["host1", "host2", "host1", "host2"])
+        self.assertTrue(pd.isna(df["Top User"][1]))
+        self.assertTrue(pd.isna(df["CPU Usage(%)"][3]))
+
+    def test_partitions_by_local_day(self):
+        self.storage.append(ROWS)
+        self.storage.close()
+        self.assertEqual(self.storage.list_partitions(), ["2024-10-01", "2024-10-05", "2024-10-06"])
+
+    def test_read_only_needed_columns_and_partitions(self):
+        self.storage.append(ROWS)
+        self.storage.close()
+        df = SegmentStorage(self.path).read(columns=["Hostname", "CPU Usage(%)"], past_days=1)
+        self.assertEqual(list(df.columns), ["Timestamp", "Hostname", "CPU Usage(%)"])
+        self.assertEqual(len(df), 2)
+
+    def test_buffers_until_max_rows(self):
+        self.storage.append(ROWS[:1])
+        self.assertEqual(self.storage.list_partitions(), [])
+        self.storage.append(ROWS[1:2])
+        self.assertEqual(len(self.storage.list_segments("2024-10-01")), 1)
+
+    def test_invalid_timestamp_does_not_block_later_flushes(self):
+        with redirect_stdout(io.StringIO()):
+            self.storage.append([["garbage", "host1", 10.0, "alice"], ROWS[0]])
+        self.storage.append(ROWS[1:3])
+        self.storage.close()
+        df = SegmentStorage(self.path).read()
+        self.assertEqual(df["Timestamp"].dt.strftime("%Y-%m-%d %H:%M:%S").tolist(), [row[0] for row in ROWS[:3]])
+
+    def test_compaction_waits_for_segment_writers(self):
+        self.storage.append(ROWS[:2])
+        self.storage.append([ROWS[0], ROWS[1]])
+        writer = SegmentStorage(self.path, COLUMNS, ["Hostname", "Top User"])
+        compacted = []
+        # A writer saving a segment into the partition holds its lock
+        with writer._partition_lock("2024-10-01"):
+            compactor = threading.Thread(target=lambda: compacted.extend(self.storage.compact("2024-10-02")))
+            compactor.start()
+            compactor.join(0.2)
+            self.assertTrue(compactor.is_alive())
+            writer._save_file(os.path.join(self.path, "2024-10-01"), writer._segment_arrays(
+                pd.DataFrame([ROWS[0]], columns=COLUMNS).assign(Timestamp=[writer._to_epoch(ROWS[0][0])]),
+                COLUMNS, ["Hostname", "Top User"]
+            ))
+        compactor.join(5)
+        self.assertEqual(compacted, ["2024-10-01"])
+        self.assertEqual(len(SegmentStorage(self.path).read()), 5)
+
+    def test_compaction_keeps_storage_columns(self):
+        self.storage.append(ROWS[:2])
+        self.storage.append(ROWS[:2])
+        storage = SegmentStorage(self.path, ["Timestamp", "Hostname", "CPU Usage(%)"], ["Hostname"])
+        self.assertEqual(storage.compact("2024-10-02"), ["2024-10-01"])
+        self.assertEqual(storage.COLUMNS, ["Timestamp", "Hostname", "CPU Usage(%)"])
+        self.assertEqual(storage.CATEGORY_COLUMNS, ["Hostname"])
+        self.assertEqual(list(SegmentStorage(self.path).read().columns), COLUMNS)
+
+    def test_failed_write_keeps_rows_buffered(self):
+        storage = SegmentStorage(self.path, COLUMNS, ["Hostname", "Top User"], max_rows=10)
+        storage.append(ROWS[:2])
+        with patch.object(storage, "append_frame", side_effect=OSError("No space left on device")):
+            with self.assertRaises(OSError):
+                storage.flush()
+        storage.close()
+        self.assertEqual(len(SegmentStorage(self.path).read()), 2)
+
+    def test_open_storage_by_path(self):
+        self.assertIsInstance(open_storage("usage.csv", COLUMNS), CSVStorage)
+        self.assertIsInstance(open_storage(self.path, COLUMNS), SegmentStorage)
+
+
+class TestRollupStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "cpu_usage")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, rows):
+        storage = SegmentStorage(self.path, COLUMNS, ["Hostname", "Top User"], rollup_columns=["CPU Usage(%)"])
+        storage.append(rows)
+        storage.close()
+
+    def test_buckets_per_host(self):
+        self.write([[f"2024-10-01 10:{minute:02d}:00", "host1", float(minute), "alice"] for minute in range(60)])
+        self.write([["2024-10-01 10:30:00", "host2", 50.0, "bob"]])
+        df = RollupStorage(self.path, "1h").read()
+        self.assertEqual(df["Hostname"].tolist(), ["host1", "host2"])
+        self.assertEqual(df["Timestamp"].dt.strftime("%Y-%m-%d %H:%M").tolist(), ["2024-10-01 10:00"] * 2)
+        host1 = df.iloc[0]
+        self.assertEqual(host1["CPU Usage(%)"], 29.5)
+        self.assertEqual(host1["CPU Usage(%) min"], 0.0)
+        self.assertEqual(host1["CPU Usage(%) max"], 59.0)
+        self.assertEqual(host1["CPU Usage(%) count"], 60)
+        self.assertAlmostEqual(host1["CPU Usage(%) p50"], 29.5, delta=29.5 * 0.05)
+        self.assertAlmostEqual(host1["CPU Usage(%) p95"], 56.0, delta=56.0 * 0.05)
+
+    def test_partial_buckets_are_merged(self):
+        self.write([["2024-10-01 10:00:00", "host1", 10.0, "alice"]])
+        self.write([["2024-10-01 10:04:00", "host1", 30.0, "alice"]])
+        self.write([["2024-10-01 10:05:00", "host1", 90.0, "alice"]])
+        df = RollupStorage(self.path, "5min").read()
+        self.assertEqual(df["CPU Usage(%)"].tolist(), [20.0, 90.0])
+        daily = RollupStorage(self.path, "1d").read()
+        self.assertEqual(daily["Timestamp"].dt.strftime("%Y-%m-%d %H:%M").tolist(), ["2024-10-01 00:00"])
+        self.assertEqual(daily["CPU Usage(%) max"].tolist(), [90.0])
+
+    def test_mean_is_weighted_by_sample_interval(self):
+        columns = COLUMNS + ["Interval(s)"]
+        storage = SegmentStorage(self.path, columns, ["Hostname", "Top User"], rollup_columns=["CPU Usage(%)"])
+        # A burst of 10 s samples during a spike after a quiet 30 min sample
+        storage.append([["2024-10-01 10:30:00", "host1", 10.0, "alice", 1800.0]] + [
+            [f"2024-10-01 10:30:{second:02d}", "host1", 90.0, "alice", 10.0] for second in range(10, 60, 10)
+        ])
+        storage.close()
+        df = RollupStorage(self.path, "1h").read()
+        self.assertAlmostEqual(df["CPU Usage(%)"][0], (10.0 * 1800 + 90.0 * 50) / 1850)
+        self.assertEqual(df["CPU Usage(%) count"][0], 6)
+        # Buckets of samples without intervals keep the plain mean
+        self.write([["2024-10-01 11:00:00", "host1", 10.0, "alice"], ["2024-10-01 11:10:00", "host1", 30.0, "alice"]])
+        self.assertEqual(RollupStorage(self.path, "1h").read()["CPU Usage(%)"][1], 20.0)
+
+
+class TestMigrateUsage(unittest.TestCase):
+    def test_migrate_and_export(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            csv_path = os.path.join(tmpdir, "cpu_usage.csv")
+            columns = CPUMonitor().COLUMNS
+            monitor = CPUMonitor(csv_path)
+            monitor.save_rows([
+                ["2024-10-01 10:00:00", "host1", 10.0, 1.0, 0.5, 0.2, 2048, 1024, 1024, "a", 5.0, "b", 3.0, "c", 1.0, 1800.0],
+                ["2024-10-02 10:00:00", "host2", 20.0, 1.0, 0.5, 0.2, 2048, 1024, 1024, "a", 5.0, "b", 3.0, "c", 1.0, 10.0],
+            ])
+            monitor.close()
+
+            segment_dir = os.path.join(tmpdir, "cpu_usage")
+            self.assertEqual(migrate_usage(csv_path, segment_dir, "cpu"), 2)
+            export_path = os.path.join(tmpdir, "export.csv")
+            export_usage(segment_dir, export_path)
+
+            exported = pd.read_csv(export_path)
+            original = pd.read_csv(csv_path)
+            self.assertEqual(list(exported.columns), columns)
+            pd.testing.assert_frame_equal(exported, original, check_dtype=False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+import os
+import tempfile
+import numpy as np
+import pandas as pd
+from usage_frame import UsageFrame
+
+
+def make_df():
+    # Hosts and times out of order, as several hosts append to one file
+    timestamps = pd.date_range("2024-10-01", periods=6, freq="12h", tz="Asia/Tokyo")
+    rows = []
+    for i, timestamp in enumerate(timestamps):
+        for hostname in ("host2", "host1"):
+            rows.append({"Timestamp": timestamp, "Hostname": hostname, "CPU Usage(%)": float(i)})
+    return pd.DataFrame(rows[::-1])
+
+
+class TestUsageFrame(unittest.TestCase):
+    def test_sorted_by_host_and_time(self):
+        usage = UsageFrame(make_df())
+        self.assertEqual(usage.hostnames, ["host1", "host2"])
+        self.assertEqual(usage.BOUNDS, {"host1": (0, 6), "host2": (6, 12)})
+        for hostname in usage.hostnames:
+            host_df = usage.host(hostname)
+            self.assertTrue((host_df["Hostname"] == hostname).all())
+            self.assertTrue(host_df["Timestamp"].is_monotonic_increasing)
+        self.assertEqual(len(usage.host("unknown")), 0)
+
+    def test_missing_hostnames_are_dropped(self):
+        for categorical in (True, False):
+            df = make_df()
+            df.loc[[0, 5], "Hostname"] = None
+            if categorical:
+                df["Hostname"] = pd.Categorical(df["Hostname"], categories=["host1", "host2"])
+            usage = UsageFrame(df)
+            self.assertEqual(len(usage), 10)
+            for hostname in ("host1", "host2"):
+                self.assertTrue((usage.host(hostname)["Hostname"] == hostname).all())
+            self.assertEqual(sum(len(usage.host(hostname)) for hostname in usage.hostnames), 10)
+
+    def test_past_days_is_a_view(self):
+        usage = UsageFrame(make_df())
+        window = usage.past_days(1)
+        # Last sample is 2024-10-03 12:00, so the window starts at 2024-10-02 00:00
+        self.assertEqual(len(window), 8)
+        self.assertIs(window.DF, usage.DF)
+        host_df = window.host("host1")
+        self.assertEqual(host_df["Timestamp"].min(), pd.Timestamp("2024-10-02", tz="Asia/Tokyo"))
+        self.assertTrue(np.shares_memory(host_df["CPU Usage(%)"].to_numpy(), usage.DF["CPU Usage(%)"].to_numpy()))
+        self.assertEqual(len(usage.past_days(10)), len(usage))
+
+    def test_read_csv(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "cpu_usage.csv")
+            with open(path, "w") as file:
+                file.write("Timestamp,Hostname,CPU Usage(%),Top User\n")
+                file.write("2024-10-01 00:00:00,host1,10.0,alice\n")
+                file.write("2024-10-01 00:05:00,host1,n/a,alice\n")
+                file.write("2024-10-01 00:0\n")
+            usage = UsageFrame.read_csv(path, ["Timestamp", "Hostname", "CPU Usage(%)"])
+        self.assertEqual(list(usage.columns), ["Timestamp", "Hostname", "CPU Usage(%)"])
+        self.assertEqual(len(usage), 2)
+        self.assertEqual(str(usage.DF["Timestamp"].dt.tz), "Asia/Tokyo")
+        self.assertIsInstance(usage.DF["Hostname"].dtype, pd.CategoricalDtype)
+        self.assertEqual(usage.DF["CPU Usage(%)"].dtype, np.float64)
+        self.assertTrue(np.isnan(usage.DF["CPU Usage(%)"].iloc[1]))
+
+    def test_watermark(self):
+        usage = UsageFrame(make_df())
+        first, *hosts = usage.watermark()
+        self.assertEqual(first, "2024-10-01 00:00:00+09:00")
+        self.assertEqual(hosts, [("host1", "2024-10-03 12:00:00+09:00", 6), ("host2", "2024-10-03 12:00:00+09:00", 6)])
+        self.assertNotEqual(usage.past_days(1).watermark(), usage.watermark())
+
+    def test_empty(self):
+        usage = UsageFrame(make_df().iloc[:0])
+        self.assertEqual(len(usage), 0)
+        self.assertEqual(usage.hostnames, [])
+        self.assertEqual(len(usage.past_days(1)), 0)
+        self.assertEqual(usage.watermark(), ())
+
+
+if __name__ == "__main__":
+    unittest.main()
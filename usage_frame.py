@@ -0,0 +1,131 @@
+import numpy as np
+import pandas as pd
+
+from storage import TIMESTAMP_FORMAT, TIMEZONE
+
+# Text columns of the monitors' files; all other columns except Timestamp are numeric
+CATEGORY_COLUMNS = ["Hostname", "Top User", "Second User", "Third User", "Name"]
+
+
+class UsageFrame:
+    """
+    Samples sorted by (Hostname, Timestamp) once, with the row range of each host.
+
+    Host and time-window slicing are binary searches over the sorted
+    timestamps, and a window is a new UsageFrame sharing the same frame with
+    narrower host ranges, so neither copies the data. host() returns a
+    positional slice of the frame.
+    """
+
+    def __init__(self, df: pd.DataFrame, bounds: dict = None, _timestamps: np.ndarray = None):
+        if bounds is None and len(df) == 0:
+            bounds, _timestamps = {}, np.array([], dtype=np.int64)
+        elif bounds is None:
+            df = self._sorted(df)
+            _timestamps = df["Timestamp"].to_numpy(dtype="datetime64[ns]").view(np.int64)
+            codes = df["Hostname"].cat.codes.to_numpy()
+            edges = np.searchsorted(codes, np.arange(len(df["Hostname"].cat.categories) + 1))
+            bounds = {
+                hostname: (int(edges[i]), int(edges[i + 1]))
+                for i, hostname in enumerate(df["Hostname"].cat.categories) if edges[i] < edges[i + 1]
+            }
+        self.DF = df
+        self.BOUNDS = bounds
+        self._timestamps = _timestamps
+
+    @staticmethod
+    def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+        # Rows without a host (e.g. torn rows of segment or rollup reads) would break the host ranges
+        if df["Hostname"].isna().any():
+            df = df[df["Hostname"].notna()]
+        hostname = df["Hostname"]
+        if not isinstance(hostname.dtype, pd.CategoricalDtype) or not hostname.cat.categories.is_monotonic_increasing:
+            hostname = pd.Categorical(hostname.astype("string"))
+            df = df.assign(Hostname=hostname)
+        # Stable, so samples of the same host and time keep their file order
+        return df.sort_values(["Hostname", "Timestamp"], kind="stable", ignore_index=True)
+
+    @classmethod
+    def read_csv(cls, path: str, columns: list = None) -> "UsageFrame":
+        """
+        Read a monitor CSV file with explicit dtypes: category text columns,
+        float64 metrics and Timestamp parsed with the monitors' fixed format
+        in the storage timezone. Unparseable rows (e.g. torn lines) are dropped.
+        """
+        header = pd.read_csv(path, nrows=0).columns
+        usecols = [column for column in header if columns is None or column in columns]
+        dtype = {
+            column: "category" if column in CATEGORY_COLUMNS else ("string" if column == "Timestamp" else np.float64)
+            for column in usecols
+        }
+        try:
+            df = pd.read_csv(path, usecols=usecols, dtype=dtype)
+        except ValueError:
+            # A non-numeric value in a metric column: parse it as text and coerce
+            df = pd.read_csv(path, usecols=usecols, dtype={column: "string" if value is np.float64 else value
+                                                           for column, value in dtype.items()})
+            for column, value in dtype.items():
+                if value is np.float64:
+                    df[column] = pd.to_numeric(df[column], errors="coerce").astype(np.float64)
+        timestamp = pd.to_datetime(df["Timestamp"], format=TIMESTAMP_FORMAT, errors="coerce")
+        df["Timestamp"] = timestamp.dt.tz_localize(TIMEZONE, ambiguous="NaT", nonexistent="shift_forward")
+        df = df.dropna(subset=["Timestamp", "Hostname"])
+        return cls(df)
+
+    def _view(self, bounds: dict) -> "UsageFrame":
+        return UsageFrame(self.DF, bounds, self._timestamps)
+
+    def __len__(self) -> int:
+        return sum(end - start for start, end in self.BOUNDS.values())
+
+    @property
+    def columns(self):
+        return self.DF.columns
+
+    @property
+    def hostnames(self) -> list:
+        return sorted(self.BOUNDS)
+
+    def host(self, hostname) -> pd.DataFrame:
+        """The samples of one host, in time order, as a slice of the frame."""
+        start, end = self.BOUNDS.get(hostname, (0, 0))
+        return self.DF.iloc[start:end]
+
+    def last_timestamp(self) -> pd.Timestamp:
+        if not self.BOUNDS:
+            return None
+        last = max(self._timestamps[end - 1] for _, end in self.BOUNDS.values())
+        return pd.Timestamp(last, tz="UTC").tz_convert(self.DF["Timestamp"].dt.tz)
+
+    def since(self, start: pd.Timestamp) -> "UsageFrame":
+        """The samples at or after `start`."""
+        value = start.value
+        bounds = {}
+        for hostname, (begin, end) in self.BOUNDS.items():
+            begin += int(np.searchsorted(self._timestamps[begin:end], value, side="left"))
+            if begin < end:
+                bounds[hostname] = (begin, end)
+        return self._view(bounds)
+
+    def past_days(self, past_days: int) -> "UsageFrame":
+        """The samples from `past_days` days before the day of the last sample, like get_past_days_usage."""
+        if not self.BOUNDS:
+            return self
+        return self.since(self.last_timestamp().floor("D") - pd.Timedelta(days=past_days))
+
+    def watermark(self) -> tuple:
+        """(first timestamp, ((host, last timestamp, rows), ...)), like ReportCache.watermark."""
+        if not self.BOUNDS:
+            return ()
+        tz = self.DF["Timestamp"].dt.tz
+        first = min(self._timestamps[start] for start, _ in self.BOUNDS.values())
+        return (str(pd.Timestamp(first, tz="UTC").tz_convert(tz)),) + tuple(
+            (str(hostname), str(pd.Timestamp(self._timestamps[end - 1], tz="UTC").tz_convert(tz)), end - start)
+            for hostname, (start, end) in sorted(self.BOUNDS.items())
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """The samples as one frame (a copy unless the view covers the whole frame)."""
+        if len(self) == len(self.DF):
+            return self.DF
+        return pd.concat([self.host(hostname) for hostname in self.hostnames], ignore_index=True)